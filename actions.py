@@ -1,10 +1,21 @@
-
 from cards import Card, BaseCard, OutpostCard
+from choices import CardActionChoice, choose_from_piles
+from events import Event
 import logging
 log = logging.getLogger(__name__)
 
+# the actions of the cards, by id: how to find them again (cards.py fills it).
+# they pickle and copy as a reference to the card's own action, as cards do:
+# the remaining actions of a player are the card's (compact.py)
+CARD_ACTIONS = {}
+
 class Action:
     def exec(self, c: Card, game, p1, p2):
+        # a generator: yields the choices the action needs (see choices.py).
+        # actions without choices only implement do()
+        self.do(c, game, p1, p2)
+        yield from ()
+    def do(self, c: Card, game, p1, p2):
         raise NotImplementedError()
     def __eq__(self, other):
         return other.__class__ == self.__class__ and self.__dict__ == other.__dict__
@@ -15,13 +26,19 @@ class Action:
     def __hash__(self):
         return id(self)
 
+    def __reduce_ex__(self, protocol):
+        ref = CARD_ACTIONS.get(id(self))
+        if ref is None:
+            return super().__reduce_ex__(protocol)
+        return ref
+
 
 class ActionFreeShipCard(Action):
     def __init__(self, on_top=True):
         self.on_top = on_top
 
     def exec(self, c: Card, game: 'Game', p1, p2):
-        pile, cards = p1.choose_from_piles('buy', game.trade_pile, min_n=0, max_n=1, ship_only=True, remove_from_pile=False)
+        pile, cards = yield from choose_from_piles(p1, 'buy', game.trade_pile, min_n=0, max_n=1, ship_only=True, remove_from_pile=False)
         if pile:
             if self.on_top:
                 p1.on_top += 1
@@ -34,7 +51,7 @@ class ActionFreeShipCard(Action):
 
 class ActionScrap(Action):
     def exec(self, c: Card, game, p1, p2):
-        pile, cards = p1.choose_from_piles('scrap', p1.hand, p1.discard_pile)
+        pile, cards = yield from choose_from_piles(p1, 'scrap', p1.hand, p1.discard_pile)
         #if pile is not None:
         #    game.scrap_pile.extend(cards)
     def __str__(self):
@@ -42,7 +59,7 @@ class ActionScrap(Action):
 
 class ActionTradeRowScrap(Action):
     def exec(self, c: Card, game, p1, p2):
-        pile, cards = p1.choose_from_piles('scrap', game.trade_pile, remove_from_pile=False)
+        pile, cards = yield from choose_from_piles(p1, 'scrap', game.trade_pile, remove_from_pile=False)
         if cards:
             #game.scrap_pile.extend(cards)
             for card in cards:
@@ -58,23 +75,26 @@ class ActionTradeRowScrap(Action):
 class SimpleAction(Action):
     def __init__(self, n):
         self.n = n
-    def exec(self, c: Card, game, p1, p2):
-        v = getattr(p1, self.attr)
-        setattr(p1, self.attr, v + self.n)
     def __str__(self):
         return f'{self.attr}:{self.n}'
 
 class ActionDamage(SimpleAction):
     attr = 'damage'
+    def do(self, c: Card, game, p1, p2):
+        p1.damage += self.n
 class ActionTrade(SimpleAction):
     attr = 'trade'
+    def do(self, c: Card, game, p1, p2):
+        p1.trade += self.n
 class ActionHealth(SimpleAction):
     attr = 'health'
+    def do(self, c: Card, game, p1, p2):
+        p1.health += self.n
 
 class ActionAddDiscard(Action):
     def __init__(self, n=1):
         self.n = n
-    def exec(self, c: Card, game, p1: 'Player', p2: 'Player'):
+    def do(self, c: Card, game, p1: 'Player', p2: 'Player'):
         p2.discard += self.n
     def __str__(self):
         return 'Target opponent discards a card'
@@ -89,7 +109,7 @@ class OptionalAction(Action):
     def __init__(self, action):
         self.action = action
     def exec(self, c: Card, game, p1, p2):
-        self.action.exec(c, game, p1, p2)
+        yield from self.action.exec(c, game, p1, p2)
     def __str__(self):
         return 'Optional: ' + str(self.action)
 
@@ -97,8 +117,8 @@ class ChooseAction(Action):
     def __init__(self, *actions):
         self.actions = actions
     def exec(self, c: Card, game, p1, p2):
-        a = p1.choose_card_action(game, p2, self.actions)
-        a.exec(c, game, p1, p2)
+        a = yield CardActionChoice(p1, p2, self.actions)
+        yield from a.exec(c, game, p1, p2)
     def __str__(self):
         return 'choose one of: ' + str(self.actions)
 
@@ -117,7 +137,7 @@ class ActionSelfScrap(OptionalAction):
 
         for a in self.actions:
             try:
-                a.exec(c, game, p1, p2)
+                yield from a.exec(c, game, p1, p2)
             except AttributeError:
                 log.exception('ActionSelfScrap got exception')
     def __str__(self):
@@ -128,13 +148,13 @@ class ActionSelfScrap(OptionalAction):
 class ActionDrawCard(Action):
     def __init__(self, n=1):
         self.n = n
-    def exec(self, c: Card, game, p1, p2):
+    def do(self, c: Card, game, p1, p2):
         p1.draw(self.n)
     def __str__(self):
         return 'Draw card'
 
 class ActionDrawCardXAllies(Action):
-    def exec(self, c: Card, game, p1, p2):
+    def do(self, c: Card, game, p1, p2):
         # fixme: this is wrong - it should be for all PLAYED cards this round, not in play...
         n = sum(1 for ac in p1.in_play if c.is_ally(ac))
         p1.draw(n)
@@ -143,9 +163,12 @@ class ActionDrawCardXAllies(Action):
 
 class ActionDestroyBase(Action):
     def exec(self, c: Card, game, p1, p2):
-        pile, cards = p1.choose_from_piles('destroy', p2.outposts or p2.bases)
+        pile, cards = yield from choose_from_piles(p1, 'destroy', p2.outposts or p2.bases)
         if pile:
             p2.discard_pile.extend(cards)
+            if game.events:
+                for base in cards:
+                    game.events.emit(Event.BASE_DESTROYED, p1, p2, base)
     def __str__(self):
         return 'Destroy target base'
 
@@ -153,7 +176,7 @@ class ActionScarpDrawCard(Action):
     def __init__(self, n):
         self.n = n
     def exec(self, c: Card, game, p1, p2):
-        pile, cards = p1.choose_from_piles('scrap', p1.hand, p1.discard_pile, max_n=self.n)
+        pile, cards = yield from choose_from_piles(p1, 'scrap', p1.hand, p1.discard_pile, max_n=self.n)
         if pile:
             #game.scrap_pile.extend(cards)
             p1.draw(len(cards))
@@ -161,7 +184,7 @@ class ActionScarpDrawCard(Action):
         return f'scrap up to {self.n} cards from discard or hand and draw as many cards'
 
 class ActionOnTop(Action):
-    def exec(self, c: Card, game, p1, p2):
+    def do(self, c: Card, game, p1, p2):
         p1.on_top += 1
     def __str__(self):
         return 'put next ship on top of draw pile'
@@ -170,7 +193,7 @@ class ActionDrawIfBases(Action):
     def __init__(self, bases, draw):
         self.bases = bases
         self.draw = draw
-    def exec(self, c: Card, game, p1, p2):
+    def do(self, c: Card, game, p1, p2):
         if len(p1.outposts) + len(p1.bases) >= self.bases:
             p1.draw(self.draw)
     def __str__(self):
@@ -179,7 +202,7 @@ class ActionDrawIfBases(Action):
 class ActionDrawThenScrap(Action):
     def exec(self, c: Card, game, p1, p2):
         p1.draw(1)
-        pile, cards = p1.choose_from_piles('scrap', p1.hand, min_n=1, max_n=1)
+        pile, cards = yield from choose_from_piles(p1, 'scrap', p1.hand, min_n=1, max_n=1)
         if pile:
             p1.discard_pile.extend(cards)
     def __str__(self):
@@ -189,7 +212,7 @@ class ActionDiscardAndDraw(Action):
     def __init__(self, n):
         self.n = n
     def exec(self, c: Card, game, p1, p2):
-        pile, cards = p1.choose_from_piles('discard_draw', p1.hand, max_n=self.n)
+        pile, cards = yield from choose_from_piles(p1, 'discard_draw', p1.hand, max_n=self.n)
         if pile:
             p1.discard_pile.extend(cards)
             p1.draw(len(cards))
@@ -0,0 +1,545 @@
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import Dict, Sequence
+
+import numpy as np
+
+from cards import CARDS, NUM_CARDS, DEFAULT_PLAYER_DRAW, DEFAULT_TRADE_PILE, EXPLORER, FleetHQ, Faction, \
+    BaseCard, OutpostCard
+from actions import *
+from user_actions import UserActionPlayCard, UserActionBuyCard, UserActionAttackOutpost, \
+    UserActionAttackBase, UserActionCardAction, UserActionAttackFace, UserActionDone, CARD_ACTIONS
+
+# lockstep batched engine: N games held as numpy arrays (card counts per zone,
+# counters per player) and stepped together, every game taking one action per
+# step, by a vectorized equivalent of RandomPlayer.
+#
+#   winners = BatchGame(4096, weights=(WEIGHT_MAP26, WEIGHT_MAP)).run()
+#
+# the rules are the same as engine.Game, card for card, with piles kept as
+# counts: drawing or refilling the trade row picks a random card from the
+# counts, which is the same as popping a shuffled pile. within one card the
+# choice actions (scraps, destroy base, ...) run before the draws, so the
+# order of effects can differ from the card text. outcome statistics match
+# the reference engine (python perf.py batch --check).
+
+# zones, per player (bases and outposts share a zone)
+DRAW, DISCARD, HAND, IN_PLAY, BASES = range(5)
+NUM_ZONES = 5
+# player counters
+TRADE, DAMAGE, HEALTH, DISCARD_N, ON_TOP = range(5)
+NUM_COUNTERS = 5
+# card effects that need no choice: trade, damage, health, draw, opponent
+# discards, on top
+E_TRADE, E_DAMAGE, E_HEALTH, E_DRAW, E_OPP_DISCARD, E_ON_TOP = range(6)
+NUM_EFFECTS = 6
+
+# actions: a kind, and an argument (card id, or index into OPT_ACTIONS)
+PLAY, BUY, ATTACK_OUTPOST, ATTACK_BASE, CARD_ACTION, ATTACK_FACE, DONE = range(7)
+KINDS = [UserActionPlayCard, UserActionBuyCard, UserActionAttackOutpost, UserActionAttackBase,
+         UserActionCardAction, UserActionAttackFace, UserActionDone]
+OPT_ACTIONS = [ua for card_actions in CARD_ACTIONS for ua in card_actions]
+NUM_OPT = len(OPT_ACTIONS)
+
+
+def _counts(cards):
+    v = np.zeros(NUM_CARDS, np.int32)
+    for c in cards:
+        v[c.id] += 1
+    return v
+
+
+COST = np.array([c.cost for c in CARDS])
+DEFENCE = np.array([getattr(c, 'defence', 0) for c in CARDS])
+IS_OUTPOST = np.array([isinstance(c, OutpostCard) for c in CARDS], np.int32)
+IS_BASE = np.array([isinstance(c, BaseCard) for c in CARDS], np.int32)
+IS_SHIP = 1 - IS_OUTPOST - IS_BASE
+FACTIONS = [Faction.BLOB, Faction.TRADE_FEDERATION, Faction.MACHINE_CULT, Faction.STAR_ALLIANCE]
+FACTION = np.array([[bool(c.faction & f) for f in FACTIONS] for c in CARDS], np.int32)
+# ALLY[c, x]: x counts as an ally of c (card.is_ally, unaligned cards included)
+ALLY = np.array([[c.is_ally(x) for x in CARDS] for c in CARDS], np.int32)
+PLAYER_DECK = _counts(DEFAULT_PLAYER_DRAW)
+TRADE_DECK = _counts(DEFAULT_TRADE_PILE)
+
+
+def _effect(a):
+    # effect vector of an action that needs no choice, or None
+    e = np.zeros(NUM_EFFECTS, np.int32)
+    if type(a) is ActionTrade:
+        e[E_TRADE] = a.n
+    elif type(a) is ActionDamage:
+        e[E_DAMAGE] = a.n
+    elif type(a) is ActionHealth:
+        e[E_HEALTH] = a.n
+    elif type(a) is ActionDrawCard:
+        e[E_DRAW] = a.n
+    elif type(a) is ActionAddDiscard:
+        e[E_OPP_DISCARD] = a.n
+    elif type(a) is ActionOnTop:
+        e[E_ON_TOP] = 1
+    else:
+        return None
+    return e
+
+
+# compiled cards, the batched counterpart of cards.CardOps. tables indexed
+# [card, allied]:
+#   EFF      effect vector
+#   SPECIAL  actions run through BatchGame._exec (choices)
+#   OPT      optional card actions made available (index into OPT_ACTIONS)
+# ally actions of a card played without an ally wait in an ally slot:
+#   PENDING_ALLY[card]  ally slots filled when played without an ally
+#   ALLY_SLOT[card]     ally slots resolved by playing card with an ally
+#   SLOT_EFF, SLOT_OPT  what a resolved slot adds
+EFF = np.zeros((NUM_CARDS, 2, NUM_EFFECTS), np.int32)
+SPECIAL = [([], []) for _ in CARDS]
+OPT = np.zeros((NUM_CARDS, 2, NUM_OPT), np.int32)
+SLOTS = [(c, a.action) for c in CARDS for a in c.actions if isinstance(a, AllyAction)]
+NUM_SLOTS = len(SLOTS)
+PENDING_ALLY = np.zeros((NUM_CARDS, NUM_SLOTS), np.int32)
+SLOT_EFF = np.zeros((NUM_SLOTS, NUM_EFFECTS), np.int32)
+SLOT_OPT = np.zeros((NUM_SLOTS, NUM_OPT), np.int32)
+SLOT_SPECIAL = []
+ALLY_SLOT = np.array([[c.faction != Faction.UNALIGNED and c.is_ally(slot_card) for slot_card, _ in SLOTS]
+                      for c in CARDS], np.int32)
+
+
+def _compile():
+    opt_ids = iter(range(NUM_OPT))
+    slot_ids = iter(range(NUM_SLOTS))
+    for c in CARDS:
+        for a in c.actions:
+            if isinstance(a, AllyAction):
+                slot = next(slot_ids)
+                PENDING_ALLY[c.id, slot] = 1
+                inner, e = a.action, _effect(a.action)
+                if isinstance(inner, OptionalAction):
+                    k = next(opt_ids)
+                    OPT[c.id, 1, k] += 1
+                    SLOT_OPT[slot, k] = 1
+                elif e is not None:
+                    EFF[c.id, 1] += e
+                    SLOT_EFF[slot] = e
+                else:
+                    SPECIAL[c.id][1].append(inner)
+                    SLOT_SPECIAL.append((slot, c, inner))
+            elif isinstance(a, OptionalAction):
+                OPT[c.id, :, next(opt_ids)] += 1
+            elif _effect(a) is not None:
+                EFF[c.id, :] += _effect(a)
+            else:
+                SPECIAL[c.id][0].append(a)
+                SPECIAL[c.id][1].append(a)
+
+
+_compile()
+HAS_SPECIAL = np.array([[bool(s) for s in specials] for specials in SPECIAL])
+# bases and outposts are played again at the start of every turn, while in
+# play themselves: an aligned base is always allied then
+ALIGNED = FACTION.any(1).astype(np.int64)
+BASE_EFF = EFF[np.arange(NUM_CARDS), ALIGNED]
+BASE_OPT = OPT[np.arange(NUM_CARDS), ALIGNED]
+BASE_SPECIAL = [(c.id, SPECIAL[c.id][ALIGNED[c.id]]) for c in CARDS
+                if not IS_SHIP[c.id] and SPECIAL[c.id][ALIGNED[c.id]]]
+
+# optional card actions that are only effects, possibly after scrapping the
+# card, or a choice between two effects: one effect vector per choice
+OPT_EFF = np.zeros((NUM_OPT, 2, NUM_EFFECTS), np.int32)
+OPT_SIMPLE = np.zeros(NUM_OPT, bool)
+OPT_SCRAP = np.zeros(NUM_OPT, bool)
+OPT_ZONE = np.array([IN_PLAY if IS_SHIP[ua.card.id] else BASES for ua in OPT_ACTIONS])
+OPT_CARD = np.array([ua.card.id for ua in OPT_ACTIONS])
+
+
+def _compile_opt():
+    for k, ua in enumerate(OPT_ACTIONS):
+        a = ua.action
+        if isinstance(a, ActionSelfScrap):
+            OPT_SCRAP[k] = True
+            effects = [_effect(inner) for inner in a.actions]
+            if all(e is not None for e in effects):
+                OPT_EFF[k] = sum(effects)
+                OPT_SIMPLE[k] = True
+        elif isinstance(a, ChooseAction) and len(a.actions) == 2:
+            effects = [_effect(inner) for inner in a.actions]
+            if all(e is not None for e in effects):
+                OPT_EFF[k] = effects
+                OPT_SIMPLE[k] = True
+
+
+_compile_opt()
+
+
+def _dot(counts, table):
+    # integer matrix product, through float32 blas (exact for card counts)
+    return (counts.astype(np.float32) @ table.astype(np.float32)).astype(np.int32)
+
+
+@lru_cache()
+def _tri(n):
+    # x @ _tri(n) is the running sum of x along the rows (as a matrix product,
+    # much faster than cumsum over short rows)
+    return np.triu(np.ones((n, n), np.float32))
+
+
+class BatchGame:
+    def __init__(self, n: int, weights: Sequence[Dict] = ({}, {}), first=None, seed=None, max_turns=200):
+        """
+        :param n: number of games
+        :param weights: RandomPlayer weights of player 0 and player 1
+        :param first: per game, the player who starts (default player 0)
+        :param max_turns: games still running after this many turns end
+            without a winner
+        """
+        self.n = n
+        self.rng = np.random.default_rng(seed)
+        self.max_turns = max_turns
+        self.weights = np.array([[w.get(kind, 5) for kind in KINDS] for w in weights], np.float64)
+        # results, per game
+        self.winner = np.full(n, -1, np.int64)
+        self.turns = np.zeros(n, np.int64)
+
+        # state of the running games, one row per game. player 0 of the
+        # zones and counters is the player whose turn it is: the two are
+        # swapped at the end of every turn, and finished games are dropped
+        self.game = np.arange(n)
+        self.seat = np.zeros(n, np.int64) if first is None else np.array(first, np.int64)
+        self.zones = np.zeros((n, 2, NUM_ZONES, NUM_CARDS), np.int32)
+        self.zones[:, :, DISCARD] = PLAYER_DECK
+        self.counters = np.zeros((n, 2, NUM_COUNTERS), np.int32)
+        self.counters[:, :, HEALTH] = 50
+        self.deck = np.tile(TRADE_DECK, (n, 1))
+        self.trade_row = np.zeros((n, NUM_CARDS), np.int32)
+        # available optional card actions and waiting ally actions
+        self.pending = np.zeros((n, NUM_OPT), np.int32)
+        self.pending_ally = np.zeros((n, NUM_SLOTS), np.int32)
+        self.turn = np.zeros(n, np.int64)
+        self.need_draw = np.ones(n, bool)
+        self.done = np.zeros(n, bool)
+
+        for _ in range(5):
+            self._refill(self.game)
+
+    STATE = 'game seat zones counters deck trade_row pending pending_ally turn need_draw done'.split()
+
+    def run(self) -> np.ndarray:
+        """play all games to the end; returns the winner of each game (-1: none)"""
+        while len(self.game):
+            self.step()
+        return self.winner
+
+    def step(self):
+        """every running game takes one action"""
+        done = self.done.sum()
+        if done and done * 8 >= len(self.done):
+            keep = ~self.done
+            for name in self.STATE:
+                setattr(self, name, getattr(self, name)[keep])
+        g = np.flatnonzero(~self.done)
+        if not len(g):
+            return
+        start = g[self.need_draw[g]]
+        if len(start):
+            self._turn_start(start)
+        kind, arg = self._choose_action(g)
+        for k, handler in ((PLAY, self._play), (BUY, self._buy), (ATTACK_OUTPOST, self._attack),
+                           (ATTACK_BASE, self._attack), (CARD_ACTION, self._card_action)):
+            sel = kind == k
+            if sel.any():
+                handler(g[sel], arg[sel])
+        sel = kind == ATTACK_FACE
+        if sel.any():
+            self._attack_face(g[sel])
+        sel = kind == DONE
+        if sel.any():
+            self._end_turn(g[sel])
+
+    def _finish(self, g, winner):
+        self.winner[self.game[g]] = winner
+        self.turns[self.game[g]] = self.turn[g]
+        self.done[g] = True
+
+    def _pick(self, weights):
+        # per row, a random column with probability proportional to weights
+        cs = weights.astype(np.float32) @ _tri(weights.shape[1])
+        u = self.rng.random(len(weights)) * cs[:, -1]
+        return (cs > u[:, None]).argmax(1)
+
+    def _choose_action(self, g):
+        # RandomPlayer.choose_action, batched: every legal action has the
+        # weight of its kind, so pick a kind by total weight, then one of the
+        # actions of that kind. (all games running: slices, not copies)
+        rows = slice(None) if len(g) == len(self.done) else g
+        hand = self.zones[rows, 0, HAND]
+        trade = self.counters[rows, 0, TRADE]
+        damage = self.counters[rows, 0, DAMAGE]
+        pending = self.pending[rows]
+        buy = self.trade_row[rows] * (COST <= trade[:, None])
+        buy[:, EXPLORER.id] = trade > 1
+
+        counts = np.zeros((len(g), len(KINDS)))
+        counts[:, PLAY] = hand.sum(1)
+        counts[:, BUY] = buy.sum(1)
+        counts[:, CARD_ACTION] = pending.sum(1)
+        empty_hand = counts[:, PLAY] == 0
+        # attacks, for the games with damage
+        d = np.flatnonzero(damage > 0)
+        opp_bases = self.zones[g[d], 1, BASES]
+        can_attack = DEFENCE <= damage[d, None]
+        outposts = opp_bases * IS_OUTPOST
+        attack_outposts = outposts * can_attack
+        attack = ~outposts.any(1)
+        attack_bases = opp_bases * IS_BASE * can_attack * attack[:, None]
+        counts[d, ATTACK_OUTPOST] = attack_outposts.sum(1)
+        counts[d, ATTACK_BASE] = attack_bases.sum(1)
+        counts[d[attack], ATTACK_FACE] = empty_hand[d[attack]]
+        counts[:, DONE] = empty_hand
+        counts[d[attack], DONE] = 0
+        counts[:, DONE] *= counts[:, ATTACK_OUTPOST] == 0
+        weights = counts * self.weights[self.seat[rows]]
+        zero = weights.sum(1) == 0
+        weights[zero] = counts[zero]
+
+        kind = self._pick(weights)
+        arg = np.zeros(len(g), np.int64)
+        for k, a in ((PLAY, hand), (BUY, buy), (CARD_ACTION, pending)):
+            sel = kind == k
+            if sel.any():
+                arg[sel] = self._pick(a[sel])
+        for k, a in ((ATTACK_OUTPOST, attack_outposts), (ATTACK_BASE, attack_bases)):
+            sel = kind[d] == k
+            if sel.any():
+                arg[d[sel]] = self._pick(a[sel])
+        return kind, arg
+
+    def _turn_start(self, g):
+        self.need_draw[g] = False
+        self._draw(g, np.where(self.turn[g] > 0, 5, 3))
+
+        discard = self.counters[g, 0, DISCARD_N]
+        d = discard > 0
+        if d.any():
+            self._discard(g[d], discard[d])
+
+        bases = self.zones[g, 0, BASES]
+        self.pending[g] += _dot(bases, BASE_OPT)
+        for c, specials in BASE_SPECIAL:
+            for i in range(bases[:, c].max()):
+                for a in specials:
+                    self._exec(a, CARDS[c], g[bases[:, c] > i])
+        self._apply(g, _dot(bases, BASE_EFF))
+
+    def _play(self, g, c):
+        self.zones[g, 0, HAND, c] -= 1
+        presence = _dot(self.zones[g, 0, IN_PLAY] + self.zones[g, 0, BASES], FACTION)
+        allied = (presence * FACTION[c]).any(1)
+        ai = allied.astype(np.int64)
+
+        eff = EFF[c, ai]
+        self.pending[g] += OPT[c, ai]
+        na = ~allied
+        self.pending_ally[g[na]] += PENDING_ALLY[c[na]]
+        if allied.any():
+            # resolve ally actions waiting for this card
+            ga = g[allied]
+            resolved = self.pending_ally[ga] * ALLY_SLOT[c[allied]]
+            self.pending_ally[ga] -= resolved
+            eff[allied] += _dot(resolved, SLOT_EFF)
+            self.pending[ga] += _dot(resolved, SLOT_OPT)
+            for slot, card, a in SLOT_SPECIAL:
+                n = resolved[:, slot]
+                for i in range(n.max()):
+                    self._exec(a, card, ga[n > i])
+
+        special = HAS_SPECIAL[c, ai]
+        if special.any():
+            for cid, al in set(zip(c[special].tolist(), ai[special].tolist())):
+                sel = (c == cid) & (ai == al)
+                for a in SPECIAL[cid][al]:
+                    self._exec(a, CARDS[cid], g[sel])
+        self._apply(g, eff)
+
+        ship = IS_SHIP[c].astype(bool)
+        self.zones[g, 0, np.where(ship, IN_PLAY, BASES), c] += 1
+        # special case for FleetHQ
+        fleet = ship & (self.zones[g, 0, BASES, FleetHQ.id] > 0)
+        self.counters[g[fleet], 0, DAMAGE] += 1
+
+    def _buy(self, g, c, free=False):
+        if not free:
+            self.counters[g, 0, TRADE] -= COST[c]
+        row = c != EXPLORER.id
+        self.trade_row[g[row], c[row]] -= 1
+        self._refill(g[row])
+        top = self.counters[g, 0, ON_TOP] > 0
+        self.counters[g[top], 0, ON_TOP] -= 1
+        self.zones[g, 0, np.where(top, IN_PLAY, DISCARD), c] += 1
+
+    def _attack(self, g, c):
+        self.zones[g, 1, BASES, c] -= 1
+        self.zones[g, 1, DISCARD, c] += 1
+        self.counters[g, 0, DAMAGE] -= DEFENCE[c]
+
+    def _attack_face(self, g):
+        self.counters[g, 1, HEALTH] -= self.counters[g, 0, DAMAGE]
+        self.counters[g, 0, DAMAGE] = 0
+        over = g[self.counters[g, 1, HEALTH] <= 0]
+        self._finish(over, self.seat[over])
+
+    def _card_action(self, g, k):
+        self.pending[g, k] -= 1
+        simple = OPT_SIMPLE[k]
+        if simple.any():
+            gs, ks = g[simple], k[simple]
+            scrap, zone, card = OPT_SCRAP[ks], OPT_ZONE[ks], OPT_CARD[ks]
+            # a card scraps only itself; no card left: nothing happens
+            ok = ~scrap | (self.zones[gs, 0, zone, card] > 0)
+            self.zones[gs, 0, zone, card] -= scrap & ok
+            gs, ks = gs[ok], ks[ok]
+            self._apply(gs, OPT_EFF[ks, self.rng.integers(2, size=len(ks))])
+            g, k = g[~simple], k[~simple]
+        for kk in np.unique(k):
+            ua = OPT_ACTIONS[kk]
+            self._exec(ua.action, ua.card, g[k == kk])
+
+    def _end_turn(self, g):
+        zones = self.zones[g]
+        zones[:, 0, DISCARD] += zones[:, 0, HAND] + zones[:, 0, IN_PLAY]
+        zones[:, 0, HAND] = 0
+        zones[:, 0, IN_PLAY] = 0
+        self.zones[g] = zones[:, ::-1]
+        counters = self.counters[g]
+        counters[:, 0, [TRADE, DAMAGE, DISCARD_N, ON_TOP]] = 0
+        self.counters[g] = counters[:, ::-1]
+        self.pending[g] = 0
+        self.pending_ally[g] = 0
+        self.need_draw[g] = True
+        self.turn[g] += 1
+        self.seat[g] = 1 - self.seat[g]
+        over = g[self.turn[g] >= self.max_turns]
+        self._finish(over, -1)
+
+    def _apply(self, g, eff):
+        self.counters[g, 0, TRADE] += eff[:, E_TRADE]
+        self.counters[g, 0, DAMAGE] += eff[:, E_DAMAGE]
+        self.counters[g, 0, HEALTH] += eff[:, E_HEALTH]
+        self.counters[g, 0, ON_TOP] += eff[:, E_ON_TOP]
+        self.counters[g, 1, DISCARD_N] += eff[:, E_OPP_DISCARD]
+        self._draw(g, eff[:, E_DRAW])
+
+    def _draw(self, g, n):
+        keep = n > 0
+        g, n = g[keep], n[keep]
+        while len(g):
+            empty = self.zones[g, 0, DRAW].sum(1) == 0
+            if empty.any():
+                # shuffle discard into draw
+                ge = g[empty]
+                self.zones[ge, 0, DRAW] += self.zones[ge, 0, DISCARD]
+                self.zones[ge, 0, DISCARD] = 0
+                # insufficient cards
+                keep = self.zones[g, 0, DRAW].sum(1) > 0
+                g, n = g[keep], n[keep]
+            c = self._pick(self.zones[g, 0, DRAW])
+            self.zones[g, 0, DRAW, c] -= 1
+            self.zones[g, 0, HAND, c] += 1
+            n = n - 1
+            keep = n > 0
+            g, n = g[keep], n[keep]
+
+    def _refill(self, g):
+        g = g[self.deck[g].sum(1) > 0]
+        c = self._pick(self.deck[g])
+        self.deck[g, c] -= 1
+        self.trade_row[g, c] += 1
+
+    def _choose(self, piles, min_n, max_n):
+        """
+        RandomPlayer.do_choose_from_piles, batched. piles is (games, piles,
+        cards) counts. returns the games that chose, the pile index and the
+        chosen cards as counts
+        """
+        eligible = piles.sum(2) > np.maximum(1, min_n)[..., None]
+        n = self.rng.integers(min_n, max_n + 1, size=len(piles))
+        sel = np.flatnonzero(eligible.any(1) & (n > 0))
+        which = self._pick(eligible[sel])
+        pile = piles[sel, which]
+        n = np.minimum(n[sel], pile.sum(1))
+        chosen = np.zeros_like(pile)
+        rows = np.arange(len(sel))
+        for i in range(n.max(initial=0)):
+            r = rows[n > i]
+            c = self._pick(pile[r])
+            pile[r, c] -= 1
+            chosen[r, c] += 1
+        return sel, which, chosen
+
+    def _take(self, g, zones, min_n=0, max_n=1):
+        # choose cards from the current player's zones and remove them
+        sel, which, chosen = self._choose(self.zones[g[:, None], 0, zones], min_n, max_n)
+        g = g[sel]
+        self.zones[g, 0, np.array(zones)[which]] -= chosen
+        return g, chosen
+
+    def _discard(self, g, n):
+        g, chosen = self._take(g, [HAND], n, n)
+        self.zones[g, 0, DISCARD] += chosen
+
+    def _exec(self, a, card, g):
+        """Action.exec of a (played from card) for games g"""
+        if not len(g):
+            return
+        e = _effect(a)
+        if e is not None:
+            self._apply(g, np.tile(e, (len(g), 1)))
+        elif isinstance(a, ActionSelfScrap):
+            zone = IN_PLAY if IS_SHIP[card.id] else BASES
+            g = g[self.zones[g, 0, zone, card.id] > 0]
+            self.zones[g, 0, zone, card.id] -= 1
+            for inner in a.actions:
+                self._exec(inner, card, g)
+        elif isinstance(a, OptionalAction):
+            self._exec(a.action, card, g)
+        elif isinstance(a, ChooseAction):
+            pick = self.rng.integers(len(a.actions), size=len(g))
+            for i, inner in enumerate(a.actions):
+                self._exec(inner, card, g[pick == i])
+        elif isinstance(a, ActionScrap):
+            self._take(g, [HAND, DISCARD])
+        elif isinstance(a, ActionScarpDrawCard):
+            g, chosen = self._take(g, [HAND, DISCARD], max_n=a.n)
+            self._draw(g, chosen.sum(1))
+        elif isinstance(a, ActionDrawThenScrap):
+            self._draw(g, np.ones(len(g), np.int32))
+            g, chosen = self._take(g, [HAND], 1, 1)
+            self.zones[g, 0, DISCARD] += chosen
+        elif isinstance(a, ActionDiscardAndDraw):
+            g, chosen = self._take(g, [HAND], max_n=a.n)
+            self.zones[g, 0, DISCARD] += chosen
+            self._draw(g, chosen.sum(1))
+        elif isinstance(a, ActionTradeRowScrap):
+            sel, _, chosen = self._choose(self.trade_row[g][:, None], 0, 1)
+            self.trade_row[g[sel]] -= chosen
+            self._refill(g[sel])
+        elif isinstance(a, ActionFreeShipCard):
+            sel, _, chosen = self._choose((self.trade_row[g] * IS_SHIP)[:, None], 0, 1)
+            g = g[sel]
+            if a.on_top:
+                self.counters[g, 0, ON_TOP] += 1
+            self._buy(g, chosen.argmax(1), free=True)
+        elif isinstance(a, ActionDestroyBase):
+            bases = self.zones[g, 1, BASES]
+            outposts = bases * IS_OUTPOST
+            pile = np.where(outposts.any(1)[:, None], outposts, bases * IS_BASE)
+            sel, _, chosen = self._choose(pile[:, None], 0, 1)
+            g = g[sel]
+            self.zones[g, 1, BASES] -= chosen
+            self.zones[g, 1, DISCARD] += chosen
+        elif isinstance(a, ActionDrawCardXAllies):
+            self._draw(g, self.zones[g, 0, IN_PLAY] @ ALLY[card.id])
+        elif isinstance(a, ActionDrawIfBases):
+            has = self.zones[g, 0, BASES].sum(1) >= a.bases
+            self._draw(g[has], np.full(has.sum(), a.draw))
+        else:
+            raise NotImplementedError(f'batched {a}')
@@ -23,7 +23,10 @@ class CardType(AutoName):
     BASE = auto()
     OUTPOST = auto()
 
-@dataclass(frozen=True)
+# cards are interned: every card in the game is one of the module level
+# instances below (see CARDS), so equality and hashing are by identity and
+# pile scans like hand.remove(card) never call back into python
+@dataclass(frozen=True, eq=False)
 class Card:
     name : str
     #type: CardType
@@ -34,35 +37,21 @@ class Card:
     def is_ally(self, c: Card):
         return bool(self.faction & c.faction)
 
-    def __eq__(self, other):
-        return isinstance(other, Card) and self.name == other.name
-
     def __lt__(self, other):
         return self.name < other.name
 
-    def __hash__(self):
-        return hash(self.name)
+    def __reduce__(self):
+        # keep cards interned across copy/pickle
+        return card_by_name, (self.name,)
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, eq=False)
 class BaseCard(Card):
     defence: int
 
-    def __eq__(self, other):
-        return isinstance(other, Card) and self.name == other.name
-
-    def __hash__(self):
-        return hash(self.name)
-
-@dataclass(frozen=True)
+@dataclass(frozen=True, eq=False)
 class OutpostCard(Card):
     defence: int
 
-    def __eq__(self, other):
-        return isinstance(other, Card) and self.name == other.name
-
-    def __hash__(self):
-        return hash(self.name)
-
 from actions import *
 
 VIPER = Card('Viper', 0, Faction.UNALIGNED, [ActionDamage(1)])
@@ -284,3 +273,78 @@ DEFAULT_TRADE_PILE = []
 for card, n in zip(TRADE_ROW_CARDS[::2], TRADE_ROW_CARDS[1::2]):
     DEFAULT_TRADE_PILE.extend([card] * n)
 
+# card registry: every card gets a small integer id (card.id), used by the
+# compact state encoding and count vectors. the order matches the NN input
+# layout (trade row cards, then the starting/explorer cards)
+CARDS : List[Card] = TRADE_ROW_CARDS[::2] + [VIPER, SCOUT, EXPLORER]
+NUM_CARDS = len(CARDS)
+CARD_BY_NAME = {c.name: c for c in CARDS}
+for card_id, card in enumerate(CARDS):
+    object.__setattr__(card, 'id', card_id)
+
+def card_by_name(name: str) -> Card:
+    return CARD_BY_NAME[name]
+
+
+def card_action(name: str, n: int, ally: bool):
+    a = CARD_BY_NAME[name].actions[n]
+    return a.action if ally else a
+
+for card in CARDS:
+    for n, a in enumerate(card.actions):
+        CARD_ACTIONS.setdefault(id(a), (card_action, (card.name, n, False)))
+        if isinstance(a, AllyAction):
+            CARD_ACTIONS.setdefault(id(a.action), (card_action, (card.name, n, True)))
+
+
+# compiled card definitions: what Game.play does with a card, worked out once.
+# simple trade/damage/health actions become plain deltas, everything else
+# (draws, scraps, choices, ...) is still run through Action.exec.
+@dataclass(frozen=True)
+class CardOps:
+    aligned: bool
+    # (trade, damage, health) added when the card is played; when allied the
+    # card's ally deltas are included
+    deltas: tuple
+    ally_deltas: tuple
+    # actions to exec right away, in card order
+    actions: tuple
+    ally_actions: tuple
+    # (card, action) entries added to the player's remaining actions: the
+    # optional actions, plus the unresolved ally actions if not allied
+    remaining: tuple
+    ally_remaining: tuple
+
+
+SIMPLE_ACTIONS = {ActionTrade: 0, ActionDamage: 1, ActionHealth: 2}
+
+
+def compile_card(card: Card) -> CardOps:
+    deltas, ally_deltas = [0, 0, 0], [0, 0, 0]
+    actions, ally_actions = [], []
+    remaining, ally_remaining = [], []
+    for a in card.actions:
+        if isinstance(a, AllyAction):
+            remaining.append((card, a))
+            inner = a.action
+            if isinstance(inner, OptionalAction):
+                ally_remaining.append((card, inner))
+            elif type(inner) in SIMPLE_ACTIONS:
+                ally_deltas[SIMPLE_ACTIONS[type(inner)]] += inner.n
+            else:
+                ally_actions.append(inner)
+        elif isinstance(a, OptionalAction):
+            remaining.append((card, a))
+            ally_remaining.append((card, a))
+        elif type(a) in SIMPLE_ACTIONS:
+            deltas[SIMPLE_ACTIONS[type(a)]] += a.n
+        else:
+            actions.append(a)
+            ally_actions.append(a)
+    ally_deltas = [d + ad for d, ad in zip(deltas, ally_deltas)]
+    return CardOps(card.faction != Faction.UNALIGNED, tuple(deltas), tuple(ally_deltas),
+                   tuple(actions), tuple(ally_actions), tuple(remaining), tuple(ally_remaining))
+
+
+for card in CARDS:
+    object.__setattr__(card, 'ops', compile_card(card))
@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+from enum import Enum, auto
+from typing import TYPE_CHECKING, List, Tuple
+
+if TYPE_CHECKING:
+    from pile import Pile
+
+# the decisions a game waits on.
+#
+# the engine is written as generators (Game._play, Action.exec, ...) that
+# yield a Choice whenever a player has to decide something, and get the
+# answer sent back. Game.run() answers every choice by asking the player
+# (Choice.ask); Game.step() lets the caller answer them one at a time:
+#
+#   status = game.start()
+#   while status is not Status.GAME_OVER:
+#       status = game.step(pick(game.legal_actions()))
+
+
+class Status(Enum):
+    # what game.step() waits on next; see game.choice
+    CHOOSE_ACTION = auto()
+    CHOOSE_CARD_ACTION = auto()
+    CHOOSE_FROM_PILES = auto()
+    GAME_OVER = auto()
+
+
+class Choice:
+    __slots__ = ()
+    status: Status
+
+    def ask(self, game):
+        """the player's own answer"""
+        raise NotImplementedError()
+
+
+class ActionChoice(Choice):
+    # the next user action; answer: one of options
+    __slots__ = ('player', 'other', 'options')
+    status = Status.CHOOSE_ACTION
+
+    def __init__(self, player, other, options):
+        self.player, self.other, self.options = player, other, options
+
+    def ask(self, game):
+        return self.player.choose_action(game, self.other, self.options)
+
+
+class CardActionChoice(ActionChoice):
+    # one of the actions of a "choose one of" card action; answer: one of options
+    __slots__ = ()
+    status = Status.CHOOSE_CARD_ACTION
+
+    def ask(self, game):
+        return self.player.choose_card_action(game, self.other, self.options)
+
+
+class PileChoice(Choice):
+    # cards from one of the piles in options; answer: (pile, cards) or
+    # (None, None) for none
+    __slots__ = ('player', 'action', 'options', 'min_n', 'max_n')
+    status = Status.CHOOSE_FROM_PILES
+
+    def __init__(self, player, action, options, min_n, max_n):
+        self.player, self.action, self.options, self.min_n, self.max_n = player, action, options, min_n, max_n
+
+    def ask(self, game):
+        return self.player.do_choose_from_piles(self.action, self.options, self.min_n, self.max_n)
+
+
+def choose_from_piles(player, action: str, *piles: Pile, min_n=0, max_n=1, ship_only=False,
+                      remove_from_pile=True) -> Tuple[Pile, List]:
+    # generator: yields the PileChoice, if there is anything to choose from,
+    # and returns the chosen (pile, cards), or (None, None)
+    if ship_only:
+        # imported here, cards imports actions imports this
+        from cards import BaseCard, OutpostCard
+        from pile import Pile
+        filtered_piles = [Pile(p.name, filter(lambda c: not isinstance(c, (BaseCard, OutpostCard)), p)) for p in piles]
+    else:
+        filtered_piles = piles
+
+    filtered_piles = [p for p in filtered_piles if p and len(p) > max(1, min_n)]
+
+    if not filtered_piles:
+        # nothing to choose from, even if min_n > 0
+        return None, None
+
+    pile, cards = yield PileChoice(player, action, filtered_piles, min_n, max_n)
+    actual_pile = None
+    if pile and remove_from_pile:
+        actual_pile = [p for p in piles if p.name == pile.name]
+        assert len(actual_pile) == 1
+        actual_pile = actual_pile[0]
+        for c in cards:
+            actual_pile.remove(c)
+
+    return actual_pile, cards
+
+
+def answer(steps, game=None):
+    """run a generator of the engine to the end, every choice answered by its player"""
+    try:
+        choice = next(steps)
+        while True:
+            choice = steps.send(choice.ask(game))
+    except StopIteration as e:
+        return e.value
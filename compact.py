@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+from array import array
+from typing import List, Tuple
+
+from actions import Action, AllyAction
+from cards import CARDS, Card
+from pile import Pile
+
+# compact game state: the whole position as one flat int16 array of card ids
+# and counters. it is cheap to copy, hash and pickle (e.g. to hand a position
+# to another process) and unpacks into a regular Game that plays exactly the
+# same as the original.
+#
+# layout:
+#   turn, trade_pile, draw_pile, player0, player1
+# where every pile is <len, id, id, ...> and every player is
+#   health, need_draw, trade, discard, on_top, damage,
+#   draw_pile, discard_pile, hand, in_play, bases, outposts,
+#   <len, (card id, action idx, ally) * len>  - remaining actions
+
+PLAYER_COUNTERS = 'health need_draw trade discard on_top damage'.split()
+PLAYER_PILES = 'draw_pile discard_pile hand in_play bases outposts'.split()
+
+
+def _pack_pile(data: array, pile: List[Card]):
+    data.append(len(pile))
+    data.extend([c.id for c in pile])
+
+
+def _unpack_pile(name: str, data: array, pos: int) -> Tuple[Pile, int]:
+    n = data[pos]
+    pos += 1
+    return Pile(name, [CARDS[i] for i in data[pos:pos+n]]), pos + n
+
+
+def pack_remaining_action(c: Card, action: Action) -> Tuple[int, int, int]:
+    # remaining actions are always one of the card's actions, or the action
+    # wrapped by one of its ally actions
+    for n, a in enumerate(c.actions):
+        if a is action:
+            return c.id, n, 0
+        if isinstance(a, AllyAction) and a.action is action:
+            return c.id, n, 1
+    # an equal copy (the actions of pickled games are the card's own, see
+    # actions.CARD_ACTIONS)
+    for n, a in enumerate(c.actions):
+        if a == action:
+            return c.id, n, 0
+        if isinstance(a, AllyAction) and a.action == action:
+            return c.id, n, 1
+    raise ValueError(f'action {action} is not an action of {c.name}')
+
+
+def unpack_remaining_action(card_id: int, n: int, ally: int) -> Tuple[Card, Action]:
+    c = CARDS[card_id]
+    a = c.actions[n]
+    return c, (a.action if ally else a)
+
+
+def pack_player(data: array, p):
+    data.extend([getattr(p, f) for f in PLAYER_COUNTERS])
+    for f in PLAYER_PILES:
+        _pack_pile(data, getattr(p, f))
+    data.append(len(p.remaining_actions))
+    for c, a in p.remaining_actions:
+        data.extend(pack_remaining_action(c, a))
+
+
+def unpack_player(data: array, pos: int, p) -> int:
+    for f in PLAYER_COUNTERS:
+        setattr(p, f, data[pos])
+        pos += 1
+    p.need_draw = bool(p.need_draw)
+    for f in PLAYER_PILES:
+        pile, pos = _unpack_pile(f, data, pos)
+        setattr(p, f, pile)
+    n = data[pos]
+    pos += 1
+    p.remaining_actions = [unpack_remaining_action(*data[i:i+3]) for i in range(pos, pos + 3*n, 3)]
+    return pos + 3*n
+
+
+def pack(game) -> array:
+    data = array('h', [game.turn])
+    _pack_pile(data, game.trade_pile)
+    _pack_pile(data, game.draw_pile)
+    for p in game.players:
+        pack_player(data, p)
+    return data
+
+
+def unpack(data: array, players, **kwargs):
+    """
+    build a Game from a packed state. player state is written into the given
+    player objects, so the position can be played out by any player type.
+    """
+    from engine import Game
+
+    trade_pile, pos = _unpack_pile('trade_pile', data, 1)
+    draw_pile, pos = _unpack_pile('draw_pile', data, pos)
+    for p in players:
+        pos = unpack_player(data, pos, p)
+    # an empty trade row is refilled when the game starts
+    game = Game(players, data[0], trade_pile, draw_pile, **kwargs)
+    return game
@@ -5,107 +5,225 @@ import random
 from itertools import chain
 from typing import List
 
+from choices import Status, ActionChoice, answer, choose_from_piles
 from cards import DEFAULT_TRADE_PILE, AllyAction, \
     Faction, OptionalAction, OutpostCard, BaseCard, EXPLORER, FleetHQ
+from events import Event, Events
+from movegen import legal_actions
 from pile import Pile
 from players.player import Player
 from user_actions import *
 import logging
-logging.basicConfig(level=logging.INFO)
 
 log = logging.getLogger()
 
 ### https://github.com/tonywok/realms/tree/master/lib
 
 
-class GameOver(Exception):
-    def __init__(self, p: Player):
-        self.winner = p
-
-
 class Game:
     def __init__(self, players: List[Player], turn = 0, trade_pile=None, draw_pile=None, verbose=True, seed=None):
         self.turn = turn
         self.players : List[Player] = players
+        # the game's own random stream, shared with its players (see seeds.py).
+        # without a seed it's seeded from the global random module
+        self.random = random.Random(seed if seed is not None else random.getrandbits(64))
+        for p in players:
+            p.random = self.random
+            # a player of an earlier game would still emit its events
+            p.events = None
         if draw_pile is None:
             draw_pile = DEFAULT_TRADE_PILE.copy()
-            random.shuffle(draw_pile)
+            self.random.shuffle(draw_pile)
         self.trade_pile : Pile[Card] = Pile('trade_pile', trade_pile or [])
         self.draw_pile : Pile[Card] = Pile('draw_pile', draw_pile)
         #self.scrap_pile : Pile[Card] = Pile('scrap', [])
 
-        if seed:
-            random.seed(seed)
         self.verbose = verbose
+        # see journal.Journal, zobrist.Zobrist and events.Events
+        self.journal = None
+        self.zobrist = None
+        self.events = None
+        # the running game (see choices.py): the _play() generator, the
+        # choice it waits on and, once over, the winner
+        self._steps = None
+        self.choice = None
+        self.winner = None
+
+    def __getstate__(self):
+        # generators can't be pickled (or copied); the copy starts over at
+        # the current position
+        state = self.__dict__.copy()
+        state['_steps'] = state['choice'] = None
+        return state
 
     def __copy__(self):
-        return Game(self.players, self.turn, self.trade_pile, self.draw_pile, self.verbose)
+        return Game(self.players, self.turn, self.trade_pile, self.draw_pile, self.verbose,
+                    seed=self.random.getrandbits(64))
+
+    def snapshot(self):
+        # immutable copy of the whole game state (including players)
+        return (self.turn, tuple(self.trade_pile), tuple(self.draw_pile),
+                tuple(p.snapshot() for p in self.players))
+
+    def restore(self, s):
+        self.turn, self.trade_pile[:], self.draw_pile[:], players = s
+        for p, p_s in zip(self.players, players):
+            p.restore(p_s)
+        self._steps = self.choice = self.winner = None
+
+    def clone(self, players: List[Player], verbose=False, seed=None):
+        """
+        copy of this game, played by the given players. player state is
+        restored into them from this game's players. without a seed, the
+        clone's random stream is seeded from this game's
+        """
+        if seed is None:
+            seed = self.random.getrandbits(64)
+        g = Game(players, self.turn, self.trade_pile, self.draw_pile, verbose, seed=seed)
+        for p, o_p in zip(players, self.players):
+            p.from_player(o_p)
+        return g
+
+    def on(self, event: Event, listener):
+        if not self.events:
+            self.events = Events(self)
+            for p in self.players:
+                p.events = self.events
+        self.events.on(event, listener)
 
     def __hash__(self):
         v = (self.turn, self.draw_pile, self.trade_pile, self.players[0], self.players[1])
         return hash(v)
 
+    def start(self) -> Status:
+        self._steps = self._play()
+        self.choice = None
+        return self.step(None)
+
+    def step(self, answer) -> Status:
+        """
+        answer the pending choice (game.choice; None to start) and run the
+        game up to the next one
+        """
+        if self._steps is None:
+            if self.winner is not None:
+                return Status.GAME_OVER
+            return self.start()
+        try:
+            self.choice = self._steps.send(answer)
+        except StopIteration:
+            self.choice = None
+            self._steps = None
+            return Status.GAME_OVER
+        return self.choice.status
+
+    def legal_actions(self):
+        # the options of the pending choice; empty once the game is over
+        if self._steps is None and self.winner is None:
+            self.start()
+        return self.choice.options if self.choice else []
+
     def run(self):
+        status = self.step(None) if self._steps is None else self.choice.status
+        while status is not Status.GAME_OVER:
+            status = self.step(self.choice.ask(self))
+        return self.winner
+
+    def _play(self):
         if not self.trade_pile:
             self.trade_pile[:] = [self.draw_pile.pop() for _ in range(min(5, len(self.draw_pile)))]
 
         p1 = self.players[self.turn % 2]
         p2 = self.players[(self.turn+1) % 2]
-        try:
-            while True:
-                self.do_turn(p1, p2)
-                self.turn += 1
-                p1, p2 = p2, p1
-        except GameOver as e:
-            if self.verbose:
-                log.info(f'winner is: {e.winner.name}')
-            p1.won(self, p2)
-            p2.lost(self, p1)
-            return e.winner
+        self.winner = None
+        while True:
+            winner = yield from self._do_turn(p1, p2)
+            if winner:
+                break
+            self.turn += 1
+            p1, p2 = p2, p1
+
+        self.winner = winner
+        if self.verbose:
+            log.info(f'winner is: {winner.name}')
+        if self.events:
+            self.events.emit(Event.GAME_OVER, winner, p2 if winner is p1 else p1)
+        p1.won(self, p2)
+        p2.lost(self, p1)
+        return winner
+
+    # do_turn, do_action, ... run their part of the game to the end, asking
+    # the players; the _ generators yield the choices instead
 
     def do_turn(self, p1: Player, p2: Player):
+        return answer(self._do_turn(p1, p2), self)
+
+    def do_one_user_action(self, p1, p2):
+        return answer(self._do_one_user_action(p1, p2), self)
+
+    def do_action(self, p1: Player, p2: Player, a: UserAction):
+        return answer(self._do_action(p1, p2, a), self)
+
+    def action_play_card(self, p: Player, p2: Player, card: Card):
+        return answer(self._action_play_card(p, p2, card), self)
+
+    def play(self, p1: Player, p2: Player, card: Card):
+        return answer(self._play_card(p1, p2, card), self)
+
+    def _do_turn(self, p1: Player, p2: Player):
+        # returns the winner, if the game is over
         if p1.need_draw:
+            if self.events:
+                self.events.emit(Event.TURN_START, p1)
             p1.draw(5 if self.turn > 0 else 3)
             p1.need_draw = False
 
             if p1.discard:
-                p1.choose_discard(p1.discard)
+                _, cards = yield from choose_from_piles(p1, 'discard', p1.hand, min_n=p1.discard, max_n=p1.discard)
+                if cards:
+                    p1.discard_pile.extend(cards)
 
             for c in p1.outposts:
-                self.play(p1, p2, c)
+                yield from self._play_card(p1, p2, c)
             for c in p1.bases:
-                self.play(p1, p2, c)
+                yield from self._play_card(p1, p2, c)
 
-        while self.do_one_user_action(p1, p2):
+        while (yield from self._do_one_user_action(p1, p2)):
             if p2.health <= 0:
-                raise GameOver(p1)
+                return p1
 
         p1.end_turn()
+        if self.events:
+            self.events.emit(Event.TURN_END, p1)
 
-    def do_one_user_action(self, p1 ,p2):
+    def _do_one_user_action(self, p1 ,p2):
         available_actions = self.available_actions(p1, p2)
         if len(available_actions) > 1:
-            a = p1.choose_action(self, p2, available_actions)
+            a = yield ActionChoice(p1, p2, available_actions)
         else:
             a = available_actions[0]
         if isinstance(a, UserActionPlayAllCards):
             for a_ in a.actions:
-                self.do_action(p1, p2, a_)
+                yield from self._do_action(p1, p2, a_)
         else:
-            return self.do_action(p1, p2, a)
+            return (yield from self._do_action(p1, p2, a))
         return True
 
-    def do_action(self, p1: Player, p2: Player, a: UserAction):
+    def _do_action(self, p1: Player, p2: Player, a: UserAction):
         if self.verbose:
             log.info('turn %s player %s: %s', self.turn, p1.name, a)
+        if self.journal:
+            self.journal.mark()
 
         if isinstance(a, UserActionAttackFace):
             if p2.outposts:
                 raise Exception('user has outposts!' + str(p2.outposts))
+            if self.events:
+                self.events.emit(Event.DAMAGE, p1, p2, p1.damage)
             p2.health -= p1.damage
             p1.damage = 0
         elif isinstance(a, UserActionPlayCard):
-            self.action_play_card(p1, p2, a.card)
+            yield from self._action_play_card(p1, p2, a.card)
         elif isinstance(a, UserActionBuyCard):
             self.action_buy(p1, a.card)
         elif isinstance(a, UserActionCardAction):
@@ -115,17 +233,21 @@ class Game:
             except ValueError:
                 p1.remaining_actions.remove((a.card, OptionalAction(a.action)))
             try:
-                a.action.exec(a.card, self, p1, p2)
-            except:
+                yield from a.action.exec(a.card, self, p1, p2)
+            except Exception:
                 p=1
         elif isinstance(a, UserActionAttackOutpost):
             p2.outposts.remove(a.outpost)
             p2.discard_pile.append(a.outpost)
             p1.damage -= a.outpost.defence
+            if self.events:
+                self.events.emit(Event.BASE_DESTROYED, p1, p2, a.outpost)
         elif isinstance(a, UserActionAttackBase):
             p2.bases.remove(a.base)
             p2.discard_pile.append(a.base)
             p1.damage -= a.base.defence
+            if self.events:
+                self.events.emit(Event.BASE_DESTROYED, p1, p2, a.base)
         elif a == USER_ACTION_DONE:
             return False
         else:
@@ -151,10 +273,14 @@ class Game:
             p.on_top -= 1
         else:
             p.discard_pile.append(card)
+        if self.events:
+            self.events.emit(Event.CARD_BOUGHT, p, card)
 
-    def action_play_card(self, p : Player, p2: Player, card: Card):
+    def _action_play_card(self, p : Player, p2: Player, card: Card):
         p.hand.remove(card)
-        self.play(p, p2 , card)
+        if self.events:
+            self.events.emit(Event.CARD_PLAYED, p, card)
+        yield from self._play_card(p, p2 , card)
         if isinstance(card, BaseCard):
             p.bases.append(card)
         elif isinstance(card, OutpostCard):
@@ -165,59 +291,43 @@ class Game:
             if FleetHQ in p.bases:
                 p.damage += 1
 
-    def play(self, p1 : Player, p2 : Player, card: Card):
-        remaining_actions = [(card, action) for action in card.actions] + p1.remaining_actions
-
-        is_allied = card.faction != Faction.UNALIGNED and any(card.is_ally(c) for c in chain(p1.in_play, p1.bases, p1.outposts))
-
-        new_remaining = []
-        for c, action in remaining_actions:
-            # perform actions
-            if isinstance(action, AllyAction):
-                if is_allied and card.is_ally(c):
+    def _play_card(self, p1 : Player, p2 : Player, card: Card):
+        # see cards.CardOps
+        ops = card.ops
+        is_allied = ops.aligned and any(card.is_ally(c) for c in chain(p1.in_play, p1.bases, p1.outposts))
+        if is_allied:
+            trade, damage, health = ops.ally_deltas
+            actions = ops.ally_actions
+            new_remaining = list(ops.ally_remaining)
+        else:
+            trade, damage, health = ops.deltas
+            actions = ops.actions
+            new_remaining = list(ops.remaining)
+        p1.trade += trade
+        p1.damage += damage
+        p1.health += health
+        for action in actions:
+            yield from action.exec(card, self, p1, p2)
+
+        if not is_allied:
+            new_remaining += p1.remaining_actions
+        else:
+            # resolve ally actions waiting for this card
+            for c, action in p1.remaining_actions:
+                if isinstance(action, AllyAction) and card.is_ally(c):
                     action = action.action
-                else:
-                    new_remaining.append((c, action))
-                    continue
-            if isinstance(action, OptionalAction):
+                    if not isinstance(action, OptionalAction):
+                        yield from action.exec(c, self, p1, p2)
+                        continue
                 new_remaining.append((c, action))
-                continue
-            action.exec(c, self, p1, p2)
         p1.remaining_actions = new_remaining
 
     def available_actions(self, p1: Player, p2: Player):
-        enable_done = True
-        actions = []
-        for c in p1.hand:
-            actions.append(UserActionPlayCard(c))
-            enable_done = False
-        for c in self.trade_pile:
-            if c.cost <= p1.trade:
-                actions.append(UserActionBuyCard(c))
-        if p1.trade > 1:
-            actions.append(UserActionBuyCard(EXPLORER))
-        for c, a in p1.remaining_actions:
-            if isinstance(a, OptionalAction):
-                actions.append(UserActionCardAction(c, a.action))
-        if p1.damage:
-            if p2.outposts:
-                for o in p2.outposts:
-                    if o.defence <= p1.damage:
-                        actions.append(UserActionAttackOutpost(o))
-                        enable_done = False
-            else:
-                enable_done = False
-                for b in p2.bases:
-                    if b.defence <= p1.damage:
-                        actions.append(UserActionAttackBase(b))
-                if not p1.hand:
-                    actions.append(UserActionAttackFace())
-        if enable_done:
-            actions.append(USER_ACTION_DONE)
-        return actions
-
+        return legal_actions(self, p1, p2)
 
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+
     from players.interactive_player import InteractivePlayer
     from players.monte_carlo import MCSimplePlayer
 
@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+from collections import defaultdict
+from enum import Enum, auto
+
+# engine event hooks.
+#
+#   game.on(Event.CARD_BOUGHT, lambda game, player, card: ...)
+#
+# a game (and its players) only get an Events object once a listener is
+# registered; until then every hook in the engine is a single `if` on None,
+# so plain games and search rollouts pay nothing. clones don't inherit
+# listeners.
+#
+# listener arguments, after the game:
+#   TURN_START, TURN_END    player
+#   CARD_PLAYED             player, card
+#   CARD_BOUGHT             player, card
+#   DAMAGE                  player, target player, amount
+#   BASE_DESTROYED          player, target player, base
+#   SHUFFLE                 player (discard pile shuffled into draw pile)
+#   GAME_OVER               winner, loser
+
+
+class Event(Enum):
+    TURN_START = auto()
+    TURN_END = auto()
+    CARD_PLAYED = auto()
+    CARD_BOUGHT = auto()
+    DAMAGE = auto()
+    BASE_DESTROYED = auto()
+    SHUFFLE = auto()
+    GAME_OVER = auto()
+
+
+class Events:
+    def __init__(self, game):
+        self.game = game
+        self._listeners = defaultdict(list)
+
+    def on(self, event: Event, listener):
+        self._listeners[event].append(listener)
+
+    def off(self, event: Event, listener):
+        self._listeners[event].remove(listener)
+
+    def emit(self, event: Event, *args):
+        for listener in self._listeners.get(event, ()):
+            listener(self.game, *args)
+
+
+class Recorder:
+    """listener that records every event, e.g. for replays or game stats"""
+    def __init__(self, game=None):
+        self.events = []
+        if game is not None:
+            self.attach(game)
+
+    def attach(self, game):
+        for event in Event:
+            game.on(event, lambda game, *args, event=event: self.record(event, *args))
+
+    def record(self, event: Event, *args):
+        self.events.append((event, args))
+
+    def of_type(self, event: Event):
+        return [args for e, args in self.events if e == event]
@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+from typing import List
+
+from pile import Pile, ZobristPile
+
+# undo journal for copy-free search: while a game is journaled every pile
+# mutation logs its inverse, and every mark saves the (few) player counters
+# and pending card actions. rewinding to a mark undoes the logged pile
+# mutations in reverse and puts the counters back.
+#
+#   journal = Journal(game)
+#   m = journal.mark()
+#   game.run()  # or any number of actions
+#   journal.rewind(m)
+
+
+class JournaledPile(Pile):
+    # same layout as Pile, so a pile can be switched in and out of journaling
+    # by assigning __class__. _log is set by the journal
+
+    def append(self, c):
+        self._log.append((_pop, (self,)))
+        super().append(c)
+
+    def pop(self, i=-1):
+        c = super().pop(i)
+        self._log.append((_insert, (self, i if i >= 0 else len(self) + 1 + i, c)))
+        return c
+
+    def remove(self, c):
+        i = self.index(c)
+        super().__delitem__(i)
+        self._log.append((_insert, (self, i, c)))
+
+    def insert(self, i, c):
+        self._log.append((_set_contents, (self, tuple(self))))
+        super().insert(i, c)
+
+    def extend(self, cards):
+        self._log.append((_truncate, (self, len(self))))
+        super().extend(cards)
+
+    def clear(self):
+        self._log.append((_set_contents, (self, tuple(self))))
+        super().clear()
+
+    def __setitem__(self, key, value):
+        if isinstance(key, int):
+            self._log.append((_set_item, (self, key, list.__getitem__(self, key))))
+        else:
+            self._log.append((_set_contents, (self, tuple(self))))
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._log.append((_set_contents, (self, tuple(self))))
+        super().__delitem__(key)
+
+
+class JournaledZobristPile(JournaledPile, ZobristPile):
+    # journaling and key upkeep in one call for the common single card moves;
+    # everything else goes through both parents
+    MASK = ZobristPile.MASK
+
+    def append(self, c):
+        self._log.append((_pop, (self,)))
+        self.key = (self.key + self._z[c.id]) & self.MASK
+        list.append(self, c)
+
+    def pop(self, i=-1):
+        c = list.pop(self, i)
+        self._log.append((_insert, (self, i if i >= 0 else len(self) + 1 + i, c)))
+        self.key = (self.key - self._z[c.id]) & self.MASK
+        return c
+
+    def remove(self, c):
+        i = self.index(c)
+        list.__delitem__(self, i)
+        self._log.append((_insert, (self, i, c)))
+        self.key = (self.key - self._z[c.id]) & self.MASK
+
+
+JOURNALED = {Pile: JournaledPile, ZobristPile: JournaledZobristPile}
+UNJOURNALED = {v: k for k, v in JOURNALED.items()}
+
+
+# undo entries work on the raw list: pile keys (if any) are restored from the
+# mark instead
+_pop = list.pop
+_insert = list.insert
+_set_item = list.__setitem__
+
+
+def _set_contents(pile, cards):
+    list.__setitem__(pile, slice(None), cards)
+
+
+def _truncate(pile, n):
+    list.__delitem__(pile, slice(n, None))
+
+
+PLAYER_PILES = 'draw_pile discard_pile hand in_play bases outposts'.split()
+
+
+class Journal:
+    def __init__(self, game, rng_state=False, mark_actions=False):
+        """
+        :param game: game to journal; its piles are switched to journaling
+            until detach() is called
+        :param rng_state: also save the random generator state on every mark,
+            so a rewound game replays the exact same shuffles and choices
+        :param mark_actions: have Game.do_action take a mark before every
+            action, so actions can be unmade one by one with undo()
+        """
+        self.game = game
+        self._rng_state = rng_state
+        self._log = []
+        self._marks = []
+        self._piles : List[Pile] = [game.trade_pile, game.draw_pile]
+        for p in game.players:
+            self._piles.extend(getattr(p, f) for f in PLAYER_PILES)
+        for pile in self._piles:
+            pile.__class__ = JOURNALED[type(pile)]
+            pile._log = self._log
+        if mark_actions:
+            game.journal = self
+
+    def detach(self):
+        for pile in self._piles:
+            pile.__class__ = UNJOURNALED[type(pile)]
+            del pile._log
+        self.game.journal = None
+
+    def mark(self) -> int:
+        """save the current position; returns a mark to rewind to"""
+        game = self.game
+        players = tuple((p.health, p.need_draw, p.trade, p.discard, p.on_top, p.damage, tuple(p.remaining_actions))
+                        for p in game.players)
+        rng = game.random.getstate() if self._rng_state else None
+        keys = tuple(pile.key for pile in self._piles) if game.zobrist else None
+        self._marks.append((len(self._log), game.turn, players, rng, keys))
+        return len(self._marks) - 1
+
+    def rewind(self, mark: int):
+        """undo everything done since mark was taken; later marks are dropped"""
+        log_len, turn, players, rng, keys = self._marks[mark]
+        del self._marks[mark+1:]
+
+        log = self._log
+        for undo, args in reversed(log[log_len:]):
+            undo(*args)
+        del log[log_len:]
+
+        game = self.game
+        game.turn = turn
+        # as Game.restore: the position is played from the start again
+        game._steps = game.choice = game.winner = None
+        for p, counters in zip(game.players, players):
+            p.health, p.need_draw, p.trade, p.discard, p.on_top, p.damage, remaining = counters
+            p.remaining_actions = list(remaining)
+        if rng is not None:
+            game.random.setstate(rng)
+        if keys is not None:
+            for pile, key in zip(self._piles, keys):
+                pile.key = key
+
+    def undo(self):
+        """unmake the last journaled action"""
+        self.rewind(len(self._marks) - 1)
+        self._marks.pop()
@@ -7,6 +7,7 @@ from itertools import combinations
 from operator import itemgetter
 
 from engine import Game
+from seeds import child_seed
 
 def expected(A, B):
     """
@@ -72,10 +73,20 @@ class BaseRunner:
                 scores = [self.results[p1][p2].w_l() if p2!=p1 else ' --- ' for p2 in players]
                 print(fmt.format(p1, *scores))
 
-    def run(self, rounds=400, workers=4):
+    def run(self, rounds=400, workers=4, seed=None, models=()):
+        """
+        :param seed: game k of the schedule is played with
+            seeds.child_seed(seed, k), on whichever worker runs it
+        :param models: names of the nets the players load ('8 7'), loaded
+            by every worker before its games
+        """
+        games = ((p1, p2, child_seed(seed, k)) for k, (p1, p2) in enumerate(self.scheduler(rounds)))
+        initializer = None
+        if models:
+            from players.NN.numpy_net import preload as initializer
         try:
-            with multiprocessing.Pool(workers) as pool:
-                for w,l in pool.imap_unordered(worker, self.scheduler(rounds)):
+            with multiprocessing.Pool(workers, initializer=initializer, initargs=(models,)) as pool:
+                for w,l in pool.imap_unordered(worker, games):
                     self.results[w][l].W += 1
                     self.results[l][w].L += 1
                     print(f'{w}-{l}: {self.results[w][l]}')
@@ -117,13 +128,13 @@ White advantage = 35.15 +/- 4.43
 Draw rate (equal opponents) = 56.83 % +/- 0.94
 '''
 
-def worker(p1_p2):
-    p1, p2 = p1_p2
+def worker(p1_p2_seed):
+    p1, p2, seed = p1_p2_seed
     p1 = PLAYERS_MAP[p1]
     p2 = PLAYERS_MAP[p2]
 
     players = [p1(), p2()]
-    game = Game(players, verbose=False)
+    game = Game(players, verbose=False, seed=seed)
     winner = game.run()
     loser = players[0] if winner == players[1] else players[1]
     return winner.name, loser.name
@@ -150,5 +161,5 @@ if __name__ == '__main__':
         make_player(NNSimplePlayer, '8_7', "8 7"),
     ])
 
-    t.run()
+    t.run(models=["3 8", "6 8", "8 5", "8 7"])
     t.summary()
\ No newline at end of file
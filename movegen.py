@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+from cards import EXPLORER, OptionalAction
+from user_actions import UserActionPlayCard, UserActionBuyCard, UserActionCardAction, UserActionAttackOutpost, \
+    UserActionAttackBase, UserActionAttackFace, USER_ACTION_DONE, PLAY_ACTIONS, BUY_ACTIONS, \
+    ATTACK_OUTPOST_ACTIONS, ATTACK_BASE_ACTIONS, USER_ACTION_ATTACK_FACE
+
+# legal move generation.
+#
+# every action the engine can offer is prebuilt in user_actions: play/buy/
+# attack per card and one per optional card action. legal_actions() only
+# selects from these tables, and gives the same list, in the same order, as
+# all_actions().
+#
+# (keeping each part of the list - hand, trade row, card actions, attacks -
+# cached and rebuilding only the parts whose zones changed was measured slower
+# than this single pass: nearly every action changes the hand or the trade.)
+
+BUY_EXPLORER_ACTION = BUY_ACTIONS[EXPLORER.id]
+
+
+def all_actions(game, p1, p2):
+    """reference move generator: the full action list, built from scratch"""
+    enable_done = True
+    actions = []
+    for c in p1.hand:
+        actions.append(UserActionPlayCard(c))
+        enable_done = False
+    for c in game.trade_pile:
+        if c.cost <= p1.trade:
+            actions.append(UserActionBuyCard(c))
+    if p1.trade > 1:
+        actions.append(UserActionBuyCard(EXPLORER))
+    for c, a in p1.remaining_actions:
+        if isinstance(a, OptionalAction):
+            actions.append(UserActionCardAction(c, a.action))
+    if p1.damage:
+        if p2.outposts:
+            for o in p2.outposts:
+                if o.defence <= p1.damage:
+                    actions.append(UserActionAttackOutpost(o))
+                    enable_done = False
+        else:
+            enable_done = False
+            for b in p2.bases:
+                if b.defence <= p1.damage:
+                    actions.append(UserActionAttackBase(b))
+            if not p1.hand:
+                actions.append(UserActionAttackFace())
+    if enable_done:
+        actions.append(USER_ACTION_DONE)
+    return actions
+
+
+def legal_actions(game, p1, p2):
+    actions = [PLAY_ACTIONS[c.id] for c in p1.hand]
+    enable_done = not actions
+    trade = p1.trade
+    actions += [BUY_ACTIONS[c.id] for c in game.trade_pile if c.cost <= trade]
+    if trade > 1:
+        actions.append(BUY_EXPLORER_ACTION)
+    for c, a in p1.remaining_actions:
+        if isinstance(a, OptionalAction):
+            actions.append(UserActionCardAction(c, a.action))
+    damage = p1.damage
+    if damage:
+        if p2.outposts:
+            for o in p2.outposts:
+                if o.defence <= damage:
+                    actions.append(ATTACK_OUTPOST_ACTIONS[o.id])
+                    enable_done = False
+        else:
+            enable_done = False
+            actions += [ATTACK_BASE_ACTIONS[b.id] for b in p2.bases if b.defence <= damage]
+            if not p1.hand:
+                actions.append(USER_ACTION_ATTACK_FACE)
+    if enable_done:
+        actions.append(USER_ACTION_DONE)
+    return actions
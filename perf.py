@@ -0,0 +1,431 @@
+import random
+import time
+import logging
+
+from engine import Game
+from players.random_player import RandomPlayer, WEIGHT_MAP26
+
+log = logging.getLogger(__file__)
+
+# simulation throughput benchmarks.
+#   python perf.py games -n 500
+#   python perf.py uct -n 3
+#   python perf.py uct -t 0.05 --early-stop
+#   python perf.py uct-scaling -w 1 2 4 8
+#   python perf.py nn-uct -b 1 8 32
+#   python perf.py mc -g 25 50 100
+#   python perf.py rollout -t 10 4
+#   python perf.py nn-eval -b 1 6 32
+#   python perf.py clone
+#   python perf.py hash
+#   python perf.py movegen
+#   python perf.py batch -n 16000 --check 2000
+
+
+def timed(f, *args, **kwargs):
+    t = time.perf_counter()
+    res = f(*args, **kwargs)
+    return res, time.perf_counter() - t
+
+
+def mid_game(seed=1, turns=6):
+    # a position a few turns into a game between random players
+    p1 = RandomPlayer('p1', w=WEIGHT_MAP26)
+    p2 = RandomPlayer('p2', w=WEIGHT_MAP26)
+    g = Game([p1, p2], verbose=False, seed=seed)
+    g.trade_pile[:] = [g.draw_pile.pop() for _ in range(5)]
+    for _ in range(turns):
+        g.do_turn(g.players[g.turn % 2], g.players[(g.turn + 1) % 2])
+        g.turn += 1
+    return g
+
+
+def bench_games(args):
+    random.seed(args.seed)
+
+    def run():
+        for _ in range(args.num):
+            g = Game([RandomPlayer('p1', w=WEIGHT_MAP26), RandomPlayer('p2', w=WEIGHT_MAP26)], verbose=False)
+            g.run()
+
+    _, t = timed(run)
+    print(f'random games: {args.num} in {t:.2f}s, {args.num/t:.1f} games/s')
+
+
+def bench_uct(args):
+    from players.uct_player import UCTPlayer
+    random.seed(args.seed)
+
+    decisions = 0
+    t = 0.0
+    stats = []
+    tt = {}
+    for _ in range(args.num):
+        p1 = UCTPlayer('p1', num_rollouts=None if args.time else args.rollouts, reuse=not args.no_reuse,
+                       batch_size=args.batch, time_budget=args.time, early_stop=args.early_stop)
+        p2 = RandomPlayer('p2', w=WEIGHT_MAP26)
+        g = Game([p1, p2], verbose=False)
+        choose_action = p1.choose_action
+
+        def timed_choose_action(*a):
+            nonlocal decisions, t
+            res, dt = timed(choose_action, *a)
+            decisions += 1
+            t += dt
+            return res
+
+        p1.choose_action = timed_choose_action
+        g.run()
+        stats += p1.search_stats
+        for k, v in p1.transpositions.stats().items():
+            tt[k] = tt.get(k, 0) + v
+    saved = sum(s.saved for s in stats)
+    print(f'uct decisions: {decisions} in {t:.2f}s, {t/decisions*1000:.1f}ms/decision, '
+          f'{sum(s.rollouts for s in stats)/t:.0f} rollouts/s, {sum(s.rollouts for s in stats)/len(stats):.0f} rollouts/decision')
+    if args.early_stop:
+        print(f'stopped early: {sum(s.stopped_early for s in stats)/len(stats):.1%} of decisions')
+    print(f'tree reused: {sum(s.reused for s in stats)/len(stats):.1%} of decisions, '
+          f'{saved/len(stats):.0f} rollouts saved/decision')
+    tree = p1.tree
+    print(f'tree: {max(s.nodes for s in stats)} nodes at most, '
+          f'{tree.nbytes / tree.capacity:.0f} bytes/node')
+    print(f'transpositions: {tt["hits"]} hits, {tt["misses"]} misses, {tt["evictions"]} evictions')
+
+
+def decision_positions(n, seed=1):
+    # a player's first decision of a turn, a few turns into random games
+    from choices import Status
+
+    positions = []
+    for i in range(n):
+        g = mid_game(seed + i, turns=6 + i % 4)
+        status = g.start()
+        while status is not Status.CHOOSE_ACTION:
+            status = g.step(g.choice.ask(g))
+        positions.append(g)
+    return positions
+
+
+def timed_decision(p, g, seed):
+    # p takes the seat of the player to move in position g
+    idx = g.players.index(g.choice.player)
+    players = [RandomPlayer('o1'), RandomPlayer('o2')]
+    players[idx] = p
+    g2 = g.clone(players, seed=seed)
+    return timed(p.choose_action, g2, players[1 - idx], g.choice.options)
+
+
+def bench_nn_uct(args):
+    from players.NN.NNUCTPlayer import NNUCTPlayer
+    from players.NN.utils import Net
+
+    positions = decision_positions(args.num, args.seed)
+    net = Net()
+    for batch_size in args.batch:
+        p = NNUCTPlayer('p', net, num_rollouts=args.rollouts, reuse=False, batch_size=batch_size)
+        t = sum(timed_decision(p, g, args.seed + k)[1] for k, g in enumerate(positions))
+        print(f'batch {batch_size:>3}: {t/len(positions)*1000:8.1f}ms/decision, '
+              f'{len(positions)*args.rollouts/t:.0f} rollouts/s')
+
+
+def bench_uct_scaling(args):
+    from players.uct_player import UCTPlayer
+
+    positions = decision_positions(args.num, args.seed)
+
+    def decide(p, g, k):
+        return timed_decision(p, g, args.seed + k)
+
+    long = UCTPlayer('p', num_rollouts=args.rollouts * args.long, reuse=False)
+    reference = [decide(long, g, k)[0] for k, g in enumerate(positions)]
+    print(f'{len(positions)} positions, reference: one search of {args.rollouts * args.long} rollouts')
+
+    for workers in args.workers:
+        p = UCTPlayer('p', num_rollouts=args.rollouts, reuse=False, workers=workers)
+        # start the pool outside the timing
+        decide(p, positions[0], -1)
+        results = [decide(p, g, k) for k, g in enumerate(positions)]
+        p.close()
+        t = sum(dt for _, dt in results) / len(results)
+        agree = sum(a is ref for (a, _), ref in zip(results, reference)) / len(results)
+        print(f'{workers:>3} workers: {t*1000:8.1f}ms/decision, {agree:.0%} agree with the reference')
+
+
+def bench_rollout(args):
+    from players.rollout import Rollout
+
+    positions = decision_positions(args.num, args.seed)
+
+    def clone_and_run(g):
+        # the old leaf evaluation: new players, a clone, the players' choose_action
+        p1, p2 = RandomPlayer('rr1', w=WEIGHT_MAP26), RandomPlayer('rr2', w=WEIGHT_MAP26)
+        return g.clone([p1, p2]).run() is p1
+
+    def run(f):
+        for _ in range(args.repeat):
+            for g in positions:
+                f(g)
+
+    n = args.repeat * len(positions)
+    _, t = timed(run, clone_and_run)
+    print(f'clone and run:     {n/t:8.0f} rollouts/s')
+    for turns in [None] + args.turns:
+        rollout = Rollout(WEIGHT_MAP26, max_turns=turns)
+        run(lambda g: rollout.play(g, g.players[0]))
+        print(f'rollout, {turns or "all":>3} turns: {rollout.rollouts_per_second:8.0f} rollouts/s')
+
+
+def bench_mc(args):
+    from choices import Status
+    from players.monte_carlo import MCSimplePlayer, play_out, rollout_players
+    from seeds import child_seed
+
+    # buy decisions: the hand is played, and there are a few cards to buy
+    positions = []
+    for g in decision_positions(args.num * 4, args.seed):
+        status = Status.CHOOSE_ACTION
+        while status is not Status.GAME_OVER and not (
+                status is Status.CHOOSE_ACTION and not g.choice.player.hand and len(g.choice.options) > 2):
+            status = g.step(g.choice.ask(g))
+        if status is not Status.GAME_OVER and len(positions) < args.num:
+            positions.append(g)
+
+    def action_values(g, seed):
+        # win ratio of every action, over args.reference games each
+        me, players = rollout_players(g.players.index(g.choice.player))
+        game = g.clone(players)
+        start = game.snapshot()
+        return {a: sum(play_out(game, start, me, a, child_seed(seed, k)) for k in range(args.reference)) / args.reference
+                for a in g.choice.options}
+
+    values = [action_values(g, args.seed + k) for k, g in enumerate(positions)]
+    print(f'{len(positions)} positions, reference: {args.reference} games per action; '
+          f'regret: win ratio lost to the best action')
+
+    for allocation in ['uniform', 'ucb1', 'halving']:
+        for num_games in args.games:
+            p = MCSimplePlayer('p', num_games=num_games, allocation=allocation, workers=args.workers)
+            results = [timed_decision(p, g, args.seed + k) for k, g in enumerate(positions)]
+            p.close()
+            t = sum(dt for _, dt in results) / len(results)
+            regret = sum(max(v.values()) - v[a] for (a, _), v in zip(results, values)) / len(results)
+            print(f'{allocation:>8} {num_games:>4} games: {t*1000:7.1f}ms/decision, regret {regret:.3f}')
+
+
+def bench_clone(args):
+    import copy
+    from players.player import FIELDS
+
+    g = mid_game(args.seed)
+    players = [RandomPlayer('c1'), RandomPlayer('c2')]
+
+    def copy_fields():
+        # what search used to do per rollout
+        for _ in range(args.num):
+            game = copy.copy(g)
+            for o_p, p in zip(g.players, players):
+                for f in FIELDS:
+                    setattr(p, f, copy.copy(getattr(o_p, f)))
+            game.players = players
+
+    def clone():
+        for _ in range(args.num):
+            g.clone(players)
+
+    def restore():
+        game = g.clone(players)
+        s = game.snapshot()
+        for _ in range(args.num):
+            game.restore(s)
+
+    for name, f in (('copy + from_player', copy_fields), ('clone', clone), ('snapshot/restore', restore)):
+        _, t = timed(f)
+        print(f'{name:>20}: {args.num/t:10.0f} clones/s')
+
+
+def bench_hash(args):
+    from zobrist import Zobrist
+
+    g = mid_game(args.seed)
+
+    def full_hash():
+        for _ in range(args.num):
+            hash(g)
+
+    _, t = timed(full_hash)
+    print(f'{"hash(game)":>20}: {args.num/t:10.0f} keys/s')
+
+    z = Zobrist(g)
+
+    def zobrist_key():
+        for _ in range(args.num):
+            z.key()
+
+    _, t = timed(zobrist_key)
+    print(f'{"zobrist key":>20}: {args.num/t:10.0f} keys/s')
+
+
+def bench_movegen(args):
+    from movegen import all_actions, legal_actions
+
+    # positions seen in a few games between random players
+    positions = []
+    random.seed(args.seed)
+    for _ in range(args.num):
+        g = Game([RandomPlayer('p1', w=WEIGHT_MAP26), RandomPlayer('p2', w=WEIGHT_MAP26)], verbose=False)
+        available_actions = g.available_actions
+
+        def record(p1, p2, g=g, available_actions=available_actions):
+            positions.append((g.clone([RandomPlayer('p1'), RandomPlayer('p2')]), g.players.index(p1)))
+            return available_actions(p1, p2)
+
+        g.available_actions = record
+        g.run()
+
+    for name, gen in (('rebuild', all_actions), ('legal_actions', legal_actions)):
+        def run():
+            n = 0
+            for g, i in positions:
+                n += len(gen(g, g.players[i], g.players[1 - i]))
+            return n
+        # best of a few, the machine is noisy
+        n, t = min((timed(run) for _ in range(args.repeat)), key=lambda r: r[1])
+        print(f'{name:>20}: {len(positions)/t:10.0f} calls/s {n/t:10.0f} actions/s')
+
+
+def bench_batch(args):
+    import numpy as np
+    from batch import BatchGame
+
+    weights = (WEIGHT_MAP26, WEIGHT_MAP26)
+    b = BatchGame(args.num, weights=weights, first=np.arange(args.num) % 2, seed=args.seed)
+    winners, t = timed(b.run)
+    print(f'batched random games: {args.num} in {t:.2f}s, {args.num/t:.1f} games/s')
+    print(f'{"batch":>10}: player 0 wins {np.mean(winners == 0):.3f}, mean turns {b.turns.mean():.2f}')
+
+    if args.check:
+        # outcome statistics of the reference engine, same players
+        random.seed(args.seed)
+        wins, turns = [], []
+        for i in range(args.check):
+            players = [RandomPlayer('p0', w=weights[0]), RandomPlayer('p1', w=weights[1])]
+            g = Game(players if i % 2 == 0 else players[::-1], verbose=False)
+            wins.append(g.run() is players[0])
+            turns.append(g.turn)
+        print(f'{"engine":>10}: player 0 wins {np.mean(wins):.3f}, mean turns {np.mean(turns):.2f}')
+
+def bench_nn_eval(args):
+    import subprocess
+    import sys
+    import numpy as np
+    from players.NN.encoder import BOARD_WIDTH
+    from players.NN.numpy_net import NumpyNet, export
+
+    # startup: what a match or web process imports for the NN players, in a
+    # new interpreter
+    for name, code in [('numpy players', 'import players.NN.NNSimple, players.NN.NNUCTPlayer'),
+                       ('torch players', 'import players.NN.NNSimple, players.NN.utils')]:
+        t = time.perf_counter()
+        ok = subprocess.run([sys.executable, '-c', code], capture_output=True).returncode == 0
+        t = time.perf_counter() - t
+        print(f'import {name}: ' + (f'{t*1000:8.0f}ms' if ok else 'not installed'))
+
+    try:
+        import torch
+        from players.NN.utils import Net, torch_forward
+        model = Net().eval()
+        net = export(model)
+    except ImportError:
+        torch_forward = None
+        rnd = np.random.default_rng(args.seed)
+        net = NumpyNet([(rnd.normal(size=(120, BOARD_WIDTH)), rnd.normal(size=120), 'ReLU'),
+                        (rnd.normal(size=(71, 120)), rnd.normal(size=71), 'ReLU'),
+                        (rnd.normal(size=(1, 71)), rnd.normal(size=1), 'Tanh')])
+    for batch in args.batch:
+        rows = np.random.default_rng(batch).integers(0, 5, size=(batch, BOARD_WIDTH)).astype(np.float32)
+        n = max(1, args.num // batch)
+        _, t = timed(lambda: [net.evaluate(rows) for _ in range(n)])
+        line = f'batch {batch:>3}: numpy {t/n*1e6:8.1f}us'
+        if torch_forward:
+            _, t = timed(lambda: [torch_forward(model, rows) for _ in range(n)])
+            line += f', torch {t/n*1e6:8.1f}us'
+        print(line + ' per evaluation')
+
+
+def get_parser():
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description='engine and search benchmarks')
+    parser.add_argument('-s', '--seed', type=int, default=1, help='random seed')
+    subparsers = parser.add_subparsers(help='benchmark')
+
+    games = subparsers.add_parser('games', help='full random games per second')
+    games.add_argument('-n', '--num', type=int, default=500, help='number of games')
+    games.set_defaults(func=bench_games)
+
+    uct = subparsers.add_parser('uct', help='UCTPlayer decision time')
+    uct.add_argument('-n', '--num', type=int, default=3, help='number of games')
+    uct.add_argument('-r', '--rollouts', type=int, default=200, help='rollouts per decision')
+    uct.add_argument('--no-reuse', action='store_true', help='new tree for every decision')
+    uct.add_argument('-b', '--batch', type=int, default=1, help='leaves evaluated at once')
+    uct.add_argument('-t', '--time', type=float, help='seconds per decision, instead of a number of rollouts')
+    uct.add_argument('--early-stop', action='store_true', help='stop when the best action can no longer change')
+    uct.set_defaults(func=bench_uct)
+
+    scaling = subparsers.add_parser('uct-scaling', help='root parallel UCTPlayer: decision time and agreement with a long search')
+    scaling.add_argument('-n', '--num', type=int, default=10, help='number of positions')
+    scaling.add_argument('-r', '--rollouts', type=int, default=800, help='rollouts per decision')
+    scaling.add_argument('--long', type=int, default=4, help='the reference search has this many times the rollouts')
+    scaling.add_argument('-w', '--workers', type=int, nargs='+', default=[1, 2, 4, 8], help='worker processes')
+    scaling.set_defaults(func=bench_uct_scaling)
+
+    nn_uct = subparsers.add_parser('nn-uct', help='NNUCTPlayer rollouts per second, by leaf batch size')
+    nn_uct.add_argument('-n', '--num', type=int, default=10, help='number of positions')
+    nn_uct.add_argument('-r', '--rollouts', type=int, default=800, help='rollouts per decision')
+    nn_uct.add_argument('-b', '--batch', type=int, nargs='+', default=[1, 8, 32], help='leaf batch sizes')
+    nn_uct.set_defaults(func=bench_nn_uct)
+
+    mc = subparsers.add_parser('mc', help='MCSimplePlayer decision quality and time, by game allocation')
+    mc.add_argument('-n', '--num', type=int, default=10, help='number of positions')
+    mc.add_argument('-g', '--games', type=int, nargs='+', default=[25, 50, 100], help='games per decision')
+    mc.add_argument('--reference', type=int, default=200, help='games per action, for the reference values')
+    mc.add_argument('-w', '--workers', type=int, default=1, help='worker processes')
+    mc.set_defaults(func=bench_mc)
+
+    rollout = subparsers.add_parser('rollout', help='leaf evaluation by random playouts, rollouts per second')
+    rollout.add_argument('-n', '--num', type=int, default=50, help='number of positions')
+    rollout.add_argument('-r', '--repeat', type=int, default=10, help='rollouts per position')
+    rollout.add_argument('-t', '--turns', type=int, nargs='*', default=[10, 4], help='also stop the playouts after these many turns')
+    rollout.set_defaults(func=bench_rollout)
+
+    nn_eval = subparsers.add_parser('nn-eval', help='NN players startup and evaluation latency, numpy and torch')
+    nn_eval.add_argument('-n', '--num', type=int, default=20000, help='positions per batch size')
+    nn_eval.add_argument('-b', '--batch', type=int, nargs='+', default=[1, 6, 32], help='positions evaluated at once')
+    nn_eval.set_defaults(func=bench_nn_eval)
+
+    clone = subparsers.add_parser('clone', help='game copies per second')
+    clone.add_argument('-n', '--num', type=int, default=100000, help='number of copies')
+    clone.set_defaults(func=bench_clone)
+
+    hash_p = subparsers.add_parser('hash', help='transposition keys per second')
+    hash_p.add_argument('-n', '--num', type=int, default=100000, help='number of keys')
+    hash_p.set_defaults(func=bench_hash)
+
+    movegen = subparsers.add_parser('movegen', help='legal actions generated per second')
+    movegen.add_argument('-n', '--num', type=int, default=50, help='number of games to take positions from')
+    movegen.add_argument('-r', '--repeat', type=int, default=5, help='repeats')
+    movegen.set_defaults(func=bench_movegen)
+
+    batch = subparsers.add_parser('batch', help='batched random games per second (batch.BatchGame)')
+    batch.add_argument('-n', '--num', type=int, default=16000, help='number of games')
+    batch.add_argument('--check', type=int, default=0, help='also play this many games with the engine, to compare')
+    batch.set_defaults(func=bench_batch)
+
+    return parser
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+
+    parser = get_parser()
+    args = parser.parse_args()
+    args.func(args)
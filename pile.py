@@ -1,3 +1,6 @@
+from cards import NUM_CARDS
+
+
 class Pile(list):
     def __init__(self, name: str, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -11,7 +14,72 @@ class Pile(list):
     def __repr__(self):
         return f'Pile<{self.name}, {super().__repr__()}>'
 
+    def counts(self) -> bytearray:
+        # count vector indexed by card id - a canonical form for the multiset
+        counts = bytearray(NUM_CARDS)
+        for c in self:
+            counts[c.id] += 1
+        return counts
+
     def __hash__(self):
-        return hash(tuple(sorted(self)))
+        return hash(bytes(self.counts()))
+
+    # TODO: add draw and support ontop
+
+
+class ZobristPile(Pile):
+    # a pile that keeps an additive zobrist key of its contents up to date:
+    # key is the sum of _z[card.id] over the cards (mod 2**64), so it only
+    # depends on the multiset of cards. _z is set by zobrist.Zobrist
+    MASK = (1 << 64) - 1
+
+    def _add(self, cards):
+        z = self._z
+        self.key = (self.key + sum(z[c.id] for c in cards)) & self.MASK
+
+    def _sub(self, cards):
+        z = self._z
+        self.key = (self.key - sum(z[c.id] for c in cards)) & self.MASK
+
+    def append(self, c):
+        self.key = (self.key + self._z[c.id]) & self.MASK
+        super().append(c)
+
+    def pop(self, i=-1):
+        c = super().pop(i)
+        self.key = (self.key - self._z[c.id]) & self.MASK
+        return c
+
+    def remove(self, c):
+        super().remove(c)
+        self.key = (self.key - self._z[c.id]) & self.MASK
+
+    def insert(self, i, c):
+        self.key = (self.key + self._z[c.id]) & self.MASK
+        super().insert(i, c)
+
+    def extend(self, cards):
+        cards = list(cards)
+        self._add(cards)
+        super().extend(cards)
+
+    def clear(self):
+        self.key = 0
+        super().clear()
+
+    def __setitem__(self, key, value):
+        if isinstance(key, int):
+            z = self._z
+            self.key = (self.key - z[self[key].id] + z[value.id]) & self.MASK
+        else:
+            value = list(value)
+            self._sub(self[key])
+            self._add(value)
+        super().__setitem__(key, value)
 
-    # TODO: add draw and support ontop
\ No newline at end of file
+    def __delitem__(self, key):
+        if isinstance(key, int):
+            self.key = (self.key - self._z[self[key].id]) & self.MASK
+        else:
+            self._sub(self[key])
+        super().__delitem__(key)
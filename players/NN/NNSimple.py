@@ -1,57 +1,58 @@
-import random
 import logging
 from itertools import chain
 from operator import itemgetter
 
-from players.NN.NNUCTPlayer import to_vec
+from players.NN.cache import eval_cache
+from players.NN.encoder import Encoder
+from players.NN.numpy_net import forward_batch, load_from_name
 from players.simple import SimplePlayer
 
 log = logging.getLogger(__name__)
 
 NO_BUY_RATE = 0.05
 class NNSimplePlayer(SimplePlayer):
-    def __init__(self, name, nn, *args, train=False, eps=0.1, **kwargs):
+    def __init__(self, name, nn, *args, train=False, eps=0.1, cache=True, **kwargs):
+        """
+        :param cache: share the evaluations of nn (cache.eval_cache)
+        """
         super().__init__(name, *args, **kwargs)
         if isinstance(nn, str):
-            from train import load_from_name
+            # exported for numpy if it can be (numpy_net)
             nn = load_from_name(nn)
-            nn.eval()
         self._nn = nn
         self._train = train
         self._eps = eps
+        self._cache = cache
+        self._encoder = Encoder()
         if train:
             self._states = []
 
     def choose_buy_card(self, game, p1, p2, cards):
-        if self._train and self._eps and random.random() < self._eps:
+        if self._train and self._eps and self.random.random() < self._eps:
             # some chance of no buy
-            if random.random() < NO_BUY_RATE:
+            if self.random.random() < NO_BUY_RATE:
                 return None
-            c = random.choice(list(cards))
+            c = self.random.choice(list(cards))
             return c
         else:
-            states = {}
-            Q = []
-            # also score no buy
-            for c in chain([None], cards):
-                if c is not None:
-                    # for now assume to discard... we can handle on top later
-                    p1.discard_pile.append(c)
-                    p1.trade -= c.cost
-                state = to_vec(game, p1, p2)
-                v = self._nn.forward(state).item()
-                Q.append((c,v))
-                states[c] = state
-                if c is not None:
-                    p1.discard_pile.pop()
-                    p1.trade += c.cost
-            c = max(Q, key=itemgetter(1))[0]
-            #log.info('buy scores: %s', [(c.name if c else 'nothing', v) for c,v in Q])
+            # also score no buy, all in one batch
+            cards = list(cards)
+            rows = self._encoder.encode_buys(p1, p2, cards)
+            if self._cache:
+                values = eval_cache(self._nn).lookup(rows, self._forward)
+            else:
+                values = self._forward(rows)
+            Q = list(zip(chain([None], cards), values, rows))
+            c, _, state = max(Q, key=itemgetter(1))
+            #log.info('buy scores: %s', [(c.name if c else 'nothing', v) for c,v,_ in Q])
             #log.info('%s chose %s', self.name, c.name if c else 'nothing')
             if self._train:
-                self._states.append(states[c])
+                self._states.append(state.tolist())
         return c
 
+    def _forward(self, states):
+        return forward_batch(self._nn, states)
+
 if __name__ == '__main__':
     from players.interactive_player import InteractivePlayer
     from engine import Game
@@ -0,0 +1,121 @@
+import sys
+import weakref
+from array import array
+from collections import OrderedDict
+from typing import Callable, List, Sequence
+
+import numpy as np
+
+# values of encoded positions (to_vec), by net. the same positions come back
+# in the rollouts of a search, in the buy candidates of consecutive turns and
+# from game to game in self-play, so every player using a net shares one
+# cache in the process:
+#
+#   cache = eval_cache(net)
+#   values = cache.lookup(states, forward)
+#
+# a cache only holds values of its net's current weights: after the weights
+# change (training, load_state_dict) call invalidate(net)
+
+DEFAULT_SIZE = 1 << 15
+
+# an entry besides its key: the float, the OrderedDict link
+ENTRY_BYTES = sys.getsizeof(0.0) + 100
+
+
+def position_key(state: Sequence[float]) -> bytes:
+    """
+    the key of an encoded position, a list or a float32 row (encoder): every
+    feature is a count or a small integer, exact as float32
+    """
+    if isinstance(state, np.ndarray):
+        return state.tobytes()
+    return array('f', state).tobytes()
+
+
+class EvalCache:
+    def __init__(self, size=DEFAULT_SIZE):
+        """
+        :param size: at most this many positions, the least recently used
+            are dropped
+        """
+        self.size = size
+        self.version = 0
+        self._values = OrderedDict()
+        self._key_bytes = 0
+        self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len(self._values)
+
+    @property
+    def hit_rate(self):
+        n = self.hits + self.misses
+        return self.hits / n if n else 0.0
+
+    @property
+    def nbytes(self):
+        # approximate
+        return self._key_bytes + len(self._values) * ENTRY_BYTES
+
+    def get(self, key: bytes):
+        values = self._values
+        v = values.get(key)
+        if v is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            values.move_to_end(key)
+        return v
+
+    def put(self, key: bytes, value: float):
+        values = self._values
+        if key not in values:
+            self._key_bytes += sys.getsizeof(key)
+            if len(values) >= self.size:
+                old, _ = values.popitem(last=False)
+                self._key_bytes -= sys.getsizeof(old)
+                self.evictions += 1
+        values[key] = value
+
+    def lookup(self, states: List[Sequence[float]], evaluate: Callable[[List], List[float]]) -> List[float]:
+        """
+        the values of states. evaluate(states) is called once, with the
+        states that aren't in the cache
+        """
+        keys = [position_key(s) for s in states]
+        values = [self.get(k) for k in keys]
+        missing = [i for i, v in enumerate(values) if v is None]
+        if missing:
+            new = evaluate([states[i] for i in missing])
+            for i, v in zip(missing, new):
+                values[i] = v
+                self.put(keys[i], v)
+        return values
+
+    def clear(self):
+        self._values.clear()
+        self._key_bytes = 0
+
+    def stats(self):
+        return dict(size=self.size, used=len(self), version=self.version, hits=self.hits, misses=self.misses,
+                    hit_rate=self.hit_rate, evictions=self.evictions, nbytes=self.nbytes)
+
+
+_caches = weakref.WeakKeyDictionary()
+
+
+def eval_cache(net, size=DEFAULT_SIZE) -> EvalCache:
+    """the cache of net in this process; size is used when it's made"""
+    cache = _caches.get(net)
+    if cache is None:
+        cache = _caches[net] = EvalCache(size)
+    return cache
+
+
+def invalidate(net):
+    # the weights of net changed
+    cache = _caches.get(net)
+    if cache is not None:
+        cache.clear()
+        cache.version += 1
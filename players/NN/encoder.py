@@ -0,0 +1,123 @@
+from itertools import chain
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+from cards import CARDS, NUM_CARDS, BaseCard, OutpostCard
+
+# the features of to_vec (NNUCTPlayer), as float32 numpy rows that go to
+# torch without a copy (torch.from_numpy). per player:
+#  - the count of every card the player has, in any zone (CARD_SLOTS, one
+#    more than there are cards: the last one is always 0)
+#  - the count of every base and outpost in play (NUM_BASES)
+#  - health, damage, discard, trade
+# the card counts don't change when cards move between the player's own
+# zones, only when a card is bought, scrapped, or a base is destroyed:
+# these are the deltas add_card() applies to a row in place, without the
+# player. card ids (Card.id) are the positions of to_vec
+#
+#   encoder = Encoder()
+#   rows = encoder.encode_batch([(p1, p2), (p2, p1)])
+#   rows = encoder.encode_buys(p1, p2, cards)
+
+CARD_SLOTS = NUM_CARDS + 1
+BASES_AT = CARD_SLOTS
+BASE_SLOTS = [c.id for c in CARDS if isinstance(c, (BaseCard, OutpostCard))]
+NUM_BASES = len(BASE_SLOTS)
+HEALTH, DAMAGE, DISCARD, TRADE = range(BASES_AT + NUM_BASES, BASES_AT + NUM_BASES + 4)
+PLAYER_WIDTH = TRADE + 1
+BOARD_WIDTH = 2 * PLAYER_WIDTH
+COUNTERS = np.r_[HEALTH:PLAYER_WIDTH, PLAYER_WIDTH + HEALTH:BOARD_WIDTH]
+
+# card id -> its base slot in the row
+BASE_POS = [-1] * NUM_CARDS
+for n, i in enumerate(BASE_SLOTS):
+    BASE_POS[i] = BASES_AT + n
+del n, i
+
+
+def _count(p, counts: bytearray, at):
+    # the cards of p, and its bases and outposts in play
+    for c in chain(p.draw_pile, p.discard_pile, p.hand, p.in_play):
+        counts[c.id + at] += 1
+    for c in chain(p.outposts, p.bases):
+        counts[c.id + at] += 1
+        counts[BASE_POS[c.id] + at] += 1
+
+
+def encode_player(p, row: np.ndarray):
+    """writes the PLAYER_WIDTH features of p to row"""
+    counts = bytearray(HEALTH)
+    _count(p, counts, 0)
+    row[:HEALTH] = np.frombuffer(counts, np.uint8)
+    row[HEALTH:] = (p.health, p.damage, p.discard, p.trade)
+
+
+def encode(p1, p2, out: np.ndarray = None) -> np.ndarray:
+    """the position for p1 (to_vec), in out if given"""
+    if out is None:
+        out = np.empty(BOARD_WIDTH, np.float32)
+    # the counts of both players are < 256: bytes, with one conversion to
+    # float32, then the counters over them
+    counts = bytearray(BOARD_WIDTH)
+    _count(p1, counts, 0)
+    _count(p2, counts, PLAYER_WIDTH)
+    out[:] = np.frombuffer(counts, np.uint8)
+    out[COUNTERS] = (p1.health, p1.damage, p1.discard, p1.trade, p2.health, p2.damage, p2.discard, p2.trade)
+    return out
+
+
+def add_card(row: np.ndarray, c, n=1, in_play=False, player=0):
+    """
+    the delta of player (0: p1, 1: p2) getting n of card c (n < 0: losing
+    them), in play if it's a base or an outpost
+    """
+    at = player * PLAYER_WIDTH
+    row[at + c.id] += n
+    if in_play:
+        row[at + BASE_POS[c.id]] += n
+
+
+class Encoder:
+    def __init__(self, capacity=32):
+        """
+        :param capacity: rows, the buffer grows when a batch needs more
+        """
+        self.buffer = np.zeros((capacity, BOARD_WIDTH), np.float32)
+
+    def rows(self, n) -> np.ndarray:
+        # the first n rows of the buffer, contiguous; the buffer is reused by
+        # the next call
+        if n > len(self.buffer):
+            self.buffer = np.zeros((max(n, 2 * len(self.buffer)), BOARD_WIDTH), np.float32)
+        return self.buffer[:n]
+
+    def encode(self, p1, p2) -> np.ndarray:
+        return encode(p1, p2, self.rows(1)[0])
+
+    def encode_batch(self, positions: Sequence[Tuple]) -> np.ndarray:
+        """the positions, (p1, p2) pairs, as one matrix"""
+        rows = self.rows(len(positions))
+        for row, (p1, p2) in zip(rows, positions):
+            encode(p1, p2, row)
+        return rows
+
+    def encode_buys(self, p1, p2, cards: Sequence) -> np.ndarray:
+        """
+        the positions after p1 buys nothing (the first row) or one of cards,
+        to its discard pile: the position, and a delta per card
+        """
+        rows = self.rows(1 + len(cards))
+        encode(p1, p2, rows[0])
+        rows[1:] = rows[0]
+        for row, c in zip(rows[1:], cards):
+            row[c.id] += 1
+            row[TRADE] -= c.cost
+        return rows
+
+    def stack(self, states: List[np.ndarray]) -> np.ndarray:
+        """encoded rows (encode) as one matrix"""
+        rows = self.rows(len(states))
+        for row, s in zip(rows, states):
+            row[:] = s
+        return rows
@@ -0,0 +1,77 @@
+import logging
+import os
+from collections import OrderedDict
+from typing import Callable
+
+log = logging.getLogger(__name__)
+
+# trained nets by file, loaded once per process: match.worker makes new NN
+# players for every game, web games too, and they name their net
+# (numpy_net.load_from_name). the nets are shared by every player of the
+# process, so they're in eval mode and read only. a file written again (a
+# new mtime) is loaded again.
+#
+#   net = load_model('run_8/model_00007.npz', NumpyNet.load)
+
+DEFAULT_SIZE = 8
+
+
+def freeze(model):
+    if hasattr(model, 'freeze'):
+        # numpy_net.NumpyNet
+        model.freeze()
+    else:
+        # torch
+        model.eval()
+        for p in model.parameters():
+            p.requires_grad_(False)
+
+
+class ModelCache:
+    def __init__(self, size=DEFAULT_SIZE):
+        """
+        :param size: at most this many models, the least recently used are
+            dropped
+        """
+        self.size = size
+        self._models = OrderedDict()
+        self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self._models)
+
+    def get(self, fname, load: Callable):
+        """the model in fname, load(fname) if it isn't loaded yet"""
+        path = os.path.abspath(fname)
+        key = (path, os.stat(path).st_mtime_ns)
+        models = self._models
+        model = models.get(key)
+        if model is not None:
+            self.hits += 1
+            models.move_to_end(key)
+            return model
+
+        self.misses += 1
+        for k in [k for k in models if k[0] == path]:
+            # an older version
+            del models[k]
+        model = load(fname)
+        freeze(model)
+        models[key] = model
+        if len(models) > self.size:
+            models.popitem(last=False)
+        log.info('model loaded: %s', fname)
+        return model
+
+    def clear(self):
+        self._models.clear()
+
+    def stats(self):
+        return dict(size=self.size, used=len(self), hits=self.hits, misses=self.misses)
+
+
+models = ModelCache()
+
+
+def load_model(fname, load: Callable):
+    return models.get(fname, load)
@@ -0,0 +1,152 @@
+import logging
+import os
+from typing import List, Optional
+
+import numpy as np
+
+from players.NN.models import load_model
+
+log = logging.getLogger(__name__)
+
+# the NN players' nets (utils.Net, train.LinearNet) evaluated with numpy
+# only: processes that just play (match, bench, web) don't need torch,
+# which takes seconds and hundreds of MB to import. the weights of a trained
+# net are exported once (export, NumpyNet.save; train.save_model writes them
+# next to the model) and load_from_name picks them up, once per process:
+#
+#   net = export(model)
+#   net.save('run_8/model_00007.npz')
+#   nn = load_from_name('8 7')
+#
+# batch norm (eval mode) is folded into the linear layer before it.
+
+ACTIVATIONS = {
+    '': None,
+    'ReLU': lambda x: np.maximum(x, 0, out=x),
+    'Tanh': lambda x: np.tanh(x, out=x),
+    'Sigmoid': lambda x: np.divide(1, 1 + np.exp(-x), out=x),
+    'LeakyReLU': lambda x: np.maximum(x, 0.01 * x, out=x),
+}
+
+
+class NumpyNet:
+    def __init__(self, layers):
+        """
+        :param layers: (weight, bias, activation) of every linear layer,
+            weight as in torch (out x in), activation a name of ACTIVATIONS
+        """
+        self.layers = [(np.ascontiguousarray(np.asarray(w, np.float32).T), np.asarray(b, np.float32), a)
+                       for w, b, a in layers]
+        self._f = [(w, b, ACTIVATIONS[a]) for w, b, a in self.layers]
+
+    @property
+    def nbytes(self):
+        return sum(w.nbytes + b.nbytes for w, b, _ in self.layers)
+
+    def forward(self, x) -> np.ndarray:
+        """values of encoded positions, a row or a matrix of them, n x 1"""
+        x = np.asarray(x, np.float32)
+        if x.ndim == 1:
+            x = x[None]
+        for w, b, f in self._f:
+            x = x @ w
+            x += b
+            if f is not None:
+                f(x)
+        return x
+
+    def evaluate(self, rows) -> List[float]:
+        return self.forward(rows)[:, 0].tolist()
+
+    def freeze(self):
+        # shared (models.load_model): read only
+        for w, b, _ in self.layers:
+            w.flags.writeable = b.flags.writeable = False
+
+    def save(self, fname):
+        data = {}
+        for n, (w, b, a) in enumerate(self.layers):
+            data[f'w{n}'], data[f'b{n}'] = w.T, b
+        data['activations'] = np.array([a for _, _, a in self.layers])
+        # np.savez adds .npz to other names
+        with open(fname, 'wb') as f:
+            np.savez(f, **data)
+
+    @classmethod
+    def load(cls, fname) -> 'NumpyNet':
+        with np.load(fname) as data:
+            return cls([(data[f'w{n}'], data[f'b{n}'], str(a)) for n, a in enumerate(data['activations'])])
+
+
+def _array(t) -> np.ndarray:
+    # a torch tensor (parameter, buffer)
+    if hasattr(t, 'detach'):
+        t = t.detach().cpu().numpy()
+    return np.asarray(t, np.float64)
+
+
+def export(model) -> NumpyNet:
+    """
+    a NumpyNet with the weights of model, a torch module: utils.Net, or a
+    sequence of layers (train.LinearNet.layers, utils.contruct_model) of
+    Linear, BatchNorm1d and ACTIVATIONS. model should be in eval mode
+    """
+    if hasattr(model, 'fc1'):
+        # utils.Net, the activations are in forward()
+        modules = [model.fc1, 'ReLU', model.fc2, 'ReLU', model.fc3, 'Tanh']
+    else:
+        modules = list(getattr(model, 'layers', model))
+
+    layers = []
+    for m in modules:
+        kind = m if isinstance(m, str) else type(m).__name__
+        if kind == 'Linear':
+            layers.append([_array(m.weight), _array(m.bias), ''])
+        elif kind == 'BatchNorm1d':
+            w, b, a = layers[-1]
+            assert not a, 'batch norm after an activation'
+            scale = _array(m.weight) / np.sqrt(_array(m.running_var) + m.eps)
+            layers[-1] = [w * scale[:, None], (b - _array(m.running_mean)) * scale + _array(m.bias), a]
+        elif kind in ACTIVATIONS and kind:
+            assert layers and not layers[-1][2], 'activation without a linear layer'
+            layers[-1][2] = kind
+        else:
+            raise ValueError(f'no numpy version of {kind}')
+    return NumpyNet(layers)
+
+
+def forward_batch(nn, states) -> List[float]:
+    """
+    values of encoded positions (a matrix, or a list of rows). nets with
+    evaluate() (NumpyNet, server.InferenceClient) take them as they are,
+    torch nets go through torch
+    """
+    if hasattr(nn, 'evaluate'):
+        return nn.evaluate(states)
+    from players.NN.utils import torch_forward
+    return torch_forward(nn, states)
+
+
+def npz_name(fname) -> str:
+    return os.path.splitext(fname)[0] + '.npz'
+
+
+def load_from_name(name, numpy: Optional[bool] = None):
+    """
+    a net by run and id ('8 7', as train.load_from_name): the exported
+    NumpyNet, unless numpy is False; with numpy None the torch model when it
+    wasn't exported. nets are loaded once per process (models.load_model)
+    """
+    run, netid = name.split()
+    fname = 'run_{}/model_{:05}.npz'.format(run, int(netid))
+    if numpy or (numpy is None and os.path.exists(fname)):
+        return load_model(fname, NumpyNet.load)
+    from train import load_from_name
+    return load_from_name(name)
+
+
+def preload(names):
+    # a pool initializer (match.BaseRunner.run): the nets are loaded before
+    # the games
+    for name in names:
+        load_from_name(name)
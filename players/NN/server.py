@@ -0,0 +1,129 @@
+import logging
+import multiprocessing
+import queue
+import time
+from typing import List
+
+import numpy as np
+
+from players.NN.encoder import BOARD_WIDTH
+from players.NN.numpy_net import forward_batch
+
+log = logging.getLogger(__name__)
+
+# one process owns the net and evaluates the positions of many game
+# processes (train.game_gen_worker) in batches: the workers don't load the
+# net, and the forward passes are over many positions at once.
+#
+# every client has a slot of rows in shared memory: it writes its encoded
+# positions there and puts (slot, n) on the request queue. the server takes
+# requests until it has max_batch rows, every client is waiting, or max_wait
+# has passed since the first; it evaluates them in one pass, writes the
+# values back to the slots and answers on each client's queue.
+#
+#   server = InferenceServer(load_net, (dname, fname), clients=4)
+#   pool = Pool(4, initializer=init, initargs=(server.handle,))
+#   # in the workers: nn = InferenceClient(handle), a net for the NN players
+#   stats = server.close()
+
+
+def _serve(load, args, handle, max_batch, max_wait, stats):
+    inputs, outputs, requests, replies, _, rows = handle
+    inputs = np.frombuffer(inputs, np.float32).reshape(len(replies), rows, BOARD_WIDTH)
+    outputs = np.frombuffer(outputs, np.float32).reshape(len(replies), rows)
+    net = load(*args)
+    if hasattr(net, 'eval'):
+        net.eval()
+
+    batches = positions = 0
+    busy = 0.0
+    stop = False
+    while not stop:
+        r = requests.get()
+        if r is None:
+            break
+        pending = [r]
+        n = r[1]
+        deadline = time.perf_counter() + max_wait
+        # a client waits for its answer: no more requests once all have one
+        while n < max_batch and len(pending) < len(replies):
+            timeout = deadline - time.perf_counter()
+            try:
+                r = requests.get(timeout=timeout) if timeout > 0 else requests.get_nowait()
+            except queue.Empty:
+                break
+            if r is None:
+                stop = True
+                break
+            pending.append(r)
+            n += r[1]
+
+        t = time.perf_counter()
+        values = forward_batch(net, np.concatenate([inputs[slot, :k] for slot, k in pending]))
+        i = 0
+        for slot, k in pending:
+            outputs[slot, :k] = values[i:i + k]
+            i += k
+            replies[slot].put(k)
+        busy += time.perf_counter() - t
+        batches += 1
+        positions += n
+    stats.put(dict(batches=batches, positions=positions, batch_size=positions / max(batches, 1), busy=busy))
+
+
+class InferenceServer:
+    def __init__(self, load, args=(), clients=4, max_batch=256, max_wait=0.001, rows=64):
+        """
+        :param load: load(*args) makes the net, in the server process
+        :param clients: processes that can use the server at once
+        :param max_batch: evaluate at most about this many positions at once
+        :param max_wait: seconds to wait for more positions after the first
+            of a batch; 0 evaluates what has come in
+        :param rows: positions a client sends at once (larger evaluations are
+            split)
+        """
+        ctx = multiprocessing.get_context()
+        inputs = ctx.RawArray('f', clients * rows * BOARD_WIDTH)
+        outputs = ctx.RawArray('f', clients * rows)
+        replies = [ctx.Queue() for _ in range(clients)]
+        free = ctx.Queue()
+        for i in range(clients):
+            free.put(i)
+        # what the clients need; passed to the processes when they start
+        # (Pool initargs), the queues can't be pickled later
+        self.handle = (inputs, outputs, ctx.Queue(), replies, free, rows)
+        self._stats = ctx.Queue()
+        self._process = ctx.Process(target=_serve, args=(load, args, self.handle, max_batch, max_wait, self._stats),
+                                    daemon=True)
+        self._process.start()
+
+    def close(self) -> dict:
+        """stops the server; its batches, positions, mean batch_size and busy seconds"""
+        self.handle[2].put(None)
+        stats = self._stats.get()
+        self._process.join()
+        log.info('inference server: %s', stats)
+        return stats
+
+
+class InferenceClient:
+    def __init__(self, handle):
+        """takes a free slot of the server, for this process"""
+        inputs, outputs, self._requests, replies, free, self._rows = handle
+        self._slot = free.get()
+        self._reply = replies[self._slot]
+        n, rows = len(replies), self._rows
+        self._inputs = np.frombuffer(inputs, np.float32).reshape(n, rows, BOARD_WIDTH)[self._slot]
+        self._outputs = np.frombuffer(outputs, np.float32).reshape(n, rows)[self._slot]
+
+    def evaluate(self, states) -> List[float]:
+        """the values of encoded positions (encoder rows)"""
+        values = []
+        for i in range(0, len(states), self._rows):
+            chunk = states[i:i + self._rows]
+            k = len(chunk)
+            self._inputs[:k] = chunk
+            self._requests.put((self._slot, k))
+            self._reply.get()
+            values.extend(self._outputs[:k].tolist())
+        return values
@@ -3,11 +3,51 @@ import json
 import re
 import logging
 
+import numpy as np
 import torch
+import torch.nn as nn
+import torch.nn.functional as F
 from torch.utils.data import Dataset
 
+from players.NN.encoder import BOARD_WIDTH
+
 log = logging.getLogger(__name__)
 
+class Net(nn.Module):
+
+    def __init__(self):
+        super(Net, self).__init__()
+        # 1 input vector
+        # kernel
+        self.fc1 = nn.Linear(BOARD_WIDTH, 120)
+        self.fc2 = nn.Linear(120, 71)
+        self.fc3 = nn.Linear(71, 1)
+
+    def forward(self, x):
+        x = as_tensor(x)
+
+        x = F.relu(self.fc1(x))
+        x = F.relu(self.fc2(x))
+        x = self.fc3(x).tanh()
+        return x
+
+def as_tensor(x):
+    # encoded positions: a list, or numpy rows (encoder), which torch shares
+    if type(x) == list:
+        x = torch.tensor(x)
+    elif isinstance(x, np.ndarray):
+        x = torch.from_numpy(x)
+    if x.dim() == 1:
+        x = x.unsqueeze(0)
+    return x
+
+def torch_forward(net, states):
+    # see numpy_net.forward_batch
+    if type(states) == list and states and isinstance(states[0], np.ndarray):
+        states = np.stack(states)
+    with torch.no_grad():
+        return net.forward(states).view(-1).tolist()
+
 class ToTensor(object):
     """Convert list in sample to Tensors."""
 
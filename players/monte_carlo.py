@@ -1,12 +1,16 @@
-import random
+import math
+import multiprocessing
 from dataclasses import dataclass
-import copy
+from typing import Dict, List
 
+from compact import pack, unpack
 from engine import Game
 from players.player import Player
 from players.random_player import RandomPlayer
+from players.search import Budget, SearchStats
+from seeds import child_seed
 from user_actions import UserActionDone, UserActionPlayCard, UserActionBuyCard, UserActionAttackOutpost, \
-    UserActionAttackFace, UserActionAttackBase, UserActionCardAction
+    UserActionAttackFace, UserActionAttackBase, UserActionCardAction, UserAction
 
 import logging
 log = logging.getLogger(__name__)
@@ -43,59 +47,183 @@ class Result:
     W: int = 0
     L: int = 0
 
+    @property
+    def n(self):
+        return self.W + self.L
+
+    def ratio(self):
+        return self.W / self.n if self.n else 0.0
+
 class RandomPlayerWithFirstAction(RandomPlayer):
+    # plays first_action at its next decision, then as a RandomPlayer
+    first_action = None
+
     def choose_action(self, b, p_other, actions):
-        if not self.first_action in actions:
-            assert self.first_action in actions
-        self.choose_action = super().choose_action
-        return self.first_action
+        a, self.first_action = self.first_action, None
+        if a is None:
+            return super().choose_action(b, p_other, actions)
+        assert a in actions
+        return a
+
+def play_out(game, start, me, a, seed) -> bool:
+    # one rollout from position start, me playing a first: did me win
+    me.first_action = a
+    game.restore(start)
+    game.random.seed(seed)
+    return game.run() is me
+
+def rollout_players(idx):
+    me, other = RandomPlayerWithFirstAction('me', w=WEIGHT_MAP26), RandomPlayer('other', w=WEIGHT_MAP26)
+    return me, [me, other] if idx == 0 else [other, me]
+
+def _rollout_worker(task):
+    # a share of the rollouts of MCSimplePlayer._parallel_runner
+    data, idx, rollouts = task
+    me, players = rollout_players(idx)
+    game = unpack(data, players, verbose=False)
+    start = game.snapshot()
+    return [play_out(game, start, me, a, seed) for a, seed in rollouts]
+
+def ucb1(results: Dict[UserAction, Result], n: int, C: float) -> List[UserAction]:
+    """
+    the actions for the next n rollouts by UCB1. the earlier of the n are
+    counted as played (not won) when picking the later ones
+    """
+    plays = {a: r.n for a, r in results.items()}
+    total = sum(plays.values())
+    picked = []
+    for _ in range(n):
+        total += 1
+        log_total = math.log(total)
+        a = max(plays, key=lambda a: results[a].W / plays[a] + C * math.sqrt(log_total / plays[a])
+                if plays[a] else math.inf)
+        plays[a] += 1
+        picked.append(a)
+    return picked
 
 class MCSimplePlayer(Player):
-    def __init__(self, name, health=50, draw_pile=None, discard_pile=None, bases=None, hand=None, outposts=None):
+    def __init__(self, name, health=50, draw_pile=None, discard_pile=None, bases=None, hand=None, outposts=None,
+                 num_games=100, time_budget=None, cpu_time=False, allocation='ucb1', C=1.4, workers=1):
+        """
+        :param num_games: games played out per move, at most (None: as many
+            as time_budget allows)
+        :param time_budget: seconds per move (cpu time with cpu_time)
+        :param allocation: how the games are shared between the actions:
+            'ucb1' (more games for the better actions, C weighs exploration),
+            'halving' (successive halving: equal shares, the worse half
+            dropped every round; needs num_games, the better actions first
+            when there are fewer games than actions) or 'uniform' (a random
+            action every game)
+        :param workers: play the games in this many processes; the pool is
+            kept until close()
+        """
         super().__init__(name, health, draw_pile, discard_pile, bases, hand, outposts)
+        if allocation not in ('ucb1', 'halving', 'uniform'):
+            raise ValueError(f'unknown allocation: {allocation}')
+        if allocation == 'halving' and num_games is None:
+            raise ValueError('halving needs num_games')
+        self._num_games = num_games
+        self._time_budget = time_budget
+        self._cpu_time = cpu_time
+        self._allocation = allocation
+        self._C = C
+        self._workers = workers
+        self._pool = None
+        # per decision, see players.search.SearchStats
+        self.search_stats = []
 
     def choose_action(self, b, p_other, actions):
-        results = {repr(a): Result() for a in actions}
-
-        me, other = RandomPlayerWithFirstAction('me', w=WEIGHT_MAP26), RandomPlayer('other', w=WEIGHT_MAP26)
-        new_players = [me, other]
-        if b.players[0] != self:
-            new_players.reverse()
-
-        for _ in range(100):
-            a = random.choice(actions)
-            me.first_action = a
-            game = copy.copy(b)
-
-            # copy player state
-            for o_p, p in zip(b.players, new_players):
-                p.from_player(o_p)
-            game.players = new_players
-            game.verbose = False
-            winner = game.run()
-            if winner.name == 'me':
-                results[repr(a)].W += 1
-            else:
-                results[repr(a)].L += 1
+        results = {a: Result() for a in actions}
+        budget = Budget(self._num_games, self._time_budget, self._cpu_time)
+        # rollout k is played with its own seed, see seeds.py
+        seed = self.random.getrandbits(64)
+        run = self._parallel_runner(b) if self._workers > 1 else self._runner(b)
+        k = 0
+
+        def play(arms):
+            nonlocal k
+            wins = run([(a, child_seed(seed, k + i)) for i, a in enumerate(arms)])
+            k += len(arms)
+            for a, won in zip(arms, wins):
+                if won:
+                    results[a].W += 1
+                else:
+                    results[a].L += 1
+
+        # one game at a time, or a few per worker
+        batch = 4 * self._workers if self._workers > 1 else 1
+        if self._allocation == 'halving':
+            arms = list(results)
+            rounds = max(1, math.ceil(math.log2(len(arms))))
+            for r in range(rounds):
+                # the games left, shared by the rounds left
+                share = max(1, (self._num_games - k) // ((rounds - r) * len(arms)))
+                games = (arms * share)[:self._num_games - k]
+                for i in range(0, len(games), batch):
+                    if budget.done(k):
+                        break
+                    play(games[i:i + batch])
+                arms = sorted(arms, key=lambda a: results[a].ratio(), reverse=True)[:-(-len(arms) // 2)]
+            best = arms[0]
+        elif self._allocation == 'ucb1':
+            while not budget.done(k):
+                play(ucb1(results, batch if budget.rollouts is None else min(batch, budget.rollouts - k), self._C))
+            # the most played; its win ratio is the most reliable
+            best = max(results, key=lambda a: (results[a].n, results[a].ratio()))
+        else:
+            while not budget.done(k):
+                play([self.random.choice(actions)])
+            # no game at all when the time ran out first
+            best = max((a for a in results if results[a].n), key=lambda a: results[a].ratio(), default=actions[0])
+        self.search_stats.append(SearchStats(rollouts=k, seconds=budget.elapsed()))
 
         log.info('results= %s', results)
-        best = max(results.items(), key=lambda item: item[1].W/(item[1].W + item[1].L))
-        for a in actions:
-            if repr(a) == best[0]:
-                return a
+        return best
+
+    def _runner(self, b):
+        # plays rollouts (first action, seed) here, on one copy of b
+        me, players = rollout_players(b.players.index(self))
+        game = b.clone(players)
+        start = game.snapshot()
+        return lambda rollouts: [play_out(game, start, me, a, seed) for a, seed in rollouts]
+
+    def _parallel_runner(self, b):
+        # the same in the worker processes, every one taking a share
+        if self._pool is None:
+            self._pool = multiprocessing.Pool(self._workers)
+        data = pack(b)
+        idx = b.players.index(self)
+
+        def run(rollouts):
+            n = -(-len(rollouts) // self._workers)
+            tasks = [(data, idx, rollouts[i:i + n]) for i in range(0, len(rollouts), n)]
+            return [won for wins in self._pool.map(_rollout_worker, tasks) for won in wins]
+        return run
+
+    def close(self):
+        """stop the worker processes"""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_pool'] = None
+        return state
 
     def choose_card_action(self, b, p_other, actions):
         # right now we cannot make this part of the rollouts so we have to choose randomly
-        return random.choice(actions)
+        return self.random.choice(actions)
 
 
     def do_choose_from_piles(self, action, piles, min_n=0, max_n=1, ship_only=False):
-        n = random.randint(min_n, max_n)
+        n = self.random.randint(min_n, max_n)
         if not n:
             return None, None
-        pile = random.choice(piles)
+        pile = self.random.choice(piles)
         n = min(n, len(pile))
-        cards = random.sample(pile, n)
+        cards = self.random.sample(pile, n)
         return pile, cards
 
 def simple_match():
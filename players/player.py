@@ -1,18 +1,21 @@
 from __future__ import annotations
 
-import copy
 import random
 from abc import ABCMeta, abstractmethod
 from typing import List, Tuple
 
 from actions import Action
+from choices import answer, choose_from_piles
+from events import Event
 from cards import DEFAULT_PLAYER_DRAW, Card, BaseCard, OutpostCard
-from user_actions import UndoMove
 from pile import Pile
 
 FIELDS = 'draw_pile discard_pile health bases outposts need_draw hand in_play trade discard on_top damage remaining_actions'.split()
 
 class Player(metaclass=ABCMeta):
+    # the game's random stream, set by Game
+    random = random
+
     def __init__(self, name, health=50, draw_pile=None, discard_pile=None, bases=None, hand=None, outposts=None, need_draw=True):
         if draw_pile is None and discard_pile is None:
             discard_pile = DEFAULT_PLAYER_DRAW
@@ -34,6 +37,9 @@ class Player(metaclass=ABCMeta):
         self.damage = 0
         self.remaining_actions : List[Tuple[Card, Action]] = []
 
+        # set by Game.on
+        self.events = None
+
     def __hash__(self):
         return hash((self.draw_pile, self.discard_pile, self.health, self.name, self.bases, self.outposts, self.need_draw,
                     self.hand, self.in_play, self.trade, self.discard, self.on_top, self.damage, tuple(sorted(str(r) for r in self.remaining_actions))))
@@ -55,9 +61,21 @@ class Player(metaclass=ABCMeta):
         self.damage = 0
         self.remaining_actions : List[Tuple[Card, Action]] = []
 
+    def snapshot(self):
+        # immutable copy of the player state; snapshots can be shared and
+        # restored any number of times
+        return (self.health, self.need_draw, self.trade, self.discard, self.on_top, self.damage,
+                tuple(self.draw_pile), tuple(self.discard_pile), tuple(self.hand), tuple(self.in_play),
+                tuple(self.bases), tuple(self.outposts), tuple(self.remaining_actions))
+
+    def restore(self, s):
+        (self.health, self.need_draw, self.trade, self.discard, self.on_top, self.damage,
+         self.draw_pile[:], self.discard_pile[:], self.hand[:], self.in_play[:],
+         self.bases[:], self.outposts[:], remaining_actions) = s
+        self.remaining_actions = list(remaining_actions)
+
     def from_player(self, other):
-        for f in FIELDS:
-            setattr(self, f, copy.copy(getattr(other, f)))
+        self.restore(other.snapshot())
         return self
 
     def end_turn(self):
@@ -77,8 +95,11 @@ class Player(metaclass=ABCMeta):
         for _ in range(n):
             if not self.draw_pile:
                 # shuffle discard into draw
-                self.draw_pile[:], self.discard_pile[:] = self.discard_pile, []
-                random.shuffle(self.draw_pile)
+                cards = list(self.discard_pile)
+                self.random.shuffle(cards)
+                self.draw_pile[:], self.discard_pile[:] = cards, []
+                if self.events:
+                    self.events.emit(Event.SHUFFLE, self)
             if not self.draw_pile:
                 return # insufficient cards
             # this will be an issue when we try to play ahead
@@ -94,28 +115,9 @@ class Player(metaclass=ABCMeta):
         pass
 
     def choose_from_piles(self, action: str, *piles: Pile, min_n=0, max_n=1, ship_only=False, remove_from_pile=True) -> Tuple[Pile, List[Card]]:
-        if ship_only:
-            filtered_piles = [Pile(p.name, filter(lambda c: not isinstance(c, (BaseCard, OutpostCard)), p)) for p in piles]
-        else:
-            filtered_piles = piles
-
-        filtered_piles = [p for p in filtered_piles if p and len(p) > max(1, min_n)]
-
-        if not filtered_piles:
-            if min_n > 0:
-                raise UndoMove()
-            return None, None
-
-        pile, cards = self.do_choose_from_piles(action, filtered_piles, min_n, max_n)
-        actual_pile = None
-        if pile and remove_from_pile:
-            actual_pile = [p for p in piles if p.name == pile.name]
-            assert len(actual_pile) == 1
-            actual_pile = actual_pile[0]
-            for c in cards:
-                actual_pile.remove(c)
-
-        return actual_pile, cards
+        # the engine yields these choices (choices.choose_from_piles), this asks right away
+        return answer(choose_from_piles(self, action, *piles, min_n=min_n, max_n=max_n, ship_only=ship_only,
+                                        remove_from_pile=remove_from_pile))
 
     def choose_discard(self, n: int):
         _, cards = self.choose_from_piles('discard', self.hand, min_n=n, max_n=n)
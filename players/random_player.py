@@ -1,9 +1,8 @@
-import random
-
 import numpy as np
 
 from engine import Game
 from players.player import Player
+from seeds import child_seed
 from user_actions import UserActionDone, UserActionPlayCard, UserActionBuyCard, UserActionAttackOutpost, \
     UserActionAttackFace, UserActionAttackBase, UserActionCardAction
 
@@ -96,21 +95,22 @@ class RandomPlayer(Player):
         #print()
         #for a,w in zip(actions, weights):
         #    print(f' {w}: {a}')
-        return random.choices(actions, weights=weights)[0]
+        return self.random.choices(actions, weights=weights)[0]
 
     choose_card_action = choose_action
 
     def do_choose_from_piles(self, action, piles, min_n, max_n):
-        n = random.randint(min_n, max_n)
+        n = self.random.randint(min_n, max_n)
         if not n:
             return None, None
-        pile = random.choice(piles)
+        pile = self.random.choice(piles)
         n = min(n, len(pile))
-        cards = random.sample(pile, n)
+        cards = self.random.sample(pile, n)
         return pile, cards
 
 
-def run_match(x: np.ndarray):
+def run_match(x: np.ndarray, seed=None):
+    # with a seed, game i is played with seeds.child_seed(seed, i)
     w = {k:v for k,v in zip(ACTIONS, x)}
     win = {'p1': 0, 'p2': 0}
     for i in range(100):
@@ -119,7 +119,7 @@ def run_match(x: np.ndarray):
         players = [p1, p2]
         if i % 2:
             players = players[::-1]
-        g = Game(players, seed=None, verbose=False)
+        g = Game(players, seed=child_seed(seed, i), verbose=False)
         try:
             winner = g.run()
             win[winner.name] += 1
@@ -129,6 +129,13 @@ def run_match(x: np.ndarray):
     #log.info('match win ratio: %s', pct)
     return pct
 
+def run_batch_match(x: np.ndarray, n=1000, seed=None):
+    """run_match, n games at once on the batched engine (batch.BatchGame)"""
+    from batch import BatchGame
+    w = {k:v for k,v in zip(ACTIONS, x)}
+    winners = BatchGame(n, weights=(WEIGHT_MAP, w), first=np.arange(n) % 2, seed=seed).run()
+    return np.sum(winners == 0) / np.sum(winners >= 0)
+
 def simple_match():
 
     win = {'p1':0, 'p2':0}
@@ -147,11 +154,11 @@ def simple_match():
 def callback(x, f, context):
     log.info('callback: x=%s, f=%s, context=%s', x,f,context)
 
-def optimize():
+def optimize(match=run_batch_match):
     from scipy.optimize import dual_annealing
     bounds = [(0,100)] * len(ACTIONS)
     x0 = np.array(list(WEIGHT_MAP.values()))
-    res = dual_annealing(run_match, bounds, x0=x0, callback=callback)
+    res = dual_annealing(match, bounds, x0=x0, callback=callback)
     print('*'*10)
     print(res)
 
@@ -0,0 +1,92 @@
+import time
+from typing import Dict, Optional
+
+from choices import Status
+from engine import Game
+from players.random_player import RandomPlayer, WEIGHT_MAP26
+from user_actions import USER_ACTIONS
+
+# fast playouts for leaf evaluation (see RandomRolloutUctPlayer). a position
+# is played out by the weighted random policy of RandomPlayer, without going
+# through the players:
+#  - the weights are looked up once, per interned user action id, and an
+#    action is picked by walking the weights (random.choices builds the
+#    cumulative weights on every call)
+#  - one game and its two players are kept and restored from the position
+#    for every rollout, instead of cloning the game and making new players
+#  - optionally the playout stops after max_turns turns, and the position is
+#    evaluated there
+#
+#   rollout = Rollout(WEIGHT_MAP26, max_turns=10)
+#   value = rollout.play(game, player)
+
+
+def health_margin(p1, p2) -> float:
+    """value of a position for p1, in [-1, 1]"""
+    return (p1.health - p2.health) / max(1, p1.health + p2.health)
+
+
+class Rollout:
+    def __init__(self, weights: Dict = WEIGHT_MAP26, max_turns: Optional[int] = None, evaluate=health_margin):
+        """
+        :param weights: by user action type, as for RandomPlayer
+        :param max_turns: stop the playouts after this many turns (None: play
+            to the end)
+        :param evaluate: evaluate(p1, p2), the value for p1 where a playout
+            stops early
+        """
+        self.weights = [weights.get(type(a), 5) for a in USER_ACTIONS]
+        self.max_turns = max_turns
+        self.evaluate = evaluate
+        self._players = [RandomPlayer('r1'), RandomPlayer('r2')]
+        self._game = Game(self._players, verbose=False)
+        self.rollouts = 0
+        self.seconds = 0.0
+
+    @property
+    def rollouts_per_second(self):
+        return self.rollouts / self.seconds if self.seconds else 0.0
+
+    def play(self, game: Game, player) -> float:
+        """
+        play game out from its position (which is left as it is): 1 if player
+        wins, -1 if not, or the evaluation for player where it stops early
+        """
+        t = time.perf_counter()
+        g = self._game
+        g.restore(game.snapshot())
+        rnd = g.random
+        rnd.seed(game.random.getrandbits(64))
+        weights = self.weights
+        end = None if self.max_turns is None else g.turn + self.max_turns
+
+        status = g.start()
+        while status is not Status.GAME_OVER:
+            if end is not None and g.turn >= end:
+                break
+            choice = g.choice
+            if status is Status.CHOOSE_ACTION:
+                options = choice.options
+                total = 0
+                for a in options:
+                    total += weights[a.id]
+                x = rnd.random() * total
+                for a in options:
+                    x -= weights[a.id]
+                    if x < 0:
+                        break
+                status = g.step(a)
+            elif status is Status.CHOOSE_CARD_ACTION:
+                status = g.step(rnd.choice(choice.options))
+            else:
+                status = g.step(choice.ask(g))
+
+        idx = game.players.index(player)
+        p1, p2 = self._players[idx], self._players[1 - idx]
+        if status is Status.GAME_OVER:
+            value = 1 if g.winner is p1 else -1
+        else:
+            value = self.evaluate(p1, p2)
+        self.rollouts += 1
+        self.seconds += time.perf_counter() - t
+        return value
@@ -0,0 +1,60 @@
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+# search effort per move, shared by the searching players (UCTPlayer,
+# MCSimplePlayer): a number of rollouts, a time budget, or both
+
+
+class Budget:
+    def __init__(self, rollouts: Optional[int], seconds: Optional[float] = None, cpu=False):
+        """
+        :param rollouts: at most this many rollouts (None: no limit, then
+            seconds is needed)
+        :param seconds: stop after this much time
+        :param cpu: seconds of process cpu time instead of wall clock
+        """
+        assert rollouts is not None or seconds is not None, 'unbounded search'
+        self.rollouts = rollouts
+        self.seconds = seconds
+        self.clock = time.process_time if cpu else time.perf_counter
+        self.start = self.clock()
+
+    def elapsed(self) -> float:
+        return self.clock() - self.start
+
+    def done(self, n: int) -> bool:
+        """n rollouts were played"""
+        if self.rollouts is not None and n >= self.rollouts:
+            return True
+        return self.seconds is not None and self.elapsed() >= self.seconds
+
+    def remaining(self, n: int, played: Optional[int] = None) -> float:
+        """
+        how many more rollouts there is room for, after n. played of them
+        were played in this search (the rest came with a reused tree), they
+        give the rate for the time left
+        """
+        played = n if played is None else played
+        left = float('inf') if self.rollouts is None else self.rollouts - n
+        if self.seconds is not None and played:
+            elapsed = self.elapsed()
+            left = min(left, (self.seconds - elapsed) * played / max(elapsed, 1e-9))
+        return left
+
+
+@dataclass
+class SearchStats:
+    # one move's search
+    rollouts: int = 0
+    seconds: float = 0.0
+    # UCTPlayer: the tree of the last move was reused, with this many rollouts
+    reused: bool = False
+    saved: int = 0
+    stopped_early: bool = False
+    # nodes in the search tree after the move
+    nodes: int = 0
+
+    @property
+    def rollouts_per_second(self):
+        return self.rollouts / self.seconds if self.seconds else 0.0
@@ -1,4 +1,3 @@
-import random
 from operator import attrgetter
 
 from engine import Game
@@ -102,7 +101,7 @@ class SimplePolicy:
         for a in _get_action_of_type(UserActionDone, actions):
             return a
 
-        return random.choice(actions)
+        return self.random.choice(actions)
 
     def choose_buy_actions(self, game, p1, p2, buys):
         card_to_action = {a.card: a for a in buys}
@@ -1,217 +1,346 @@
 from __future__ import annotations
 
-import copy
-import math
-import random
-from dataclasses import dataclass
-from typing import Optional, Dict, List, Tuple
+import multiprocessing
+from collections import defaultdict
+from typing import List
 
 from cards import Card
+from choices import Status
+from compact import pack, unpack
 from engine import Game
+from journal import Journal
+from zobrist import Zobrist
 from pile import Pile
+from seeds import child_seed
 from players.player import Player
-from players.random_player import RandomPlayer
+from players.random_player import RandomPlayer, WEIGHT_MAP26
+from players.rollout import Rollout
+from players.search import Budget, SearchStats
+from players.uct_tree import UCTTree, TranspositionTable
 from user_actions import UserActionDone, UserActionPlayCard, UserActionBuyCard, UserActionAttackOutpost, \
     UserActionAttackFace, UserActionAttackBase, UserActionCardAction, UserAction
 
+import logging
+log = logging.getLogger(__name__)
 
-@dataclass
-class UCTNode:
-    #game: Game = None
-    action: Optional[UserAction] = None
-    #self.is_expanded = False
-    parent: Optional[UCTNode] = None
-    children: Dict[UserAction, UCTNode] = None
-    player: TreePlayer = None
-    visits: int = 0
-    total_value: int = 0
-
-    def add_child(self, action, prior=0):
-        self.children[action] = UCTNode(parent=self, action=action) #, prior=prior)
-
-    def Q(self):  # returns float
-        return self.total_value / (1 + self.visits)
-
-    def U(self):  # returns float
-        #return (math.sqrt(self.parent.number_visits)  * self.prior / (1 + self.number_visits))
-        return math.sqrt(math.log(self.parent.visits) / (1 + self.visits))
-
-    def __str__(self):
-        if self.parent:
-            return f'Action: {self.action} Tot:{self.total_value} Visits:{self.visits} Q:{self.Q()} U:{self.U()}'
-        else:
-            return f'root node Tot:{self.total_value} Visits:{self.visits}'
-
-def dump_children(nodelist):
-    for c in nodelist:
-        print(c)
-
-def node_path(n):
-    a = []
-    while n.parent:
-        a.append(n.action)
-        n = n.parent
-    return reversed(a)
-
-def best_child(children, C):
-    return max(children.items(), key=lambda action_child: action_child[1].Q() + C*action_child[1].U())
-
-class DoneExpantion(Exception):
-    def __init__(self, game, leaf):
-        self.game = game
-        self.leaf = leaf
 
 class TreePlayer(RandomPlayer):
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, tree: UCTTree = None, side=0, **kwargs):
         super().__init__(*args, **kwargs)
-        self.transpositions = {}
-
-    def choose_action(self, game: Game, p_other, actions):
+        # shared by both tree players, see UCTPlayer. side is the player
+        # of the nodes this one adds
+        self.tree = tree if tree is not None else UCTTree()
+        self.side = side
+
+    def select(self, game: Game, actions):
+        # the child to walk down to, None when the walk reached a new leaf
+        tree = self.tree
         current = self._path[-1]
 
-        if current.children is None:
-            trans_key = hash(game)
+        if tree.is_leaf(current):
+            trans_key = game.zobrist.key()
             # check transposition table
-            n = self.transpositions.get(trans_key)
-            if n:
-                '''
-                print('found transposition: ')
-                print('cur:\n' + '\n'.join(str(p.action) for p in self._path[1:]))
-                print('old:\n' + '\n'.join(str(a) for a in node_path(n)))
-                '''
+            n = tree.transpositions.get(trans_key)
+            if n is not None:
                 self._path[-1] = n
-                current.parent.children[current.action] = n
+                tree.replace_child(self._path[-2], current, n)
                 current = n
             else:
-                self.transpositions[trans_key] = current
-                #current.children = {a:UCTNode(a, current, None, self) for a in actions}
-                raise DoneExpantion(game, current)
+                tree.transpositions[trans_key] = current
+                return None
 
-        children = current.children
-        masked_children = {}
-        for a in actions:
-            n = children.get(a)
-            if not n:
-                # new option
-                n = UCTNode(a, current, None, player=self)
-                children[a] = n
-            masked_children[a] = n
-
-        a, child = best_child(masked_children, self._C)
-        #print('options are:')
-        #dump_children(masked_children.values())
-        #print(f'chosen: {a}')
-
-        self._path.append(child)
+        a, child = tree.select(current, actions, self._C, self.side)
+        if a is not None:
+            self._path.append(child)
         return a
 
 
-def leaf_expand(node: UCTNode, actions):
-    if node.children is None:
-        node.children = []
-    for a in actions:
-        node.add_child(action=a)
-
-def backup(node: UCTNode, value_estimate: float):
-    current = node
-    # Child nodes are multiplied by -1 because we want max(-opponent eval)
-    turnfactor = 1 #-1
-    while current.parent is not None:
-        current.visits += 1
-        current.total_value += (value_estimate * turnfactor)
-        # we dont switch sides every move
-        if current.parent.player != current.player:
-            turnfactor *= -1
-        current = current.parent
-    current.visits += 1
-    current.total_value += (value_estimate * turnfactor)
+def decided(visits, remaining):
+    # the most visited child stays ahead in the remaining rollouts
+    visits = sorted(visits, reverse=True)
+    return len(visits) < 2 or visits[0] - visits[1] > remaining
+
+VIRTUAL_LOSS = 1
+
+# root parallel search, see UCTPlayer._parallel_choose_action. every worker
+# process holds a copy of the searching player
+
+_searcher = None
+
+def _init_search_worker(player):
+    global _searcher
+    player._workers = 1
+    player._reuse = False
+    _searcher = player
+
+def _search_worker(task):
+    data, idx, seed, num_rollouts = task
+    players = [RandomPlayer('w1'), RandomPlayer('w2')]
+    players[idx] = _searcher
+    game = unpack(data, players, verbose=False, seed=seed)
+    root, _, _ = _searcher.search(game, num_rollouts)
+    tree = _searcher.tree
+    # user actions are interned, they unpickle as the same objects
+    return [(a, int(tree.visits[n]), float(tree.total_value[n])) for a, n in tree.children(root).items()]
 
 class UCTPlayer(Player):
 
-    def __init__(self, name, *args, num_rollouts=800, C=3.4, **kwargs):
+    def __init__(self, name, *args, num_rollouts=800, C=3.4, reuse=True, workers=1, batch_size=1,
+                 tree_size=1 << 18, tt_size=1 << 16, time_budget=None, cpu_time=False, early_stop=False, **kwargs):
+        """
+        :param num_rollouts: rollouts per move, at most (None: as many as
+            time_budget allows)
+        :param time_budget: seconds per move (cpu time with cpu_time)
+        :param early_stop: stop once the most visited action can't be
+            overtaken in the rollouts left
+        :param workers: search in this many processes (root parallel, see
+            _parallel_choose_action); the pool is kept until close()
+        :param batch_size: evaluate this many leaves at once (eval_batch)
+        :param tree_size: nodes the search tree has room for
+        :param tt_size: buckets of the transposition table
+        """
         super().__init__(name, *args, **kwargs)
         self._num_rollouts = num_rollouts
         self._C = C
+        self._batch_size = batch_size
+        self._time_budget = time_budget
+        self._cpu_time = cpu_time
+        self._early_stop = early_stop
+        self._tree_size = tree_size
+        self._tt_size = tt_size
+        self.tree = UCTTree(tree_size, tt_size)
+        self._workers = workers
+        self._pool = None
+        # keep the tree between decisions, see _reroot
+        self._reuse = reuse
+        self._last = None
+        self._turn = None
+        # per decision, see players.search.SearchStats
+        self.search_stats: List[SearchStats] = []
 
     def do_choose_from_piles(self, action, piles, min_n=0, max_n=1, ship_only=False):
-        n = random.randint(min_n, max_n)
+        n = self.random.randint(min_n, max_n)
         if not n:
             return None, None
-        pile = random.choice(piles)
+        pile = self.random.choice(piles)
         n = min(n, len(pile))
-        cards = random.sample(pile, n)
+        cards = self.random.sample(pile, n)
         return pile, cards
 
     def choose_card_action(self, b, p_other, actions):
         # fixme: need to be part of rollout, or combine it with parent action
-        return random.choice(actions)
+        return self.random.choice(actions)
+
+    @property
+    def transpositions(self) -> TranspositionTable:
+        return self.tree.transpositions
+
+    def _reroot(self, o_game, key):
+        """
+        the node of the last search to go on from: the one for this exact
+        position or, when we moved last (same turn), the child we chose
+        """
+        o_g, me, other, chosen = self._last
+        if o_g is not o_game:
+            return None
+        node = self.transpositions.get(key)
+        if node is None and o_game.turn == self._turn:
+            node = chosen
+        if node is None or self.tree.is_leaf(node):
+            return None
+        return self.tree.reroot(node)
 
     def choose_action(self, o_game, p_other, actions):
+        if self._workers > 1:
+            return self._parallel_choose_action(o_game, actions)
+
+        root, me, other = self.search(o_game, self._num_rollouts, actions)
+        # a reused root can have children for actions that are not legal now
+        tree = self.tree
+        children = tree.children(root)
+
+        def score(a):
+            n = children.get(a)
+            # no child: there was no room for it in the tree
+            return (0, 0.0) if n is None else (tree.visits[n], tree.Q(n))
+        a = max(actions, key=score)
+        if self._reuse:
+            self._last = (o_game, me, other, children.get(a))
+            self._turn = o_game.turn
+        return a
 
-        me, other = TreePlayer('tp1'), TreePlayer('tp2')
-        me._C = other._C = self._C
+    def search(self, o_game, num_rollouts, actions=None):
+        """
+        play num_rollouts rollouts (or what the time budget allows) from the
+        position of o_game, where it's this player's move, choosing between
+        actions. returns the root and the two tree players
+        """
+        budget = Budget(num_rollouts, self._time_budget, self._cpu_time)
+        tree = self.tree
+        root = None
+        if self._reuse and self._last:
+            _, me, other, _ = self._last
+        else:
+            me = TreePlayer('tp1', tree=tree, side=0)
+            other = TreePlayer('tp2', tree=tree, side=1)
+            me._C = other._C = self._C
 
         new_players = [me, other]
         if o_game.players[0] != self:
             new_players.reverse()
 
-        root = UCTNode(None, None, {}, visits=1, player=me)
-
-        for _ in range(self._num_rollouts):
-            game = copy.copy(o_game)
+        # walk the tree on one game, rewinding it after every rollout
+        game = o_game.clone(new_players)
+        Zobrist(game)
+        if self._last:
+            root = self._reroot(o_game, game.zobrist.key())
+        if root is None:
+            root = tree.new_root(me.side)
+            saved = 0
+        else:
+            visits = int(tree.visits[root])
+            saved = visits if num_rollouts is None else min(visits, num_rollouts)
+        stats = SearchStats(reused=saved > 0, saved=saved)
+        self.search_stats.append(stats)
+
+        journal = Journal(game)
+        start = journal.mark()
+        # rollout k is played with its own seed, see seeds.py
+        seed = self.random.getrandbits(64)
+        pending = []
+        # at least one rollout, to add children for the current actions
+        k = saved if num_rollouts is None else min(saved, num_rollouts - 1)
+        while True:
+            if tree.full:
+                # make room, between two rollouts: no path is pending
+                self._backup_pending(pending)
+                root = tree.recycle(root)
+            journal.rewind(start)
+            game.random.seed(child_seed(seed, k))
             me._path = other._path = [root]  # must share same list
 
-            # copy player state
-            for o_p, p in zip(game.players, new_players):
-                p.from_player(o_p)
-            game.players = new_players
-            game.verbose = False
-
-            try:
-                winner = game.run()
-            except DoneExpantion as e:
-                leaf = e.leaf
-
-                leaf.children = {}
-                # evaluate leaf
-                if leaf.player == me:
-                    score = self.eval_state(game, me, other)
+            # walk down the tree, the tree players pick the user actions
+            status = game.start()
+            while status is not Status.GAME_OVER:
+                choice = game.choice
+                if status is Status.CHOOSE_ACTION:
+                    a = choice.player.select(game, choice.options)
+                    if a is None:
+                        break
                 else:
-                    score = self.eval_state(game, other, me)
-            else:
-                # won
-                leaf = me._path[-1] # both have same path
-                score = 1
+                    a = choice.ask(game)
+                status = game.step(a)
 
+            path = me._path # both have same path
+            leaf = path[-1]
+            if status is Status.GAME_OVER:
+                # won
+                tree.backup(path, 1)
+            else:
+                tree.expand(leaf)
+                # evaluate leaf, in batches: the path keeps a virtual loss
+                # until its leaf is evaluated, so the next rollouts look elsewhere
+                if tree.player[leaf] == me.side:
+                    pending.append((path, self.encode(game, me, other)))
+                else:
+                    pending.append((path, self.encode(game, other, me)))
+                if self._batch_size > 1:
+                    tree.add_virtual_loss(path, 1, VIRTUAL_LOSS)
+                if len(pending) >= self._batch_size:
+                    self._backup_pending(pending)
+
+            k += 1
+            stats.rollouts += 1
+            if budget.done(k):
+                break
+            if self._early_stop and stats.rollouts % 16 == 0:
+                children = tree.children(root)
+                if decided([tree.visits[children[a]] for a in actions or children if a in children],
+                           budget.remaining(k, stats.rollouts)):
+                    stats.stopped_early = True
+                    break
+        self._backup_pending(pending)
+        stats.seconds = budget.elapsed()
+        stats.nodes = len(tree)
+        log.debug('%s: %s', self.name, stats)
+
+        return root, me, other
+
+    def _backup_pending(self, pending):
+        if not pending:
+            return
+        values = self.eval_batch([state for _, state in pending])
+        for (path, _), value in zip(pending, values):
+            if self._batch_size > 1:
+                self.tree.add_virtual_loss(path, -1, VIRTUAL_LOSS)
             # backprop
-            backup(leaf, score)
-
-            '''
-            print('rollout was:')
-            for n in me._path[1:]:
-                print(f'p{n.player}: {n.action}')
-            print()
-            '''
-
-        a, node = max(root.children.items(), key=lambda item: (item[1].visits, item[1].Q()))
-        return a
+            self.tree.backup(path, value)
+        pending.clear()
+
+    def _parallel_choose_action(self, o_game, actions):
+        # root parallel: every worker searches its own tree from this
+        # position, with its own seed and a share of the rollouts. the root
+        # children's statistics are summed
+        if self._pool is None:
+            # the workers get a copy of this player, once
+            self._pool = multiprocessing.Pool(self._workers, initializer=_init_search_worker, initargs=(self,))
+        budget = Budget(self._num_rollouts, self._time_budget, self._cpu_time)
+        data = pack(o_game)
+        idx = o_game.players.index(self)
+        seed = self.random.getrandbits(64)
+        num_rollouts = self._num_rollouts and -(-self._num_rollouts // self._workers)
+        tasks = [(data, idx, child_seed(seed, k), num_rollouts) for k in range(self._workers)]
+
+        visits = defaultdict(int)
+        total_value = defaultdict(float)
+        for children in self._pool.imap_unordered(_search_worker, tasks):
+            for a, n, v in children:
+                visits[a] += n
+                total_value[a] += v
+        self.search_stats.append(SearchStats(rollouts=sum(visits.values()), seconds=budget.elapsed()))
+        return max(actions, key=lambda a: (visits[a], total_value[a] / (1 + visits[a])))
+
+    def close(self):
+        """stop the worker processes of a parallel player"""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def __getstate__(self):
+        # the worker pool and the kept tree stay in this process
+        state = self.__dict__.copy()
+        state['_pool'] = state['_last'] = state['tree'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.tree = UCTTree(self._tree_size, self._tt_size)
 
     def eval_state(self, game: Game, p1, p2):
         return p1.health / p2.health
 
+    # leaves are evaluated in two steps: encode() when the leaf is reached
+    # (the game moves on), eval_batch() on batch_size encoded leaves. by
+    # default the leaf is just evaluated right away
+
+    def encode(self, game: Game, p1, p2):
+        return self.eval_state(game, p1, p2)
+
+    def eval_batch(self, states):
+        return states
+
 class RandomRolloutUctPlayer(UCTPlayer):
+    def __init__(self, name, *args, rollout_turns=None, **kwargs):
+        """
+        :param rollout_turns: stop the rollouts after this many turns and
+            evaluate the position (players.rollout.Rollout)
+        """
+        super().__init__(name, *args, **kwargs)
+        self.rollout = Rollout(WEIGHT_MAP26, max_turns=rollout_turns)
+
     def eval_state(self, game: Game, p1, p2):
-        from players.random_player import RandomPlayer, WEIGHT_MAP26
-
-        p1 = RandomPlayer('rr1', w=WEIGHT_MAP26)
-        p2 = RandomPlayer('rr2', w=WEIGHT_MAP26)
-        players = [p1, p2]
-        for o_p, p in zip(game.players, players):
-            p.from_player(o_p)
-        g = copy.copy(game)
-        g.players = players
-        winner = g.run()
-        return 1 if winner is p1 else -1
+        return self.rollout.play(game, p1)
 
 if __name__ == '__main__':
 
@@ -0,0 +1,351 @@
+import math
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from user_actions import UserAction, USER_ACTIONS
+
+# the UCT search tree, see UCTPlayer. nodes are indices into preallocated
+# arrays (struct of arrays) instead of an object each, so a tree takes ~45
+# bytes per node.
+#
+# the arrays are numpy arrays for the bulk work (moving the tree in reroot).
+# everything a rollout does (select, adding nodes, backup) is on single
+# nodes, through memoryviews of the same memory: these give plain python
+# numbers, numpy scalars and small numpy calls are several times slower. a
+# position has 2-10 actions, a python loop over them is faster than numpy
+# (and a dict of the children is faster than finding them in the edges, see
+# UCTTree._children: at most CACHED_NODES nodes have one)
+CACHED_NODES = 1 << 14
+
+
+class TranspositionTable:
+    """
+    fixed size table of tree nodes by zobrist key (zobrist.Zobrist.key).
+    every bucket has two entries: one keeps the most visited node, the other
+    always takes the newest. entries keep the whole key, so a lookup only
+    hits the position that was stored, not another one in the same bucket.
+    nodes are indices into visits (UCTTree.visits)
+    """
+    def __init__(self, size=1 << 16, visits=None):
+        # buckets, a power of two
+        self.size = 1 << max(0, size - 1).bit_length()
+        self._mask = self.size - 1
+        self._keys = [None] * (2 * self.size)
+        self._nodes = [None] * (2 * self.size)
+        self._visits = visits
+        # entries in use, so clear() and remap() don't walk the whole table
+        self._used = set()
+        self.hits = self.misses = self.stores = self.evictions = 0
+
+    def get(self, key: int) -> Optional[int]:
+        i = 2 * (key & self._mask)
+        keys = self._keys
+        if keys[i] == key:
+            self.hits += 1
+            return self._nodes[i]
+        if keys[i + 1] == key:
+            self.hits += 1
+            return self._nodes[i + 1]
+        self.misses += 1
+        return None
+
+    def __setitem__(self, key: int, node: int):
+        i = 2 * (key & self._mask)
+        keys, nodes = self._keys, self._nodes
+        self.stores += 1
+        if keys[i] is None or keys[i] == key:
+            keys[i], nodes[i] = key, node
+            self._used.add(i)
+            return
+        if keys[i + 1] is not None and keys[i + 1] != key:
+            # the more visited of the two stays in the first entry
+            if self._visits[nodes[i + 1]] > self._visits[nodes[i]]:
+                keys[i], keys[i + 1] = keys[i + 1], keys[i]
+                nodes[i], nodes[i + 1] = nodes[i + 1], nodes[i]
+            self.evictions += 1
+        keys[i + 1], nodes[i + 1] = key, node
+        self._used.add(i + 1)
+
+    def __len__(self):
+        return len(self._used)
+
+    def clear(self):
+        keys, nodes = self._keys, self._nodes
+        for i in self._used:
+            keys[i] = nodes[i] = None
+        self._used.clear()
+
+    def remap(self, new_index):
+        # nodes were moved: node n is now new_index[n], dropped when that's -1
+        keys, nodes = self._keys, self._nodes
+        dropped = []
+        for i in self._used:
+            n = int(new_index[nodes[i]])
+            if n < 0:
+                keys[i] = nodes[i] = None
+                dropped.append(i)
+            else:
+                nodes[i] = n
+        self._used.difference_update(dropped)
+
+    def stats(self):
+        return dict(size=self.size, used=len(self), hits=self.hits, misses=self.misses,
+                    stores=self.stores, evictions=self.evictions)
+
+
+def _ranges(first, count):
+    # the indices first[i]:first[i]+count[i], for all i, in one array
+    ends = np.cumsum(count)
+    return np.repeat(first - ends + count, count) + np.arange(ends[-1] if len(ends) else 0)
+
+
+class UCTTree:
+    """
+    nodes have visits, total_value (from the point of view of the node's
+    player, 0 or 1) and the node they were first reached from (parent).
+    the children of node n are the edges first[n]:first[n]+count[n], an
+    edge being a user action id (user_actions.USER_ACTIONS) and the child.
+    with transpositions a node can be the child of several nodes.
+
+    count is -1 for a leaf. an expanded node gets its children when a
+    rollout walks down from it (select). when the arrays are full no nodes
+    are added and full is set: recycle() makes room, dropping the least
+    visited subtrees. reroot() keeps only the part below the new root,
+    moving it to the front
+    """
+    def __init__(self, capacity=1 << 18, tt_size=1 << 16):
+        self.capacity = capacity
+        self.visits = np.zeros(capacity, np.int64)
+        self.total_value = np.zeros(capacity, np.float64)
+        self.parent = np.full(capacity, -1, np.int32)
+        self.player = np.zeros(capacity, np.int8)
+        self.first = np.zeros(capacity, np.int32)
+        self.count = np.full(capacity, -1, np.int32)
+        # when a node gets new actions its edges move to the end, so there's
+        # room for more edges than nodes
+        self.edge_action = np.zeros(2 * capacity, np.int32)
+        self.edge_node = np.zeros(2 * capacity, np.int32)
+        self.size = 0
+        self.edges = 0
+        # select() had no room for new children
+        self.full = False
+        self._visits, self._total_value, self._parent, self._player, self._first, self._count, self._edge_action, \
+            self._edge_node = map(memoryview, (self.visits, self.total_value, self.parent, self.player, self.first,
+                                               self.count, self.edge_action, self.edge_node))
+        # nodes by position, shared by both tree players
+        self.transpositions = TranspositionTable(tt_size, self.visits)
+        # the children of the nodes select() was called on, as dicts: the
+        # same as children(), without going through the edges every time.
+        # dropped with the tree (new_root, reroot), or when there are
+        # CACHED_NODES of them
+        self._children = {}
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.visits, self.total_value, self.parent, self.player, self.first, self.count,
+                                      self.edge_action, self.edge_node))
+
+    def new_root(self, player) -> int:
+        """
+        drops the whole tree, for a search from a new root. the transposition
+        table is emptied with it: its entries are nodes of the tree, the
+        visits and values of a position are in the tree, not in the table.
+        a search that goes on with the tree (reroot) keeps the entries of
+        the nodes it keeps
+        """
+        self.size = self.edges = 0
+        self.full = False
+        self.transpositions.clear()
+        self._children.clear()
+        root = self._add_nodes(1, -1, player)
+        self.visits[root] = 1
+        self.count[root] = 0
+        return root
+
+    def _add_nodes(self, n, parent, player) -> int:
+        # the first of n new leaves, -1 when there's no room
+        i, j = self.size, self.size + n
+        if j > self.capacity:
+            return -1
+        visits, total_value, parents, players, count = \
+            self._visits, self._total_value, self._parent, self._player, self._count
+        for k in range(i, j):
+            visits[k] = 0
+            total_value[k] = 0.0
+            parents[k] = parent
+            players[k] = player
+            count[k] = -1
+        self.size = j
+        return i
+
+    def is_leaf(self, node) -> bool:
+        return self._count[node] < 0
+
+    def expand(self, node):
+        # the children are added by select()
+        if self._count[node] < 0:
+            self._count[node] = 0
+
+    def children(self, node) -> Dict[UserAction, int]:
+        f, c = self._first[node], max(self._count[node], 0)
+        return {USER_ACTIONS[a]: n for a, n in zip(self._edge_action[f:f + c].tolist(), self._edge_node[f:f + c].tolist())}
+
+    def Q(self, node) -> float:
+        return self._total_value[node] / (1 + self._visits[node])
+
+    def select(self, node, actions: List[UserAction], C, player):
+        """
+        the action and child with the best UCB value, out of actions. the
+        children for actions seen the first time are added, for player.
+        (None, -1) when there's no room for them
+        """
+        children = self._children.get(node)
+        if children is None:
+            if len(self._children) >= CACHED_NODES:
+                self._children.clear()
+            children = self._children[node] = self.children(node)
+        visits, total_value, sqrt = self._visits, self._total_value, math.sqrt
+        log_visits = math.log(visits[node])
+        best, best_ucb = None, -math.inf
+        try:
+            for a in actions:
+                n = children[a]
+                v = 1 + visits[n]
+                ucb = total_value[n] / v + C * sqrt(log_visits / v)
+                if ucb > best_ucb:
+                    best, best_ucb = a, ucb
+        except KeyError:
+            if not self._add_children(node, actions, player, children):
+                return None, -1
+            return self.select(node, actions, C, player)
+        return best, children[best]
+
+    def _add_children(self, node, actions, player, children) -> bool:
+        # adds the missing children for actions, to the edges and to children
+        # (the node's, see select). False when there's no room
+        new = [a for a in dict.fromkeys(actions) if a not in children]
+        f, c = self._first[node], max(self._count[node], 0)
+        # the edges are moved to the end, unless they're there already
+        start = f if c and f + c == self.edges else self.edges
+        end = start + c + len(new)
+        if end > len(self.edge_node) or self.size + len(new) > self.capacity:
+            self.full = True
+            return False
+        edge_action, edge_node = self._edge_action, self._edge_node
+        if start != f:
+            edge_action[start:start + c] = edge_action[f:f + c]
+            edge_node[start:start + c] = edge_node[f:f + c]
+        child = self._add_nodes(len(new), node, player)
+        for e, a in enumerate(new, start + c):
+            edge_action[e] = a.id
+            edge_node[e] = children[a] = child
+            child += 1
+        self._first[node], self._count[node] = start, c + len(new)
+        self.edges = end
+        return True
+
+    def replace_child(self, node, child, other):
+        # a transposition: the edge from node to child goes to other instead
+        f, c = self._first[node], self._count[node]
+        edge_node = self._edge_node
+        for e in range(f, f + c):
+            if edge_node[e] == child:
+                edge_node[e] = other
+        children = self._children.get(node)
+        if children is not None:
+            for a, n in children.items():
+                if n == child:
+                    children[a] = other
+
+    def backup(self, path: List[int], value: float):
+        # along the path the rollout took: with transpositions, nodes are
+        # shared and parent is just the first node they were reached from
+        # Child nodes are multiplied by -1 because we want max(-opponent eval)
+        visits, total_value, player = self._visits, self._total_value, self._player
+        turnfactor = 1
+        for i in range(len(path) - 1, 0, -1):
+            n = path[i]
+            visits[n] += 1
+            total_value[n] += value * turnfactor
+            # we dont switch sides every move
+            if player[path[i - 1]] != player[n]:
+                turnfactor = -turnfactor
+        visits[path[0]] += 1
+        total_value[path[0]] += value * turnfactor
+
+    def add_virtual_loss(self, path: List[int], n: int, loss=1):
+        # n=1 to add, -1 to take it back. node values are from the point of
+        # view of the node's player, so it's a loss for every node on the path
+        visits, total_value = self._visits, self._total_value
+        for node in path:
+            visits[node] += n
+            total_value[node] -= n * loss
+
+    def reroot(self, root, min_visits=0) -> int:
+        """
+        keep the nodes below root (it becomes a root: no parent) and drop
+        the rest, and the nodes with less than min_visits visits below
+        them. returns the new index of root
+        """
+        size = self.size
+        keep = np.zeros(size, bool)
+        keep[root] = True
+        frontier = np.array([root])
+        while len(frontier):
+            frontier = frontier[self.count[frontier] > 0]
+            children = np.unique(self.edge_node[_ranges(self.first[frontier], self.count[frontier])])
+            if min_visits:
+                children = children[self.visits[children] >= min_visits]
+            frontier = children[~keep[children]]
+            keep[frontier] = True
+
+        old = np.flatnonzero(keep)
+        new_index = np.full(size, -1, np.int32)
+        new_index[old] = np.arange(len(old))
+        n = len(old)
+
+        # edges, in node order, without the ones to dropped nodes
+        count = self.count[old]
+        kids = np.maximum(count, 0)
+        edges = _ranges(self.first[old], kids)
+        kept = keep[self.edge_node[edges]]
+        if not kept.all():
+            kids = np.bincount(np.repeat(np.arange(n), kids)[kept], minlength=n)
+            count = np.where(count < 0, -1, kids)
+            edges = edges[kept]
+        first = np.cumsum(kids) - kids
+        self.edge_action[:len(edges)] = self.edge_action[edges]
+        self.edge_node[:len(edges)] = new_index[self.edge_node[edges]]
+
+        parent = self.parent[old]
+        self.parent[:n] = np.where(parent >= 0, new_index[parent], -1)
+        for a in (self.visits, self.total_value, self.player):
+            a[:n] = a[old]
+        self.first[:n] = first
+        self.count[:n] = count
+        self.size, self.edges = n, len(edges)
+
+        root = int(new_index[root])
+        self.parent[root] = -1
+        self.transpositions.remap(new_index)
+        self._children.clear()
+        return root
+
+    def recycle(self, root) -> int:
+        """
+        makes room in a full tree, for the search from root to go on: drops
+        what isn't below root any more (the leaves transpositions replaced),
+        then the least visited subtrees until at most half of the tree is
+        used. returns the new index of root
+        """
+        root = self.reroot(root)
+        min_visits = 1
+        while self.size > max(1, self.capacity // 2) or self.edges > self.capacity:
+            root = self.reroot(root, min_visits)
+            min_visits *= 2
+        self.full = False
+        return root
@@ -0,0 +1,30 @@
+from typing import List, Optional
+
+# seed fan-out: one base seed gives every game of a tournament, or every
+# rollout of a search, its own seed. child k only depends on (seed, k), so
+# it can be replayed on any worker, in any order:
+#
+#   Game(players, seed=child_seed(seed, k))
+#   game.random.seed(child_seed(base, rollout))
+#
+# a seed of None stays None (not reproducible, as before)
+
+MASK = (1 << 64) - 1
+GAMMA = 0x9e3779b97f4a7c15
+
+
+def _mix(z: int) -> int:
+    # splitmix64 finalizer
+    z = ((z ^ (z >> 30)) * 0xbf58476d1ce4e5b9) & MASK
+    z = ((z ^ (z >> 27)) * 0x94d049bb133111eb) & MASK
+    return z ^ (z >> 31)
+
+
+def child_seed(seed: Optional[int], k: int) -> Optional[int]:
+    if seed is None:
+        return None
+    return _mix((_mix(seed & MASK) + (k + 1) * GAMMA) & MASK)
+
+
+def fan_out(seed: Optional[int], n: int) -> List[Optional[int]]:
+    return [child_seed(seed, k) for k in range(n)]
@@ -5,6 +5,7 @@ from unittest.mock import patch
 from cards import EXPLORER, Junkyard, Card, BattleStation, PatrolMech, BlobCarrier, BlobWheel, OptionalAction, \
     ActionFreeShipCard
 from engine import Game
+from events import Event
 from pile import Pile
 from players.player import Player
 from user_actions import UserActionAttackOutpost, UserActionPlayCard, UserActionCardAction
@@ -98,5 +99,912 @@ class TestActions(unittest.TestCase):
         actions = g.available_actions(p1, p2)
         self.assertIn(action, actions)
 
+def _mid_game(seed, turns=6):
+    from players.random_player import RandomPlayer, WEIGHT_MAP26
+    p1 = RandomPlayer('p1', w=WEIGHT_MAP26)
+    p2 = RandomPlayer('p2', w=WEIGHT_MAP26)
+    g = Game([p1, p2], verbose=False, seed=seed)
+    g.trade_pile[:] = [g.draw_pile.pop() for _ in range(5)]
+    for _ in range(turns):
+        g.do_turn(g.players[g.turn % 2], g.players[(g.turn + 1) % 2])
+        g.turn += 1
+    return g
+
+
+class TestCompact(unittest.TestCase):
+
+    def test_pack_roundtrip(self):
+        from compact import pack, unpack
+        from players.random_player import RandomPlayer
+
+        g = _mid_game(1)
+        data = pack(g)
+        g2 = unpack(data, [RandomPlayer('p1'), RandomPlayer('p2')])
+        self.assertEqual(data, pack(g2))
+        self.assertEqual(hash(g), hash(g2))
+
+        # mid turn, with pending optional actions
+        p1, p2 = g.players[g.turn % 2], g.players[(g.turn + 1) % 2]
+        p1.hand.append(BlobCarrier)
+        p1.bases.append(BlobWheel)
+        g.do_action(p1, p2, UserActionPlayCard(BlobCarrier))
+        self.assertTrue(p1.remaining_actions)
+        g2 = unpack(pack(g), [RandomPlayer('p1'), RandomPlayer('p2')])
+        self.assertSequenceEqual(p1.remaining_actions, g2.players[g.turn % 2].remaining_actions)
+
+    def test_pickled_mid_turn(self):
+        import pickle
+        from compact import pack
+        from zobrist import Zobrist
+
+        g = _mid_game(1)
+        p1, p2 = g.players[g.turn % 2], g.players[(g.turn + 1) % 2]
+        p1.hand.append(BlobCarrier)
+        p1.bases.append(BlobWheel)
+        g.do_action(p1, p2, UserActionPlayCard(BlobCarrier))
+        g2 = pickle.loads(pickle.dumps(g))
+        for (c, a), (c2, a2) in zip(p1.remaining_actions, g2.players[g.turn % 2].remaining_actions):
+            self.assertIs(c, c2)
+            self.assertIs(a, a2)
+        self.assertEqual(pack(g), pack(g2))
+        self.assertEqual(Zobrist(g).key(), Zobrist(g2).key())
+
+    def test_unpacked_game_plays_the_same(self):
+        from compact import pack, unpack
+        from players.random_player import RandomPlayer, WEIGHT_MAP26
+
+        g = _mid_game(2)
+        g2 = unpack(pack(g), [RandomPlayer('p1', w=WEIGHT_MAP26), RandomPlayer('p2', w=WEIGHT_MAP26)], verbose=False)
+
+        g2.random.setstate(g.random.getstate())
+        w = g.run()
+        w2 = g2.run()
+        self.assertEqual(w.name, w2.name)
+        self.assertEqual(g.turn, g2.turn)
+        self.assertEqual(pack(g), pack(g2))
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def test_restore(self):
+        from compact import pack
+
+        g = _mid_game(3)
+        before = pack(g)
+        s = g.snapshot()
+        g.run()
+        self.assertNotEqual(before, pack(g))
+        g.restore(s)
+        self.assertEqual(before, pack(g))
+
+    def test_restore_finished_game(self):
+        from choices import Status
+
+        g = _mid_game(3)
+        s = g.snapshot()
+        g.run()
+        self.assertIsNotNone(g.winner)
+        g.restore(s)
+        self.assertIsNone(g.winner)
+        self.assertTrue(g.legal_actions())
+        self.assertIsNot(Status.GAME_OVER, g.choice.status)
+
+    def test_clone_is_independent(self):
+        from compact import pack
+        from players.random_player import RandomPlayer, WEIGHT_MAP26
+
+        g = _mid_game(4)
+        before = pack(g)
+        g2 = g.clone([RandomPlayer('p1', w=WEIGHT_MAP26), RandomPlayer('p2', w=WEIGHT_MAP26)])
+        self.assertEqual(before, pack(g2))
+        g2.run()
+        self.assertEqual(before, pack(g))
+
+
+class TestJournal(unittest.TestCase):
+
+    def test_rewind(self):
+        from compact import pack
+        from journal import Journal
+
+        g = _mid_game(5)
+        before = pack(g)
+        journal = Journal(g)
+        m = journal.mark()
+        for _ in range(3):
+            g.run()
+            self.assertNotEqual(before, pack(g))
+            journal.rewind(m)
+            self.assertEqual(before, pack(g))
+
+        journal.detach()
+        self.assertIs(Pile, type(g.draw_pile))
+
+    def test_undo_actions(self):
+        from compact import pack
+        from journal import Journal
+
+        g = _mid_game(6)
+        p1, p2 = g.players[g.turn % 2], g.players[(g.turn + 1) % 2]
+        journal = Journal(g, mark_actions=True)
+        positions = []
+        p1.draw(5)
+        while p1.hand:
+            positions.append(pack(g))
+            g.do_action(p1, p2, UserActionPlayCard(p1.hand[0]))
+        while positions:
+            journal.undo()
+            self.assertEqual(positions.pop(), pack(g))
+
+
+class TestZobrist(unittest.TestCase):
+
+    def _key(self, g):
+        from zobrist import Zobrist
+        from players.random_player import RandomPlayer
+
+        g = g.clone([RandomPlayer('k1'), RandomPlayer('k2')])
+        return Zobrist(g).key()
+
+    def test_incremental_key(self):
+        from journal import Journal
+        from zobrist import Zobrist
+
+        g = _mid_game(7)
+        z = Zobrist(g)
+        start = z.key()
+        journal = Journal(g)
+        m = journal.mark()
+        p1, p2 = g.players[g.turn % 2], g.players[(g.turn + 1) % 2]
+        p1.draw(5)
+        while p1.hand:
+            g.do_action(p1, p2, UserActionPlayCard(p1.hand[0]))
+            self.assertEqual(self._key(g), z.key())
+        g.run()
+        self.assertEqual(self._key(g), z.key())
+        journal.rewind(m)
+        self.assertEqual(start, z.key())
+
+    def test_key_is_canonical(self):
+        g = _mid_game(8)
+        k = self._key(g)
+        g.players[0].discard_pile.reverse()
+        g.draw_pile.reverse()
+        self.assertEqual(k, self._key(g))
+        g.players[0].health -= 1
+        self.assertNotEqual(k, self._key(g))
+
+
+class TestMoveGen(unittest.TestCase):
+
+    def test_same_actions_as_rebuild(self):
+        from movegen import all_actions
+        from players.random_player import RandomPlayer, WEIGHT_MAP26
+
+        checked = 0
+        for seed in range(10):
+            g = Game([RandomPlayer('p1', w=WEIGHT_MAP26), RandomPlayer('p2', w=WEIGHT_MAP26)], verbose=False, seed=seed + 1)
+            available_actions = g.available_actions
+
+            def check(p1, p2):
+                nonlocal checked
+                actions = available_actions(p1, p2)
+                self.assertEqual(all_actions(g, p1, p2), actions)
+                checked += 1
+                return actions
+
+            g.available_actions = check
+            g.run()
+        self.assertGreater(checked, 1000)
+
+
+class TestCardOps(unittest.TestCase):
+
+    def test_compiled(self):
+        from cards import Cutter, BattleMech, SCOUT
+
+        self.assertEqual((1, 0, 0), SCOUT.ops.deltas)
+        self.assertFalse(SCOUT.ops.aligned)
+        self.assertEqual((2, 0, 4), Cutter.ops.deltas)
+        self.assertEqual((2, 4, 4), Cutter.ops.ally_deltas)
+        self.assertEqual([(Cutter, Cutter.actions[2])], list(Cutter.ops.remaining))
+        self.assertEqual((), Cutter.ops.ally_remaining)
+        self.assertEqual((BattleMech.actions[1],), BattleMech.ops.actions)
+        self.assertEqual((BattleMech.actions[1], BattleMech.actions[2].action), BattleMech.ops.ally_actions)
+
+    def test_ally_resolved_later(self):
+        from cards import Cutter, FederationShuttle
+
+        p1 = TestPlayer('p1', hand=[Cutter, FederationShuttle])
+        p2 = TestPlayer('p2')
+        g = Game([p1, p2])
+        g.do_action(p1, p2, UserActionPlayCard(Cutter))
+        self.assertEqual((2, 0, 54), (p1.trade, p1.damage, p1.health))
+        g.do_action(p1, p2, UserActionPlayCard(FederationShuttle))
+        # both ally abilities trigger
+        self.assertEqual((4, 4, 58), (p1.trade, p1.damage, p1.health))
+        self.assertEqual([], p1.remaining_actions)
+
+
+class TestUserActions(unittest.TestCase):
+
+    def test_interned(self):
+        import pickle
+        from user_actions import UserActionBuyCard, UserActionDone, USER_ACTION_DONE, USER_ACTIONS
+
+        self.assertIs(UserActionPlayCard(Junkyard), UserActionPlayCard(Junkyard))
+        self.assertIsNot(UserActionPlayCard(Junkyard), UserActionBuyCard(Junkyard))
+        self.assertIs(USER_ACTION_DONE, UserActionDone())
+        action = UserActionCardAction(BlobCarrier, ActionFreeShipCard())
+        self.assertIs(BlobCarrier.actions[1].action.action, action.action)
+        self.assertIs(action, pickle.loads(pickle.dumps(action)))
+        self.assertIs(action, USER_ACTIONS[action.id])
+
+
+class TestEvents(unittest.TestCase):
+
+    def test_recorder(self):
+        from events import Event, Recorder
+        from players.random_player import RandomPlayer, WEIGHT_MAP26
+
+        p1 = RandomPlayer('p1', w=WEIGHT_MAP26)
+        p2 = RandomPlayer('p2', w=WEIGHT_MAP26)
+        g = Game([p1, p2], verbose=False, seed=9)
+        r = Recorder(g)
+        winner = g.run()
+
+        self.assertEqual([(winner, p2 if winner is p1 else p1)], r.of_type(Event.GAME_OVER))
+        self.assertEqual(g.turn + 1, len(r.of_type(Event.TURN_START)))
+        self.assertEqual(g.turn, len(r.of_type(Event.TURN_END)))
+        self.assertTrue(r.of_type(Event.SHUFFLE))
+        damage = sum(n for p, target, n in r.of_type(Event.DAMAGE) if target is not winner)
+        self.assertGreaterEqual(damage, 50)
+        self.assertTrue(r.of_type(Event.CARD_BOUGHT))
+        self.assertTrue(r.of_type(Event.CARD_PLAYED))
+
+    def test_no_listeners_in_clone(self):
+        g = _mid_game(10)
+        g.on(Event.CARD_PLAYED, lambda *args: self.fail('listener called'))
+        from players.random_player import RandomPlayer
+        g2 = g.clone([RandomPlayer('p1'), RandomPlayer('p2')])
+        self.assertIsNone(g2.events)
+        g2.run()
+
+    def test_no_listeners_in_next_game(self):
+        from players.random_player import RandomPlayer, WEIGHT_MAP26
+
+        p1 = RandomPlayer('p1', w=WEIGHT_MAP26)
+        p2 = RandomPlayer('p2', w=WEIGHT_MAP26)
+        g = Game([p1, p2], verbose=False, seed=4)
+        g.on(Event.SHUFFLE, lambda *args: self.fail('listener called'))
+        g2 = Game([p1, p2], verbose=False, seed=5)
+        self.assertIsNone(p1.events)
+        g2.run()
+
+
+class TestStep(unittest.TestCase):
+
+    def test_play_to_the_end(self):
+        import random
+        from choices import Status
+        from players.random_player import RandomPlayer
+
+        g = Game([RandomPlayer('p1'), RandomPlayer('p2')], verbose=False, seed=11)
+        status = g.start()
+        while status is not Status.GAME_OVER:
+            if status is Status.CHOOSE_FROM_PILES:
+                status = g.step(g.choice.ask(g))
+            else:
+                status = g.step(random.choice(g.legal_actions()))
+
+        self.assertIsNone(g.choice)
+        self.assertEqual([], g.legal_actions())
+        loser = g.players[0] if g.winner is g.players[1] else g.players[1]
+        self.assertLessEqual(loser.health, 0)
+
+        # stepping past the end doesn't play on
+        end = g.snapshot()
+        self.assertIs(Status.GAME_OVER, g.step(None))
+        self.assertIs(Status.GAME_OVER, g.step(None))
+        self.assertEqual(end, g.snapshot())
+        self.assertIsNotNone(g.winner)
+
+    def test_pile_choice(self):
+        from cards import BattleMech, SCOUT, VIPER
+        from choices import Status
+
+        p1 = TestPlayer('p1', draw_pile=[], hand=[BattleMech, SCOUT, VIPER])
+        p1.need_draw = False
+        p2 = TestPlayer('p2')
+        g = Game([p1, p2], verbose=False)
+
+        self.assertIs(Status.CHOOSE_ACTION, g.start())
+        self.assertIn(UserActionPlayCard(BattleMech), g.legal_actions())
+        self.assertIs(Status.CHOOSE_FROM_PILES, g.step(UserActionPlayCard(BattleMech)))
+        pile, = g.legal_actions()
+        self.assertEqual('hand', pile.name)
+
+        # the rest of the turn is forced, on to p2
+        self.assertIs(Status.CHOOSE_ACTION, g.step((pile, [SCOUT])))
+        self.assertIs(p2, g.choice.player)
+        self.assertEqual(45, p2.health)
+        self.assertSequenceEqual([BattleMech, VIPER], p1.discard_pile)
+
+
+class TestSeeds(unittest.TestCase):
+
+    def _game(self, seed):
+        from players.random_player import RandomPlayer, WEIGHT_MAP26
+        return Game([RandomPlayer('p1', w=WEIGHT_MAP26), RandomPlayer('p2', w=WEIGHT_MAP26)], verbose=False, seed=seed)
+
+    def test_interleaved_games(self):
+        from choices import Status
+        from compact import pack
+        from seeds import fan_out
+
+        s1, s2 = fan_out(3, 2)
+        self.assertNotEqual(s1, s2)
+        g = self._game(s1)
+        g.run()
+
+        # played step by step, alternating with another game
+        g1, g2 = self._game(s1), self._game(s2)
+        status1, status2 = g1.start(), g2.start()
+        while status1 is not Status.GAME_OVER:
+            status1 = g1.step(g1.choice.ask(g1))
+            if status2 is not Status.GAME_OVER:
+                status2 = g2.step(g2.choice.ask(g2))
+        self.assertEqual(g.winner.name, g1.winner.name)
+        self.assertEqual(pack(g), pack(g1))
+
+    def test_seeded_clone(self):
+        from compact import pack
+        from players.random_player import RandomPlayer
+
+        g = _mid_game(12)
+        results = set()
+        for _ in range(2):
+            g2 = g.clone([RandomPlayer('p1'), RandomPlayer('p2')], seed=5)
+            g2.run()
+            results.add(pack(g2).tobytes())
+        self.assertEqual(1, len(results))
+
+
+class TestUCT(unittest.TestCase):
+
+    def test_tree_reuse(self):
+        from players.random_player import RandomPlayer
+        from players.uct_player import UCTPlayer
+
+        p1 = UCTPlayer('p1', num_rollouts=30)
+        g = Game([p1, RandomPlayer('p2')], verbose=False, seed=13)
+        g.run()
+
+        self.assertTrue(any(s.reused for s in p1.search_stats))
+        for s in p1.search_stats:
+            self.assertEqual(s.reused, s.saved > 0)
+            self.assertLessEqual(s.saved, 30)
+            self.assertEqual(max(1, 30 - s.saved), s.rollouts)
+
+    def test_time_budget(self):
+        from players.monte_carlo import MCSimplePlayer
+        from players.random_player import RandomPlayer
+        from players.uct_player import UCTPlayer
+
+        p1 = UCTPlayer('p1', num_rollouts=None, time_budget=0.02)
+        g = Game([p1, RandomPlayer('p2')], verbose=False, seed=13)
+        g.start()
+        p1.choose_action(g, g.players[1], g.legal_actions())
+        s = p1.search_stats[-1]
+        self.assertGreater(s.rollouts, 0)
+        self.assertGreaterEqual(s.seconds, 0.02)
+        self.assertLess(s.seconds, 0.5)
+        self.assertGreater(s.rollouts_per_second, 0)
+
+        # one action is far ahead: stops before the rollouts run out
+        p1 = UCTPlayer('p1', num_rollouts=300, early_stop=True)
+        g = Game([p1, RandomPlayer('p2')], verbose=False, seed=13)
+        g.run()
+        self.assertTrue(any(s.stopped_early and s.rollouts < 300 for s in p1.search_stats))
+
+        p1 = MCSimplePlayer('p1', num_games=None, time_budget=0.02)
+        g = Game([p1, RandomPlayer('p2')], verbose=False, seed=13)
+        g.start()
+        p1.choose_action(g, g.players[1], g.legal_actions())
+        self.assertGreater(p1.search_stats[-1].rollouts, 0)
+        self.assertGreaterEqual(p1.search_stats[-1].seconds, 0.02)
+
+    def test_transposition_table(self):
+        import numpy as np
+        from players.uct_player import TranspositionTable
+
+        visits = np.arange(20)
+        tt = TranspositionTable(2, visits)
+        for k in range(20):
+            tt[k] = k
+        # two buckets of two entries; keys are verified
+        self.assertEqual(4, len(tt))
+        self.assertEqual(16, tt.evictions)
+        self.assertIsNone(tt.get(2))
+        self.assertIsNone(tt.get(20))
+        # the most visited node stays, the newest is kept too
+        self.assertEqual(16, tt.get(16))
+        self.assertEqual(18, tt.get(18))
+        self.assertEqual(2, tt.hits)
+
+        new_index = np.full(20, -1)
+        new_index[18] = 0
+        tt.remap(new_index)
+        self.assertEqual(1, len(tt))
+        self.assertIsNone(tt.get(16))
+        self.assertEqual(0, tt.get(18))
+
+    def test_tree(self):
+        from players.random_player import RandomPlayer
+        from players.uct_player import UCTPlayer
+        from players.uct_tree import UCTTree
+        from user_actions import PLAY_ACTIONS, USER_ACTION_DONE
+
+        tree = UCTTree(capacity=8)
+        root = tree.new_root(0)
+        a, child = tree.select(root, PLAY_ACTIONS[:3], 3.4, 1)
+        self.assertIs(PLAY_ACTIONS[0], a)
+        self.assertEqual(4, len(tree))
+        tree.backup([root, child], 1)
+        tree.expand(child)
+        tree.transpositions[99] = child
+        # new actions: the edges grow, in any order
+        a, grandchild = tree.select(child, [USER_ACTION_DONE], 3.4, 1)
+        tree.backup([root, child, grandchild], -1)
+        tree.select(root, PLAY_ACTIONS[2::-1] + [USER_ACTION_DONE], 3.4, 1)
+        self.assertEqual(PLAY_ACTIONS[:3] + [USER_ACTION_DONE], list(tree.children(root)))
+        self.assertEqual(6, len(tree))
+        # no room for three more
+        tree.expand(grandchild)
+        self.assertEqual((None, -1), tree.select(grandchild, PLAY_ACTIONS[:3], 3.4, 0))
+        self.assertEqual(2, tree.visits[child])
+
+        # keep the part below child, at the front
+        new_child = tree.reroot(child)
+        self.assertEqual(0, new_child)
+        self.assertEqual(2, len(tree))
+        self.assertEqual(-1, tree.parent[new_child])
+        self.assertEqual(2, tree.visits[new_child])
+        self.assertEqual({USER_ACTION_DONE: 1}, tree.children(new_child))
+        self.assertEqual((USER_ACTION_DONE, 1), tree.select(new_child, [USER_ACTION_DONE], 3.4, 1))
+        self.assertEqual(new_child, tree.transpositions.get(99))
+        # a new tree: no node to point at
+        tree.new_root(0)
+        self.assertIsNone(tree.transpositions.get(99))
+
+        # a full tree: the search makes room and goes on
+        p1 = UCTPlayer('p1', num_rollouts=30, tree_size=64)
+        g = Game([p1, RandomPlayer('p2')], verbose=False, seed=3)
+        g.run()
+        self.assertIsNotNone(g.winner)
+        self.assertEqual(64, max(s.nodes for s in p1.search_stats))
+
+    def test_recycle(self):
+        from players.random_player import RandomPlayer
+        from players.uct_player import UCTPlayer
+        from players.uct_tree import UCTTree
+        from user_actions import PLAY_ACTIONS
+
+        tree = UCTTree(capacity=8)
+        root = tree.new_root(0)
+        _, c0 = tree.select(root, PLAY_ACTIONS[:3], 3.4, 1)
+        tree.backup([root, c0], 1)
+        _, c1 = tree.select(root, PLAY_ACTIONS[:3], 3.4, 1)
+        tree.backup([root, c1], -1)
+        tree.expand(c0)
+        tree.select(c0, PLAY_ACTIONS[:3], 3.4, 0)
+        tree.expand(c1)
+        self.assertEqual((None, -1), tree.select(c1, PLAY_ACTIONS[:3], 3.4, 0))
+        self.assertTrue(tree.full)
+
+        # the unvisited nodes go
+        root = tree.recycle(root)
+        self.assertFalse(tree.full)
+        self.assertEqual(3, len(tree))
+        children = tree.children(root)
+        self.assertEqual(PLAY_ACTIONS[:2], list(children))
+        self.assertEqual([1, 1], [tree.visits[n] for n in children.values()])
+        self.assertEqual({}, tree.children(children[PLAY_ACTIONS[0]]))
+        a, child = tree.select(root, PLAY_ACTIONS[:3], 3.4, 1)
+        self.assertEqual((PLAY_ACTIONS[2], 3), (a, child))
+
+        # not even room for the children of the root: legal moves all the same
+        p1 = UCTPlayer('p1', num_rollouts=50, tree_size=4)
+        g = Game([p1, RandomPlayer('p2')], verbose=False, seed=1)
+        g.run()
+        self.assertIsNotNone(g.winner)
+
+    def test_batched_leaves(self):
+        from players.uct_player import UCTPlayer
+
+        batches = []
+
+        class BatchPlayer(UCTPlayer):
+            def encode(self, game, p1, p2):
+                return p1.health - p2.health
+
+            def eval_batch(self, states):
+                batches.append(len(states))
+                return [s / 50 for s in states]
+
+        g = _mid_game(15)
+        g.start()
+        idx = g.players.index(g.choice.player)
+        p = BatchPlayer('p', num_rollouts=50, reuse=False, batch_size=4)
+        players = [g.players[0].__class__('o1'), g.players[1].__class__('o2')]
+        players[idx] = p
+        g2 = g.clone(players)
+        root, _, _ = p.search(g2, 50)
+
+        self.assertTrue(batches)
+        self.assertLessEqual(max(batches), 4)
+        # no virtual loss left behind
+        tree = p.tree
+        self.assertEqual(tree.visits[root] - 1, sum(tree.visits[n] for n in tree.children(root).values()))
+
+    def test_root_parallel(self):
+        from choices import Status
+        from players.random_player import RandomPlayer
+        from players.uct_player import UCTPlayer
+
+        p1 = UCTPlayer('p1', num_rollouts=40, workers=2)
+        g = Game([p1, RandomPlayer('p2')], verbose=False, seed=14)
+        try:
+            status = g.start()
+            for _ in range(3):
+                while g.choice.player is not p1 or status is not Status.CHOOSE_ACTION:
+                    status = g.step(g.choice.ask(g))
+                pool = p1._pool
+                a = g.choice.ask(g)
+                self.assertIn(a, g.legal_actions())
+                # the same workers for every move
+                self.assertIsNotNone(p1._pool)
+                self.assertTrue(pool is None or pool is p1._pool)
+                status = g.step(a)
+        finally:
+            p1.close()
+
+
+class TestMonteCarlo(unittest.TestCase):
+
+    def test_ucb1(self):
+        from players.monte_carlo import Result, ucb1
+
+        results = {'a': Result(W=50, L=50), 'b': Result(), 'c': Result(W=90, L=10)}
+        # the unplayed one first (counted as lost after that), then the best
+        self.assertEqual(['b', 'b', 'c'], ucb1(results, 3, 0.5))
+        self.assertEqual(0.0, results['b'].ratio())
+
+    def test_allocation(self):
+        from players.monte_carlo import MCSimplePlayer
+
+        g = _mid_game(22)
+        g.start()
+        idx = g.players.index(g.choice.player)
+        actions = g.legal_actions()
+        chosen = {}
+        for allocation, workers in [('uniform', 1), ('ucb1', 1), ('halving', 1), ('ucb1', 2)]:
+            p = MCSimplePlayer('p', num_games=12, allocation=allocation, workers=workers)
+            players = [g.players[0].__class__('o1'), g.players[1].__class__('o2')]
+            players[idx] = p
+            g2 = g.clone(players, seed=5)
+            try:
+                a = p.choose_action(g2, players[1 - idx], actions)
+            finally:
+                p.close()
+            self.assertIn(a, actions)
+            self.assertLessEqual(p.search_stats[-1].rollouts, 12)
+            chosen[allocation, workers] = a
+        # the same games in the worker processes
+        self.assertIs(chosen['ucb1', 1], chosen['ucb1', 2])
+
+        with self.assertRaises(ValueError):
+            MCSimplePlayer('p', num_games=None, time_budget=1, allocation='halving')
+
+    def test_allocation_budget(self):
+        from players.monte_carlo import MCSimplePlayer
+
+        g = _mid_game(22)
+        g.start()
+        idx = g.players.index(g.choice.player)
+        actions = g.legal_actions()
+        arms = len(set(actions))
+        self.assertGreater(arms, 2)
+        # fewer games than actions
+        for allocation, num_games, time_budget in [('halving', arms - 1, None), ('halving', 100, 0),
+                                                   ('uniform', None, 0)]:
+            p = MCSimplePlayer('p', num_games=num_games, time_budget=time_budget, allocation=allocation)
+            players = [g.players[0].__class__('o1'), g.players[1].__class__('o2')]
+            players[idx] = p
+            a = p.choose_action(g.clone(players, seed=5), players[1 - idx], actions)
+            self.assertIn(a, actions)
+            self.assertLessEqual(p.search_stats[-1].rollouts, num_games or 0)
+
+    def test_first_action(self):
+        from players.monte_carlo import RandomPlayerWithFirstAction
+
+        g = _mid_game(23)
+        g.start()
+        actions = g.legal_actions()
+        p = RandomPlayerWithFirstAction('me')
+        for a in actions:
+            # every rollout starts with its own first action
+            p.first_action = a
+            self.assertIs(a, p.choose_action(g, None, actions))
+        self.assertIsNone(p.first_action)
+
+
+class TestRollout(unittest.TestCase):
+
+    def test_play(self):
+        from players.random_player import RandomPlayer
+        from players.rollout import Rollout
+        from players.uct_player import RandomRolloutUctPlayer
+
+        g = _mid_game(21)
+        start = g.snapshot()
+        rollout = Rollout()
+        values = {rollout.play(g, g.players[0]) for _ in range(20)}
+        self.assertEqual({-1, 1}, values)
+        self.assertEqual(start, g.snapshot())
+        self.assertEqual(20, rollout.rollouts)
+        self.assertGreater(rollout.rollouts_per_second, 0)
+
+        short = Rollout(max_turns=1)
+        value = short.play(g, g.players[1])
+        self.assertTrue(-1 < value < 1)
+        h0, h1 = (p.health for p in short._players)
+        self.assertEqual((h1 - h0) / (h0 + h1), value)
+
+        p1 = RandomRolloutUctPlayer('p1', num_rollouts=20, rollout_turns=4)
+        g = Game([p1, RandomPlayer('p2')], verbose=False, seed=3)
+        self.assertIsNotNone(g.run())
+        self.assertGreater(p1.rollout.rollouts, 0)
+
+
+class TestEvalCache(unittest.TestCase):
+
+    def test_lookup(self):
+        from players.NN.cache import EvalCache, eval_cache, invalidate, position_key
+
+        evaluated = []
+        def evaluate(states):
+            evaluated.append(len(states))
+            return [sum(s) for s in states]
+
+        cache = EvalCache(size=3)
+        self.assertEqual([3.0, 7.0], cache.lookup([[1, 2], [3, 4]], evaluate))
+        # only the new one is evaluated
+        self.assertEqual([7.0, 11.0], cache.lookup([[3, 4], [5, 6]], evaluate))
+        self.assertEqual([2, 1], evaluated)
+        self.assertEqual((1, 3), (cache.hits, cache.misses))
+        self.assertEqual(0.25, cache.hit_rate)
+        self.assertGreater(cache.nbytes, 0)
+
+        # [1, 2] is the least recently used
+        cache.lookup([[7, 8]], evaluate)
+        self.assertEqual((3, 1), (len(cache), cache.evictions))
+        self.assertIsNone(cache.get(position_key([1, 2])))
+        self.assertEqual(7.0, cache.get(position_key([3, 4])))
+
+        class Net:
+            pass
+        net = Net()
+        self.assertIs(eval_cache(net), eval_cache(net))
+        self.assertIsNot(eval_cache(net), eval_cache(Net()))
+        eval_cache(net).lookup([[1, 2]], evaluate)
+        invalidate(net)
+        self.assertEqual((0, 1), (len(eval_cache(net)), eval_cache(net).version))
+
+
+class SumNet:
+    # a stand-in net for the NN players' plumbing (torch isn't needed)
+    def evaluate(self, rows):
+        return rows.sum(axis=1).tolist()
+
+
+class TestInferenceServer(unittest.TestCase):
+
+    def test_evaluate(self):
+        import numpy as np
+        from players.NN.encoder import BOARD_WIDTH
+        from players.NN.server import InferenceClient, InferenceServer
+
+        server = InferenceServer(SumNet, clients=2, max_batch=32, rows=16)
+        try:
+            clients = [InferenceClient(server.handle) for _ in range(2)]
+            rows = np.arange(40 * BOARD_WIDTH, dtype=np.float32).reshape(40, BOARD_WIDTH) % 7
+            for c in clients:
+                # more than the rows of a slot: in three requests
+                self.assertEqual(rows.sum(axis=1).tolist(), c.evaluate(rows))
+        finally:
+            stats = server.close()
+        self.assertEqual(80, stats['positions'])
+        self.assertEqual(6, stats['batches'])
+
+
+class TestNumpyNet(unittest.TestCase):
+
+    def test_export(self):
+        import os
+        import tempfile
+        import numpy as np
+        from players.NN.numpy_net import NumpyNet, export, forward_batch
+
+        rnd = np.random.default_rng(0)
+        # torch's modules, as far as export looks at them
+        class Linear:
+            def __init__(self, n_in, n_out):
+                self.weight, self.bias = rnd.normal(size=(n_out, n_in)), rnd.normal(size=n_out)
+        class BatchNorm1d:
+            eps = 1e-5
+            def __init__(self, n):
+                self.weight, self.bias = rnd.normal(size=n), rnd.normal(size=n)
+                self.running_mean, self.running_var = rnd.normal(size=n), rnd.uniform(0.5, 2, size=n)
+        class ReLU:
+            pass
+        class Tanh:
+            pass
+
+        l1, bn, l2 = Linear(6, 4), BatchNorm1d(4), Linear(4, 1)
+        net = export([l1, bn, ReLU(), l2, Tanh()])
+        x = rnd.normal(size=(5, 6))
+        h = (x @ l1.weight.T + l1.bias - bn.running_mean) / np.sqrt(bn.running_var + bn.eps) * bn.weight + bn.bias
+        expected = np.tanh(np.maximum(h, 0) @ l2.weight.T + l2.bias)[:, 0]
+        np.testing.assert_allclose(expected, forward_batch(net, x.astype(np.float32)), rtol=1e-4, atol=1e-5)
+
+        fd, fname = tempfile.mkstemp(suffix='.npz')
+        os.close(fd)
+        try:
+            net.save(fname)
+            self.assertEqual(net.evaluate(x), NumpyNet.load(fname).evaluate(x))
+        finally:
+            os.remove(fname)
+
+        with self.assertRaises(ValueError):
+            export([l1, BatchNorm1d(4), object()])
+
+    def test_model_cache(self):
+        import os
+        import tempfile
+        import numpy as np
+        from players.NN.models import ModelCache
+        from players.NN.numpy_net import NumpyNet
+
+        loaded = []
+        def load(fname):
+            loaded.append(fname)
+            return NumpyNet.load(fname)
+
+        with tempfile.TemporaryDirectory() as d:
+            fname = os.path.join(d, 'model_00001.npz')
+            NumpyNet([(np.ones((1, 3)), np.zeros(1), 'Tanh')]).save(fname)
+            cache = ModelCache(size=1)
+            net = cache.get(fname, load)
+            self.assertIs(net, cache.get(fname, load))
+            self.assertEqual(1, len(loaded))
+            # shared: read only
+            with self.assertRaises(ValueError):
+                net.layers[0][0][0] = 2
+
+            # written again
+            st = os.stat(fname)
+            os.utime(fname, ns=(st.st_atime_ns, st.st_mtime_ns + 1))
+            self.assertIsNot(net, cache.get(fname, load))
+            self.assertEqual((1, 2, 1), (cache.hits, cache.misses, len(cache)))
+
+    def test_players(self):
+        import numpy as np
+        from players.NN.NNSimple import NNSimplePlayer
+        from players.NN.NNUCTPlayer import NNUCTPlayer
+        from players.NN.encoder import BOARD_WIDTH
+        from players.NN.numpy_net import NumpyNet
+
+        rnd = np.random.default_rng(1)
+        net = NumpyNet([(rnd.normal(size=(16, BOARD_WIDTH)) * 0.1, np.zeros(16), 'ReLU'),
+                        (rnd.normal(size=(1, 16)), np.zeros(1), 'Tanh')])
+        p1 = NNSimplePlayer('p1', net, train=True, eps=0)
+        p2 = NNUCTPlayer('p2', net, num_rollouts=10)
+        g = Game([p1, p2], verbose=False, seed=4)
+        self.assertIsNotNone(g.run())
+        self.assertTrue(p1._states)
+
+
+class TestEncoder(unittest.TestCase):
+
+    def test_encode(self):
+        from cards import NUM_CARDS, BaseCard
+        from itertools import chain
+        from players.NN.encoder import BOARD_WIDTH, PLAYER_WIDTH, BASE_POS, HEALTH, TRADE, Encoder, add_card, encode
+
+        g = _mid_game(24, turns=12)
+        p1, p2 = g.players
+        row = encode(p1, p2)
+        self.assertEqual((BOARD_WIDTH,), row.shape)
+        for p, v in ((p1, row[:PLAYER_WIDTH]), (p2, row[PLAYER_WIDTH:])):
+            counts = [0] * NUM_CARDS
+            for c in chain(p.draw_pile, p.discard_pile, p.hand, p.in_play, p.bases, p.outposts):
+                counts[c.id] += 1
+            self.assertEqual(counts, v[:NUM_CARDS].tolist())
+            self.assertEqual(len(p.bases) + len(p.outposts), v[NUM_CARDS + 1:HEALTH].sum())
+            self.assertEqual([p.health, p.damage, p.discard, p.trade], v[HEALTH:].tolist())
+
+        # a card bought, as a delta
+        base = next(c for c in g.trade_pile if isinstance(c, BaseCard))
+        add_card(row, base)
+        row[TRADE] -= base.cost
+        p1.discard_pile.append(base)
+        p1.trade -= base.cost
+        self.assertEqual(encode(p1, p2).tolist(), row.tolist())
+        # and played
+        add_card(row, base, in_play=True)
+        self.assertEqual(1, row[BASE_POS[base.id]])
+
+        rows = Encoder(capacity=1).encode_batch([(p1, p2), (p2, p1)])
+        self.assertTrue(rows.flags.c_contiguous)
+        self.assertEqual(rows[0].tolist(), encode(p1, p2).tolist())
+        self.assertEqual(rows[1].tolist(), encode(p2, p1).tolist())
+
+    def test_encode_buys(self):
+        from players.NN.encoder import Encoder, encode
+
+        g = _mid_game(25, turns=8)
+        p1, p2 = g.players
+        cards = list(g.trade_pile)
+        before = p1.snapshot()
+        rows = Encoder().encode_buys(p1, p2, cards)
+        self.assertEqual(before, p1.snapshot())
+        self.assertEqual(1 + len(cards), len(rows))
+        self.assertEqual(encode(p1, p2).tolist(), rows[0].tolist())
+        for c, row in zip(cards, rows[1:]):
+            p1.discard_pile.append(c)
+            p1.trade -= c.cost
+            self.assertEqual(encode(p1, p2).tolist(), row.tolist())
+            p1.discard_pile.pop()
+            p1.trade += c.cost
+
+
+class TestBatchGame(unittest.TestCase):
+
+    def test_run(self):
+        import numpy as np
+        from batch import BatchGame
+
+        b = BatchGame(200, first=np.arange(200) % 2, seed=1)
+        for _ in range(50):
+            b.step()
+            for a in (b.zones, b.deck, b.trade_row, b.pending, b.pending_ally):
+                self.assertGreaterEqual(a.min(), 0)
+            self.assertTrue((b.trade_row.sum(1) == 5).all())
+        winners = b.run()
+        self.assertTrue(np.isin(winners, (0, 1)).all())
+        self.assertFalse(len(b.game))
+
+    def test_engine_statistics(self):
+        import random
+        import numpy as np
+        from batch import BatchGame
+        from players.random_player import RandomPlayer, WEIGHT_MAP26
+
+        weights = (WEIGHT_MAP26, {})
+        random.seed(2)
+        wins, turns = [], []
+        for i in range(200):
+            players = [RandomPlayer('p0', w=weights[0]), RandomPlayer('p1', w=weights[1])]
+            g = Game(players, verbose=False)
+            wins.append(g.run() is players[0])
+            turns.append(g.turn)
+
+        b = BatchGame(1000, weights=weights, seed=2)
+        winners = b.run()
+        self.assertAlmostEqual(np.mean(turns), b.turns.mean(), delta=1.5)
+        self.assertAlmostEqual(np.mean(wins), np.mean(winners == 0), delta=0.1)
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -15,8 +15,12 @@ from torch.utils.data import DataLoader
 from engine import Game
 from match import Bench, make_player, RoundRobin
 from players.NN.NNSimple import NNSimplePlayer
-from players.NN.NNUCTPlayer import NNUCTPlayer, Net
-from players.NN.utils import GamesDataset, ToTensor
+from players.NN.NNUCTPlayer import NNUCTPlayer
+from players.NN.cache import invalidate
+from players.NN.models import load_model
+from players.NN.numpy_net import export, npz_name
+from players.NN.server import InferenceClient, InferenceServer
+from players.NN.utils import GamesDataset, ToTensor, Net, as_tensor
 import logging
 
 log = logging.getLogger(__file__)
@@ -49,8 +53,7 @@ class LinearNet(nn.Module):
         self.meta = meta if meta is not None else {}
 
     def forward(self, x):
-        if type(x) == list:
-            x = torch.tensor(x).unsqueeze(0)
+        x = as_tensor(x)
 
         for l in self.layers:
             x = l(x)
@@ -63,9 +66,15 @@ def last_model(dname):
 def last_model_id(dname):
     return re.match(r'.*_(\d+).pt', last_model(dname)).groups()[0]
 
-def load_net(*fname):
+def load_net(*fname, shared=False):
+    """
+    :param shared: the process' copy of the model (models.load_model), in
+        eval mode and read only; otherwise a new one, to train
+    """
     if isinstance(fname[-1], int):
         fname = fname[:-1] + [fname_from_id(fname[-1])]
+    if shared:
+        return load_model(os.path.join(*fname), load_net)
 
     data = torch.load(os.path.join(*fname))
     if not isinstance(data, dict) or ('layers_conf' not in data and 'net_conf' not in data):
@@ -94,13 +103,18 @@ def save_model(model, *fname):
     }
     torch.save(data, os.path.join(*fname))
     log.info('model saved: %s', fname)
+    # for the players, without torch
+    was_training = model.training
+    model.eval()
+    export(model).save(npz_name(os.path.join(*fname)))
+    model.train(was_training)
 
 def fname_from_id(id_):
     return 'model_{:05}.pt'.format(int(id_))
 
 def load_from_name(name):
     run, netid = name.split()
-    nn = load_net('run_{}/{}'.format(run, fname_from_id(netid)))
+    nn = load_net('run_{}/{}'.format(run, fname_from_id(netid)), shared=True)
     return nn
 
 '''
@@ -120,11 +134,14 @@ def load_checkpoint(fname):
 WORKER_NN = None
 WORKER_MODEL_ID = None
 WORKER_DNAME = None
-def game_gen_worker(*args):
+def init_worker():
+    # the net is loaded before the games
     global WORKER_NN
+    WORKER_NN = load_net(WORKER_DNAME, fname_from_id(WORKER_MODEL_ID), shared=True)
+
+def game_gen_worker(*args):
     if not WORKER_NN:
-        WORKER_NN = load_net(WORKER_DNAME, fname_from_id(WORKER_MODEL_ID))
-        WORKER_NN.eval()
+        init_worker()
     nn = WORKER_NN
 
     p1 = NNSimplePlayer('p1', nn=nn, train=True)
@@ -144,16 +161,29 @@ def game_gen_worker(*args):
             log.info('file exists')
             extra = str(random.randint(1,1000))
 
+def init_server_worker(handle):
+    # the net is in the inference server
+    global WORKER_NN
+    WORKER_NN = InferenceClient(handle)
+
 def gen_training(dname, model_id, conf):
     global WORKER_MODEL_ID, WORKER_DNAME, WORKER_ROLLOUTS
     WORKER_MODEL_ID = int(model_id)
     WORKER_DNAME = dname
     #WORKER_ROLLOUTS = conf['rollouts
 
-    pool = multiprocessing.Pool(conf['workers'])
+    server = None
+    if 'server' in conf:
+        server = InferenceServer(load_net, (dname, fname_from_id(WORKER_MODEL_ID)), clients=conf['workers'],
+                                 **conf['server'])
+        pool = multiprocessing.Pool(conf['workers'], initializer=init_server_worker, initargs=(server.handle,))
+    else:
+        pool = multiprocessing.Pool(conf['workers'], initializer=init_worker)
     pool.map(game_gen_worker, range(conf['num']))
     pool.close()
     pool.join()
+    if server:
+        server.close()
 
 '''
 CONFIG = {
@@ -164,6 +194,8 @@ CONFIG = {
     'games': {
         'num': 2000,
         'workers': 4,
+        # optional: the workers share one net, in players.NN.server
+        'server': {'max_batch': 256, 'max_wait': 0.001},
     },
     'bench': {
         'num': 2000,
@@ -226,6 +258,8 @@ def train(model, datafiles, conf):
     model.meta['trainig_data'] = datafiles
 
     model.eval()
+    # new weights: cached evaluations are stale
+    invalidate(model)
 
     def get_loss(ds):
         dl = DataLoader(ds, batch_size=100)
@@ -253,7 +287,7 @@ def do_bench(args):
     bench(dname, args.ids, conf)
 
 def bench(dname, ids, conf):
-    p = [make_player(NNSimplePlayer, id_, nn=load_net(dname, fname_from_id(id_))) for id_ in ids]
+    p = [make_player(NNSimplePlayer, id_, nn=load_net(dname, fname_from_id(id_), shared=True)) for id_ in ids]
 
     from players.random_player import RandomPlayer, WEIGHT_MAP26
     #p.append(make_player(SimplePlayer, 'simple'))
@@ -13,8 +13,8 @@ from torch.utils.data import DataLoader
 from engine import Game
 from match import Bench, make_player, RoundRobin
 from players.NN.NNSimple import NNSimplePlayer
-from players.NN.NNUCTPlayer import NNUCTPlayer, Net
-from players.NN.utils import GamesDataset, ToTensor
+from players.NN.NNUCTPlayer import NNUCTPlayer
+from players.NN.utils import GamesDataset, ToTensor, Net
 import logging
 
 log = logging.getLogger(__file__)
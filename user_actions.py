@@ -1,50 +1,80 @@
-from cards import Card, OutpostCard, BaseCard
+from cards import Card, OutpostCard, BaseCard, CARDS, AllyAction, OptionalAction
+
+# user actions are interned (flyweights): UserActionPlayCard(c) and friends
+# return the one shared instance for their card (and card action), built at
+# import. so equality and hashing are by identity and cost nothing in search
+# trees keyed by action. every interned action also has a small stable id,
+# its index in USER_ACTIONS.
+
+USER_ACTIONS = []
+_POOL = {}
 
 
 class UserAction:
-    def __eq__(self, other):
-        if isinstance(other, self.__class__) and self.__dict__ == other.__dict__:
-            return True
-        return False
     def __repr__(self):
         return str(self)
-    def __hash__(self):
-        return hash(str(self))
+
+
+def _intern(cls, key, **attrs):
+    ua = object.__new__(cls)
+    ua.__dict__.update(attrs)
+    ua.id = len(USER_ACTIONS)
+    USER_ACTIONS.append(ua)
+    _POOL[key] = ua
+    return ua
+
 
 class UserActionPlayCard(UserAction):
-    def __init__(self, c: Card):
-        self.card = c
+    def __new__(cls, c: Card):
+        return _POOL[cls, c]
+    def __reduce__(self):
+        return self.__class__, (self.card,)
     def __str__(self):
         return 'play ' + self.card.name
 
 class UserActionBuyCard(UserAction):
-    def __init__(self, c: Card):
-        self.card = c
+    def __new__(cls, c: Card):
+        return _POOL[cls, c]
+    def __reduce__(self):
+        return self.__class__, (self.card,)
     def __str__(self):
         return f'buy {self.card.name}' #: ${self.card.cost} {self.card}'
     def __repr__(self):
         return f'buy {self.card.name}'
 
 class UserActionAttackFace(UserAction):
+    def __new__(cls):
+        return _POOL[cls]
+    def __reduce__(self):
+        return self.__class__, ()
     def __str__(self):
         return 'attack user'
 
 class UserActionAttackBase(UserAction):
-    def __init__(self, base: BaseCard):
-        self.base = base
+    def __new__(cls, base: BaseCard):
+        return _POOL[cls, base]
+    def __reduce__(self):
+        return self.__class__, (self.base,)
     def __str__(self):
         return 'attack base: ' + self.base.name
 
 class UserActionAttackOutpost(UserAction):
-    def __init__(self, outpost: OutpostCard):
-        self.outpost = outpost
+    def __new__(cls, outpost: OutpostCard):
+        return _POOL[cls, outpost]
+    def __reduce__(self):
+        return self.__class__, (self.outpost,)
     def __str__(self):
         return 'attack outpost: ' + self.outpost.name
 
 class UserActionCardAction(UserAction):
-    def __init__(self, c, a):
-        self.card = c
-        self.action = a
+    def __new__(cls, c, a):
+        ua = _POOL.get((cls, c, id(a)))
+        if ua is None:
+            # an equal action built elsewhere - find the card's own one
+            ua = next(ua for ua in CARD_ACTIONS[c.id] if ua.action == a)
+        return ua
+    def __reduce__(self):
+        return self.__class__, (self.card, self.action)
     def __str__(self):
         return f'{self.action} from: {self.card}'
     def __repr__(self):
@@ -57,11 +87,28 @@ class UserActionPlayAllCards(UserAction):
         return 'play all cards'
 
 class UserActionDone(UserAction):
+    def __new__(cls):
+        return _POOL[cls]
+    def __reduce__(self):
+        return self.__class__, ()
     def __str__(self):
         return 'turn done'
 
-USER_ACTION_DONE = UserActionDone()
+
+def _optional_actions(c: Card):
+    # the actions a card can offer as UserActionCardAction
+    for a in c.actions:
+        if isinstance(a, AllyAction):
+            a = a.action
+        if isinstance(a, OptionalAction):
+            yield a.action
 
 
-class UndoMove(Exception):
-    pass
\ No newline at end of file
+PLAY_ACTIONS = [_intern(UserActionPlayCard, (UserActionPlayCard, c), card=c) for c in CARDS]
+BUY_ACTIONS = [_intern(UserActionBuyCard, (UserActionBuyCard, c), card=c) for c in CARDS]
+ATTACK_OUTPOST_ACTIONS = [_intern(UserActionAttackOutpost, (UserActionAttackOutpost, c), outpost=c) for c in CARDS]
+ATTACK_BASE_ACTIONS = [_intern(UserActionAttackBase, (UserActionAttackBase, c), base=c) for c in CARDS]
+CARD_ACTIONS = [[_intern(UserActionCardAction, (UserActionCardAction, c, id(a)), card=c, action=a)
+                 for a in _optional_actions(c)] for c in CARDS]
+USER_ACTION_ATTACK_FACE = _intern(UserActionAttackFace, UserActionAttackFace)
+USER_ACTION_DONE = _intern(UserActionDone, UserActionDone)
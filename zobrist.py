@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import random
+
+from cards import CARDS, NUM_CARDS
+from compact import pack_remaining_action, PLAYER_COUNTERS, PLAYER_PILES
+from pile import Pile, ZobristPile
+
+# incremental zobrist keys for transposition lookups.
+#
+# every pile of an attached game becomes a ZobristPile that keeps the sum of
+# its cards' random values up to date as cards move. summing (rather than
+# xor-ing) makes the key depend only on the multiset of cards in each pile,
+# the same notion of equality as Game.__hash__, so equal positions collide on
+# purpose. player counters and pending card actions are folded in when the
+# key is read - a fixed handful of values, independent of the number of cards.
+
+MASK = ZobristPile.MASK
+
+# fixed seed: keys are the same in every process
+_rng = random.Random(0x5eed)
+
+
+def _table(n):
+    return [_rng.getrandbits(64) for _ in range(n)]
+
+
+GAME_PILES = ['trade_pile', 'draw_pile']
+Z_GAME_PILES = {name: _table(NUM_CARDS) for name in GAME_PILES}
+Z_PLAYER_PILES = [{name: _table(NUM_CARDS) for name in PLAYER_PILES} for _ in range(2)]
+Z_COUNTERS = [_table(len(PLAYER_COUNTERS)) for _ in range(2)]
+Z_TURN = _rng.getrandbits(64)
+# remaining card actions, by (card id, action index, ally)
+Z_REMAINING = [{(c.id, n, ally): _rng.getrandbits(64)
+                for c in CARDS for n, a in enumerate(c.actions) for ally in (0, 1)}
+               for _ in range(2)]
+
+
+def _attach_pile(pile: Pile, z):
+    pile.__class__ = ZobristPile
+    pile._z = z
+    pile.key = sum(z[c.id] for c in pile) & MASK
+
+
+class Zobrist:
+    def __init__(self, game):
+        """
+        attach incremental keys to a game (and its players' piles). must be
+        attached before a journal.Journal, if both are used
+        """
+        self.game = game
+        self._piles = []
+        for name in GAME_PILES:
+            pile = getattr(game, name)
+            _attach_pile(pile, Z_GAME_PILES[name])
+            self._piles.append(pile)
+        for p, z_piles in zip(game.players, Z_PLAYER_PILES):
+            for name in PLAYER_PILES:
+                pile = getattr(p, name)
+                _attach_pile(pile, z_piles[name])
+                self._piles.append(pile)
+        game.zobrist = self
+
+    def detach(self):
+        for pile in self._piles:
+            pile.__class__ = Pile
+            del pile._z, pile.key
+        self.game.zobrist = None
+
+    def key(self) -> int:
+        game = self.game
+        k = sum(pile.key for pile in self._piles) + game.turn * Z_TURN
+        for n, (p, z) in enumerate(zip(game.players, Z_COUNTERS)):
+            k += (p.health * z[0] + p.need_draw * z[1] + p.trade * z[2] +
+                  p.discard * z[3] + p.on_top * z[4] + p.damage * z[5])
+            z_remaining = Z_REMAINING[n]
+            for c, a in p.remaining_actions:
+                k += z_remaining[pack_remaining_action(c, a)]
+        return k & MASK